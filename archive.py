@@ -0,0 +1,221 @@
+import os
+import pickle
+import struct
+import threading
+import zlib
+from contextlib import contextmanager
+
+from journal import PAGE_SIZE, encode_frame, read_frame, select_page
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+PARTITION_SUFFIX = ".seg"
+# A partition ends with a frame holding {user_id: block offset} and the 8-byte offset of that frame.
+TABLE_POINTER = struct.Struct(">Q")
+INDEX_FILE = "index"
+LOCK_FILE = "archive.lock"
+UNDATED_PARTITION = "undated"
+COMPRESS_LEVEL = 9
+
+
+def partition_of(date):
+    """Archive partition ("YYYY-MM") of a "YYYY-MM-DD HH:MM:SS" date."""
+    return date[:7] if date and len(date) >= 7 else UNDATED_PARTITION
+
+
+class HistoryArchive:
+    """
+    Cold tier for history that is no longer changed: old transactions, resolved returns and
+    closed reports.
+
+    Records are kept per stream in one file per month ("<stream>/YYYY-MM.seg"). A partition is a
+    series of frames (see journal.py), one per user, each holding that user's records of the
+    month as a compressed list of (id, record), followed by a table of where each user's frame
+    starts. The index file maps (stream, user) to the partitions holding that user's records, so
+    reading one user's archived history only decompresses their blocks.
+
+    IDs are the journal sequence numbers (report IDs for reports). Adding a record whose ID is
+    already archived replaces it, so a job interrupted after archiving can simply rerun.
+
+    Readers take the lock file shared and the archiving job exclusively, as partitions are
+    rewritten in place when records are added to a month.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._index = {}  # (stream, user_id) -> [partition, ...]
+        self._index_stat = None
+        self._tables = {}  # partition path -> ((inode, mtime), {user_id: offset})
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._load_index()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _path(self, stream, partition):
+        return os.path.join(self.directory, stream, partition + PARTITION_SUFFIX)
+
+    def _load_index(self):
+        """Reload the index if the archiving job (possibly in another process) rewrote it."""
+        path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._index, self._index_stat = {}, None
+            return
+        if (stat.st_ino, stat.st_mtime_ns) != self._index_stat:
+            with open(path, "rb") as f:
+                self._index = pickle.load(f)
+            self._index_stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def _table(self, path, f):
+        """Return {user_id: offset} of an open partition, cached until the file is rewritten."""
+        stat = os.fstat(f.fileno())
+        cached = self._tables.get(path)
+        if cached and cached[0] == (stat.st_ino, stat.st_mtime_ns):
+            return cached[1]
+        f.seek(-TABLE_POINTER.size, os.SEEK_END)
+        f.seek(TABLE_POINTER.unpack(f.read(TABLE_POINTER.size))[0])
+        table = read_frame(f)
+        self._tables[path] = ((stat.st_ino, stat.st_mtime_ns), table)
+        return table
+
+    @staticmethod
+    def _block(f, offset):
+        f.seek(offset)
+        return pickle.loads(zlib.decompress(read_frame(f)))
+
+    def _read_partition(self, stream, partition):
+        """Return {user_id: {id: record}} of one partition."""
+        path = self._path(stream, partition)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "rb") as f:
+            return {user_id: dict(self._block(f, offset)) for user_id, offset in self._table(path, f).items()}
+
+    def _write_partition(self, stream, partition, blocks):
+        """Rewrite one partition with {user_id: {id: record}}."""
+        path = self._path(stream, partition)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = {}
+        with open(path + ".tmp", "wb") as f:
+            for user_id in sorted(blocks, key=repr):
+                table[user_id] = f.tell()
+                block = pickle.dumps(sorted(blocks[user_id].items()), pickle.HIGHEST_PROTOCOL)
+                f.write(encode_frame(zlib.compress(block, COMPRESS_LEVEL)))
+            table_offset = f.tell()
+            f.write(encode_frame(table) + TABLE_POINTER.pack(table_offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+    def _write_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(self._index, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        stat = os.stat(path)
+        self._index_stat = (stat.st_ino, stat.st_mtime_ns)
+
+    def add(self, stream, entries):
+        """
+        Archive records, merging them into their month partitions.
+
+        :param entries: Iterable of (user_id, id, date, record)
+        :return: Number of records archived
+        """
+        by_partition = {}
+        for user_id, record_id, date, record in entries:
+            by_partition.setdefault(partition_of(date), {}).setdefault(user_id, {})[record_id] = record
+        if not by_partition:
+            return 0
+
+        with self._locked(exclusive=True):
+            for partition, additions in sorted(by_partition.items()):
+                blocks = self._read_partition(stream, partition)
+                for user_id, records in additions.items():
+                    blocks.setdefault(user_id, {}).update(records)
+                self._write_partition(stream, partition, blocks)
+                for user_id in additions:
+                    partitions = self._index.setdefault((stream, user_id), [])
+                    if partition not in partitions:
+                        partitions.append(partition)
+                        partitions.sort()
+            # Written last: until then readers only miss new users' partitions, and the records
+            # being archived are still in the hot store.
+            self._write_index()
+        return sum(len(records) for additions in by_partition.values() for records in additions.values())
+
+    def read(self, stream, user_id):
+        """Return a user's archived records as [(id, record), ...] in ID order."""
+        with self._locked():
+            records = {}
+            for partition in self._index.get((stream, user_id), ()):
+                path = self._path(stream, partition)
+                with open(path, "rb") as f:
+                    offset = self._table(path, f).get(user_id)
+                    if offset is not None:
+                        records.update(self._block(f, offset))
+            return sorted(records.items())
+
+    def users(self, stream):
+        """List every user with archived records in a stream."""
+        with self._locked():
+            return [user_id for (index_stream, user_id) in self._index if index_stream == stream]
+
+    def page(self, stream, user_id, before=None, limit=PAGE_SIZE, since=None, until=None):
+        """Return one page of a user's archived records, newest first; see TransactionJournal.page."""
+        records = [(record_id, record) for record_id, record in self.read(stream, user_id)
+                   if before is None or record_id < before]
+        return select_page(((record_id, record.get("date") or record.get("timestamp") or "", (record_id, record))
+                            for record_id, record in reversed(records)), limit, since, until)
+
+    def dump(self):
+        """Yield (relative path, bytes) of the index and every partition, e.g. for a snapshot."""
+        with self._locked():
+            names = [INDEX_FILE] if self._index_stat else []
+            for stream in sorted({stream for stream, _ in self._index}):
+                directory = os.path.join(self.directory, stream)
+                names += [os.path.join(stream, name) for name in sorted(os.listdir(directory))
+                          if name.endswith(PARTITION_SUFFIX)]
+            for name in names:
+                with open(os.path.join(self.directory, name), "rb") as f:
+                    yield name, f.read()
+
+    def load(self, name, data):
+        """Write back one file yielded by dump()."""
+        with self._locked(exclusive=True):
+            path = os.path.join(self.directory, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            self._index_stat = None  # Reread the index on next use
+
+    def stats(self):
+        """Return {stream: {"users", "partitions", "bytes"}}."""
+        with self._locked():
+            stats = {}
+            for stream in sorted({stream for stream, _ in self._index}):
+                directory = os.path.join(self.directory, stream)
+                partitions = [name for name in os.listdir(directory) if name.endswith(PARTITION_SUFFIX)]
+                stats[stream] = {
+                    "users": sum(1 for index_stream, _ in self._index if index_stream == stream),
+                    "partitions": len(partitions),
+                    "bytes": sum(os.path.getsize(os.path.join(directory, name)) for name in partitions),
+                }
+            return stats
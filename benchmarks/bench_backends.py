@@ -0,0 +1,160 @@
+"""
+Compare the shelve and SQLite backends on the current routes.
+
+Builds a synthetic store (default: 2,000 products, 200 customers with purchase history) as a
+shelve file, imports it into SQLite, then replays the same route mix against each backend in a
+fresh process and prints per-route latency.
+
+    python benchmarks/bench_backends.py [--products 2000] [--customers 200] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHECKOUT_FORM = {
+    "name": "Bench Customer", "address": "1 Farm Road", "postal_code": "12345", "card": "4111111111111111",
+    "card_name": "Bench Customer", "cvv": "123", "expiry_date": "12/39",
+}
+
+# (label, role, method, url, form)
+ROUTES = [
+    ("products (customer)", "customer", "get", "/products/", None),
+    ("products by category", "customer", "get", "/products/?category=Fruits", None),
+    ("product search", "customer", "get", "/products/search?query=apple", None),
+    ("products (farmer)", "farmer", "get", "/products/", None),
+    ("farmer product search", "farmer", "get", "/products/search_farmer_products?query=item", None),
+    ("discounted", "customer", "get", "/discounted/", None),
+    ("rewards", "customer", "get", "/rewards/", None),
+    ("profile", "customer", "get", "/profile/profile", None),
+    ("returns", "customer", "get", "/returns/", None),
+    ("add to cart", "customer", "post", "/products/add_to_cart/1", {"quantity": "1"}),
+    ("checkout", "customer", "post", "/checkout/process_checkout", CHECKOUT_FORM),
+    ("update product", "farmer", "post", "/products/update_product/1",
+     {"name": "Carrot", "price": "1.5", "quantity": "100000", "category": "Vegetables"}),
+]
+
+
+def build_dataset(directory, products, customers):
+    """Create the synthetic shelve store and its SQLite copy; returns both paths."""
+    from database import EnhancedDatabaseManager
+    from sqlite_backend import import_shelve
+
+    shelve_path = os.path.join(directory, "bench.db")
+    manager = EnhancedDatabaseManager(shelve_path)
+    manager.initialize_database()
+
+    rng = random.Random(42)
+    categories = ["Vegetables", "Fruits", "Dairy", "Grains", "Herbs"]
+    with manager.open_tables(writeback=True) as db:
+        users = db["users"]
+        for n in range(customers):
+            users[f"bench{n}"] = {"name": f"Bench {n}", "role": "customer", "points": 5000, "balance": 1e6,
+                                  "password": "bench"}
+        catalog = db["products"]
+        for product_id in range(3, products + 1):
+            catalog[product_id] = {
+                "name": f"{rng.choice(['Apple', 'Carrot', 'Kale', 'Plum', 'Rice'])} item {product_id}",
+                "price": round(rng.uniform(0.5, 20), 2), "quantity": 1000,
+                "category": rng.choice(categories), "farmer_id": f"farmer{rng.randint(1, 2)}",
+                "uploaded_by": "bench", "image_url": "placeholder.png", "nutritional_facts": "",
+            }
+    for n in range(customers):
+        manager.add_transactions(f"bench{n}", [
+            {"name": f"Item {i}", "price": 1.0, "quantity": 1} for i in range(rng.randint(5, 40))
+        ])
+
+    sqlite_path = os.path.join(directory, "bench.sqlite3")
+    import_shelve(shelve_path, sqlite_path)
+    check_import(sqlite_path, products)
+    return shelve_path, sqlite_path
+
+
+def check_import(sqlite_path, products):
+    """Insert a product into the imported store: it must get a new ID and leave the imported ones alone."""
+    from database import EnhancedDatabaseManager
+
+    manager = EnhancedDatabaseManager(sqlite_path)
+    carrot = manager.get_product(1)
+    product_id = manager.add_product({"name": "Import check", "price": 1.0, "quantity": 1, "category": "Fruits",
+                                      "farmer_id": "farmer1"})
+    assert product_id > products, f"add_product after the import reused ID {product_id}"
+    assert manager.get_product(1) == carrot, "add_product after the import overwrote product 1"
+    manager.delete_product(product_id)
+
+
+def run_worker(rounds):
+    """Replay the route mix against the backend selected by HARVEST_HAVEN_DB and print timings as JSON."""
+    import main_website
+    from extensions import get_db_manager
+
+    app = main_website.create_app()
+    client = app.test_client()
+    timings = {}
+    for label, role, method, url, form in ROUTES:
+        samples = []
+        for n in range(rounds):
+            with client.session_transaction() as session:
+                session.clear()
+                session["user_id"] = "farmer1" if role == "farmer" else f"bench{n}"
+                session["role"] = role
+            if url.endswith("process_checkout"):
+                with app.app_context():
+                    manager = get_db_manager()
+                    manager.clear_cart(f"bench{n}")
+                    manager.add_to_cart(f"bench{n}", 1, 1)
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data=form)
+            samples.append(time.perf_counter() - start)
+            assert response.status_code in (200, 302), (label, response.status_code)
+        timings[label] = statistics.median(samples) * 1000
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.rounds)
+        return
+
+    from database import STORE_POOL
+
+    directory = tempfile.mkdtemp(prefix="hh_bench_")
+    try:
+        paths = dict(zip(("shelve", "sqlite"), build_dataset(directory, args.products, args.customers)))
+        results = {}
+        for backend, path in paths.items():
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", "--rounds", str(args.rounds)],
+                env=dict(os.environ, HARVEST_HAVEN_DB=path), cwd=directory, capture_output=True, text=True,
+                check=True,
+            ).stdout
+            results[backend] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\n{args.products} products, {args.customers} customers, median of {args.rounds} requests (ms)")
+    print(f"{'route':<24}{'shelve':>10}{'sqlite':>10}{'speedup':>10}")
+    for label, *_ in ROUTES:
+        shelve_ms, sqlite_ms = results["shelve"][label], results["sqlite"][label]
+        print(f"{label:<24}{shelve_ms:>10.2f}{sqlite_ms:>10.2f}{shelve_ms / sqlite_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
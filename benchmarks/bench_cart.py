@@ -0,0 +1,117 @@
+"""
+Measure the session cookie every request carries with the cart in the store, against the cookie
+the same cart took when it was kept in the session, and time add_to_cart on both backends.
+
+Fills carts of `--sizes` distinct products through the add_to_cart route, drops the flashed
+messages, then compares the cookie's size with a session holding the same cart lines, signed
+by the app's own session serializer. Before timing, checks that removing a paid discounted
+line from a cart refunds it and puts its stock back.
+
+    python benchmarks/bench_cart.py [--sizes 1,5,20,50]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import STORE_POOL  # noqa: E402
+from extensions import get_db_manager  # noqa: E402
+from main_website import create_app, initialize_store  # noqa: E402
+
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains"]
+
+
+def check_paid_removal(app):
+    """Buy a discounted item and remove it from the cart: the balance and the item's stock must be restored."""
+    with app.app_context():
+        manager = get_db_manager()
+        item_id = manager.add_discounted({"name": "Refund check", "price": 2.5, "stock": 10, "category": "Fruits",
+                                          "expiry_date": "", "owner_id": "bench_farmer"})
+        manager.adjust_user_balance("customer1", 100)
+        balance = manager.get_users()["customer1"]["balance"]
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = "customer1"
+        session["role"] = "customer"
+    client.post(f"/discounted/buy_discounted/{item_id}", data={"quantity": "3"})
+    with app.app_context():
+        manager = get_db_manager()
+        assert manager.get_all_items()[item_id]["stock"] == 7, "buy_discounted did not take the stock"
+        assert manager.get_users()["customer1"]["balance"] == round(balance - 7.5, 2), "buy_discounted did not charge"
+
+    client.post(f"/checkout/checkout/remove_from_cart/{item_id}?discounted=1")
+    with app.app_context():
+        manager = get_db_manager()
+        assert item_id not in manager.get_cart("customer1").discounted, "the paid line is still in the cart"
+        assert manager.get_all_items()[item_id]["stock"] == 10, "removing a paid line did not restock the item"
+        assert manager.get_users()["customer1"]["balance"] == balance, "removing a paid line did not refund it"
+        assert manager.get_transactions("customer1")[-1]["type"] == "refund", "the refund was not logged"
+        manager.delete_discounted(item_id)
+
+
+def run(path, sizes):
+    """Return {cart size: (session cart bytes, store cart bytes, ms per add_to_cart)}."""
+    app = create_app({"DATABASE": path, "HOLD_SWEEP_INTERVAL": 0, "COMPACT_INTERVAL": 0})
+    initialize_store(app)
+    check_paid_removal(app)
+    with app.app_context():
+        product_ids = get_db_manager().import_products(
+            {"name": f"Bench item {n}", "price": 1.25 + n % 20, "quantity": 1000,
+             "category": CATEGORIES[n % len(CATEGORIES)], "nutritional_facts": "", "farmer_id": "bench_farmer"}
+            for n in range(max(sizes))
+        )
+    serializer = app.session_interface.get_signing_serializer(app)
+
+    results = {}
+    for size in sizes:
+        client = app.test_client()
+        user_id = f"bench{size}"
+        with client.session_transaction() as session:
+            session["user_id"] = user_id
+            session["role"] = "customer"
+
+        start = time.perf_counter()
+        for product_id in product_ids[:size]:
+            response = client.post(f"/products/add_to_cart/{product_id}", data={"quantity": "2"})
+            assert response.status_code == 302, response.status_code
+        add_ms = (time.perf_counter() - start) * 1000 / size
+
+        with client.session_transaction() as session:
+            session.pop("_flashes", None)
+            state = dict(session)
+        cookie = client.get_cookie("session").value
+        with app.app_context():
+            state["cart"] = get_db_manager().get_cart_lines(user_id)
+        results[size] = (len(serializer.dumps(state)), len(cookie), add_ms)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,5,20,50", help="Comma-separated numbers of products in a cart")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    directory = tempfile.mkdtemp(prefix="hh_cart_")
+    try:
+        results = {backend: run(os.path.join(directory, name), sizes)
+                   for backend, name in (("shelve", "bench.db"), ("sqlite", "bench.sqlite3"))}
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print("\nSession cookie sent with every request (bytes), and add_to_cart latency")
+    print(f"{'backend':<10}{'lines':>7}{'session cart':>14}{'store cart':>12}{'saved':>8}{'add ms':>10}")
+    for backend, rows in results.items():
+        for size, (before, after, add_ms) in rows.items():
+            print(f"{backend:<10}{size:>7}{before:>14}{after:>12}{1 - after / before:>8.0%}{add_ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
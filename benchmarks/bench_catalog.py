@@ -0,0 +1,102 @@
+"""
+Compare adding and repricing a farmer's catalog one product at a time with the bulk import and
+bulk update, and time the streamed export, on both backends.
+
+Adds `--single` products through add_product (one store write each), then imports `--products`
+rows from a CSV file through catalog_io.import_catalog (one write per batch) and exports them.
+Reprices `--single` products through update_product, then the whole catalog with one bulk rule.
+
+    python benchmarks/bench_catalog.py [--products 5000] [--single 500]
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from catalog_io import export_catalog, import_catalog, parse_bulk_rule  # noqa: E402
+from database import STORE_POOL, EnhancedDatabaseManager  # noqa: E402
+
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains"]
+NAMES = ["Apple", "Carrot", "Kale", "Plum", "Rice"]
+
+
+def row(n):
+    return {"name": f"{NAMES[n % len(NAMES)]} item {n}", "price": 1.5 + n % 20, "quantity": n % 300,
+            "category": CATEGORIES[n % len(CATEGORIES)], "nutritional_facts": "", "farmer_id": "bench_farmer"}
+
+
+def catalog_csv(count):
+    lines = ["name,price,quantity,category,nutritional_facts"]
+    lines += [f"{p['name']},{p['price']},{p['quantity']},{p['category']}," for p in map(row, range(count))]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def run(path, products, single):
+    """Return (ms per add_product, ms per imported row, export ms, exported bytes, ms per update_product,
+    ms per bulk-updated product)."""
+    manager = EnhancedDatabaseManager(path)
+    manager.initialize_database()
+
+    start = time.perf_counter()
+    for n in range(single):
+        manager.add_product(row(n))
+    single_ms = (time.perf_counter() - start) * 1000 / single
+
+    data = catalog_csv(products)
+    start = time.perf_counter()
+    imported, errors = import_catalog(manager, io.BytesIO(data), "csv", "bench_farmer")
+    import_ms = (time.perf_counter() - start) * 1000 / products
+    assert imported == products and not errors, (imported, errors[:3])
+
+    start = time.perf_counter()
+    size = sum(len(chunk) for chunk in export_catalog(manager.iter_products(farmer_id="bench_farmer"), "csv"))
+    export_ms = (time.perf_counter() - start) * 1000
+
+    product_ids = manager.find_products(farmer_id="bench_farmer")
+    start = time.perf_counter()
+    for product_id in list(product_ids)[:single]:
+        product = manager.get_product(product_id)
+        product["price"] = round(product["price"] * 0.9, 2)
+        manager.update_product(product_id, product)
+    update_ms = (time.perf_counter() - start) * 1000 / single
+
+    start = time.perf_counter()
+    updated = manager.bulk_update_items("products", "bench_farmer", rule=parse_bulk_rule("price *= 0.9"))
+    bulk_ms = (time.perf_counter() - start) * 1000 / len(updated)
+    return single_ms, import_ms, export_ms, size, update_ms, bulk_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000, help="Rows in the imported file")
+    parser.add_argument("--single", type=int, default=500, help="Products added one at a time first")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="hh_catalog_")
+    try:
+        results = {backend: run(os.path.join(directory, name), args.products, args.single)
+                   for backend, name in (("shelve", "bench.db"), ("sqlite", "bench.sqlite3"))}
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\n{args.single} single adds, then {args.products} imported and exported")
+    print(f"{'backend':<10}{'add ms/row':>12}{'import ms/row':>15}{'speedup':>10}{'export ms':>12}{'export KB':>12}")
+    for backend, (single_ms, import_ms, export_ms, size, _, _) in results.items():
+        print(f"{backend:<10}{single_ms:>12.2f}{import_ms:>15.3f}{single_ms / import_ms:>9.1f}x{export_ms:>12.1f}"
+              f"{size / 1024:>12.1f}")
+
+    print(f"\n{args.single} single price updates, then one bulk rule over all {args.single + args.products}")
+    print(f"{'backend':<10}{'update ms/row':>15}{'bulk ms/row':>13}{'speedup':>10}")
+    for backend, (*_, update_ms, bulk_ms) in results.items():
+        print(f"{backend:<10}{update_ms:>15.2f}{bulk_ms:>13.3f}{update_ms / bulk_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare checking out a cart one store write per line with the single-commit checkout_cart,
+and show where checkout_cart spends its time, on both backends.
+
+For each of `--sizes` lines, fills `--rounds` carts and buys them: first line by line (stock
+update, transaction and farmer order written separately for every line, as checkout used to),
+then through checkout_cart, whose per-stage timings are averaged.
+
+    python benchmarks/bench_checkout.py [--sizes 1,5,20] [--rounds 20]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import CHECKOUT_STAGES, STORE_POOL, EnhancedDatabaseManager  # noqa: E402
+
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains"]
+
+
+def buy_line_by_line(manager, user_id):
+    """Check out a cart the way checkout used to: one store write per line and table."""
+    for item in manager.get_cart_lines(user_id):
+        product = manager.get_product(item["id"])
+        product["quantity"] -= item["quantity"]
+        manager.update_product(item["id"], product)
+        manager.add_transaction(user_id, item["name"], item["price"] * item["quantity"], item["quantity"])
+        manager.add_order(product["farmer_id"], user_id, item["name"], item["quantity"], item["price"])
+    manager.clear_cart(user_id)
+
+
+def run(path, sizes, rounds):
+    """Return {cart size: (ms per line-by-line checkout, ms per checkout_cart, {stage: avg ms})}."""
+    manager = EnhancedDatabaseManager(path)
+    manager.initialize_database()
+    product_ids = manager.import_products(
+        {"name": f"Bench item {n}", "price": 1.25 + n % 20, "quantity": 10 ** 6,
+         "category": CATEGORIES[n % len(CATEGORIES)], "nutritional_facts": "", "farmer_id": f"farmer{n % 2 + 1}"}
+        for n in range(max(sizes))
+    )
+
+    def fill(user_id, size):
+        for product_id in product_ids[:size]:
+            manager.add_to_cart(user_id, product_id, 2)
+
+    results = {}
+    for size in sizes:
+        elapsed = {"line by line": 0.0, "checkout_cart": 0.0}
+        stages = dict.fromkeys(CHECKOUT_STAGES, 0.0)
+        for n in range(rounds):
+            user_id = f"bench{size}_{n}"
+            fill(user_id, size)
+            start = time.perf_counter()
+            buy_line_by_line(manager, user_id)
+            elapsed["line by line"] += time.perf_counter() - start
+
+            fill(user_id, size)
+            start = time.perf_counter()
+            _, timings = manager.checkout_cart(user_id, "Bench Customer")
+            elapsed["checkout_cart"] += time.perf_counter() - start
+            for stage, ms in timings.items():
+                stages[stage] += ms
+        results[size] = (elapsed["line by line"] * 1000 / rounds, elapsed["checkout_cart"] * 1000 / rounds,
+                         {stage: ms / rounds for stage, ms in stages.items()})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1,5,20", help="Comma-separated numbers of lines in a cart")
+    parser.add_argument("--rounds", type=int, default=20, help="Carts checked out per size and method")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    directory = tempfile.mkdtemp(prefix="hh_checkout_")
+    try:
+        results = {backend: run(os.path.join(directory, name), sizes, args.rounds)
+                   for backend, name in (("shelve", "bench.db"), ("sqlite", "bench.sqlite3"))}
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\nms per checkout, mean of {args.rounds}")
+    print(f"{'backend':<10}{'lines':>7}{'line by line':>14}{'one commit':>12}{'speedup':>10}"
+          + "".join(f"{stage:>14}" for stage in CHECKOUT_STAGES))
+    for backend, rows in results.items():
+        for size, (before, after, stages) in rows.items():
+            print(f"{backend:<10}{size:>7}{before:>14.2f}{after:>12.2f}{before / after:>9.1f}x"
+                  + "".join(f"{stages[stage]:>14.3f}" for stage in CHECKOUT_STAGES))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compare record codecs on the store's tables: encode/decode time, encoded bytes and bytes on disk.
+
+Reads a copy of the database (migrated to the current layout, the original is not touched),
+optionally grown with synthetic customers with purchase histories, and encodes every stored
+value with each codec.
+
+    python benchmarks/bench_codec.py [--db central_database.db] [--customers 500] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import shelve
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import (  # noqa: E402
+    CODEC, DATABASE_FILE, DUMB_BLOCK_BYTES, KEY_SEPARATOR, PICKLE_PROTOCOL, STORE_POOL, EnhancedDatabaseManager,
+    RecordCodec, add_owned_product,
+)
+
+CODECS = [
+    ("shelve pickle", RecordCodec(protocol=shelve.Shelf({})._protocol, tag=None)),
+    (f"pickle p{PICKLE_PROTOCOL}", RecordCodec(tag=None)),
+    ("pickle+zlib (default)", CODEC),
+    ("pickle+lzma", RecordCodec(tag=b"x")),
+]
+
+
+def grow(manager, customers):
+    """Add customers with realistic purchase histories: up to 40 products, 1-25 units each."""
+    rng = random.Random(7)
+    product_ids = list(manager.get_products()) or [1, 2]
+    with manager.transaction() as tx:
+        for n in range(customers):
+            user_id = f"bench{n}"
+            tx.put("users", user_id, {"name": f"Bench {n}", "role": "customer", "points": rng.randint(0, 5000),
+                                      "balance": round(rng.uniform(0, 500), 2), "password": "bench"})
+            ownership = {}
+            for _ in range(rng.randint(1, 40)):
+                add_owned_product(ownership, rng.choice(product_ids), rng.randint(1, 25))
+            trees = [{"id": f"tree_{n}_{i}", "farmer_id": "farmer1", "device_id": None, "phase": "seedling"}
+                     for i in range(rng.randint(0, 5))]
+            ownership["plants"] = trees
+            tx.put("ownership", user_id, ownership)
+
+
+def stored_values(path):
+    """Return {table: [value, ...]} of every value in the store, grouped by key prefix."""
+    tables = defaultdict(list)
+    with STORE_POOL.reading(path) as shelf:
+        for key in shelf.dict.keys():
+            table = key.decode(shelf.keyencoding).split(KEY_SEPARATOR, 1)[0]
+            tables[table].append(CODEC.decode(shelf.dict[key]))
+    return tables
+
+
+def measure(codec, values, repeat):
+    """Return (encoded bytes, bytes on disk, encode ms, decode ms) for a list of values."""
+    encoded = [codec.encode(value) for value in values]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for value in values:
+            codec.encode(value)
+    encode_ms = (time.perf_counter() - start) * 1000 / repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for data in encoded:
+            codec.decode(data)
+    decode_ms = (time.perf_counter() - start) * 1000 / repeat
+    size = sum(len(data) for data in encoded)
+    disk = sum(-(-len(data) // DUMB_BLOCK_BYTES) * DUMB_BLOCK_BYTES for data in encoded)
+    return size, disk, encode_ms, decode_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", default=DATABASE_FILE, help="Shelve database to read (copied first)")
+    parser.add_argument("--customers", type=int, default=500, help="Synthetic customers to add to the copy")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=6, help="Number of largest tables to show")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="hh_codec_")
+    path = os.path.join(directory, "bench.db")
+    try:
+        for suffix in (".dat", ".dir", ".bak"):
+            if os.path.exists(args.db + suffix):
+                shutil.copy(args.db + suffix, path + suffix)
+        manager = EnhancedDatabaseManager(path)
+        manager.initialize_database()
+        grow(manager, args.customers)
+        tables = stored_values(path)
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    baseline = CODECS[0][1]
+    largest = sorted(tables, key=lambda table: -measure(baseline, tables[table], 1)[0])[:args.top]
+    print(f"{'table':<30}{'codec':<24}{'values':>8}{'bytes':>11}{'on disk':>11}{'encode ms':>11}{'decode ms':>11}")
+    totals = defaultdict(lambda: [0, 0, 0.0, 0.0])
+    for table in sorted(tables, key=lambda table: table not in largest):
+        for name, codec in CODECS:
+            result = measure(codec, tables[table], args.repeat)
+            totals[name] = [total + part for total, part in zip(totals[name], result)]
+            if table in largest:
+                size, disk, encode_ms, decode_ms = result
+                print(f"{table:<30}{name:<24}{len(tables[table]):>8}{size:>11}{disk:>11}{encode_ms:>11.2f}"
+                      f"{decode_ms:>11.2f}")
+        if table in largest:
+            print()
+    values = sum(len(rows) for rows in tables.values())
+    for name, (size, disk, encode_ms, decode_ms) in totals.items():
+        print(f"{'all tables':<30}{name:<24}{values:>8}{size:>11}{disk:>11}{encode_ms:>11.2f}{decode_ms:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
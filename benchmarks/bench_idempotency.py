@@ -0,0 +1,82 @@
+"""
+Measure what idempotency keys cost on the points purchase route, on both backends.
+
+Times `--requests` purchases without a key, with a fresh key each, and repeats of an already
+answered key (replayed without running the route), then the size of the key index every keyed
+request rewrites once a user has IDEMPOTENCY_KEYS_PER_USER keys (responses are stored separately).
+
+    python benchmarks/bench_idempotency.py [--requests 300]
+"""
+import argparse
+import os
+import pickle
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import IDEMPOTENCY, IDEMPOTENCY_KEYS_PER_USER, STORE_POOL  # noqa: E402
+from extensions import get_db_manager  # noqa: E402
+from main_website import create_app, initialize_store  # noqa: E402
+
+URL = "/rewards/add_points/200"
+
+
+def timed(client, requests, headers):
+    samples = []
+    for n in range(requests):
+        start = time.perf_counter()
+        response = client.post(URL, headers=headers(n))
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+    return statistics.median(samples) * 1000
+
+
+def run(path, requests):
+    """Return (ms without a key, ms with a new key, ms per replay, KB of a user's key index at the cap)."""
+    app = create_app({"DATABASE": path, "HOLD_SWEEP_INTERVAL": 0, "COMPACT_INTERVAL": 0})
+    initialize_store(app)
+    with app.app_context():
+        manager = get_db_manager()
+        manager.adjust_user_balance("customer1", 10 ** 6)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = "customer1"
+        session["role"] = "customer"
+
+    plain = timed(client, requests, lambda n: {})
+    fresh = timed(client, requests, lambda n: {"Idempotency-Key": f"bench-{n}"})
+    replay = timed(client, requests, lambda n: {"Idempotency-Key": f"bench-{requests - 1}"})
+    with app.app_context(), manager._records() as store:
+        keys = store.get(IDEMPOTENCY, "customer1")
+        assert len(keys) == min(requests, IDEMPOTENCY_KEYS_PER_USER), len(keys)
+        size = len(pickle.dumps(keys, pickle.HIGHEST_PROTOCOL))
+    return plain, fresh, replay, size / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300, help="Requests timed per case")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="hh_idempotency_")
+    try:
+        results = {backend: run(os.path.join(directory, name), args.requests)
+                   for backend, name in (("shelve", "bench.db"), ("sqlite", "bench.sqlite3"))}
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\nMedian ms per points purchase; keys kept per user: {IDEMPOTENCY_KEYS_PER_USER}")
+    print(f"{'backend':<10}{'no key':>10}{'new key':>10}{'replay':>10}{'index KB':>10}")
+    for backend, (plain, fresh, replay, size) in results.items():
+        print(f"{backend:<10}{plain:>10.2f}{fresh:>10.2f}{replay:>10.2f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
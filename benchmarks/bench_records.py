@@ -0,0 +1,124 @@
+"""
+Compare the slot-based record classes with the legacy dicts: stored size, load time, memory held
+once loaded and the cost of reading a field in a hot loop.
+
+Builds `--count` synthetic records per type and stores each one on its own as the store does: a
+legacy dict pickled as is, a record pickled packed (see records.py) and unpacked when read.
+
+    python benchmarks/bench_records.py [--count 200000] [--repeat 3]
+"""
+import argparse
+import gc
+import os
+import pickle
+import random
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import PICKLE_PROTOCOL  # noqa: E402
+from records import IoTDevice, Order, Product, Tree, User  # noqa: E402
+
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains", "Herbs"]
+
+
+def product(rng, n):
+    return {"name": f"Product {n}", "price": round(rng.uniform(0.5, 20), 2), "quantity": rng.randint(0, 500),
+            "category": rng.choice(CATEGORIES), "image_url": "static/uploads/placeholder.png",
+            "farmer_id": f"farmer{n % 50}", "uploaded_by": f"farmer{n % 50}", "nutritional_facts": ""}
+
+
+def user(rng, n):
+    return {"name": f"Customer {n}", "email": f"customer{n}@example.com", "role": "customer",
+            "points": rng.randint(0, 5000), "balance": round(rng.uniform(0, 500), 2), "password": "secret"}
+
+
+def tree(rng, n):
+    return {"id": f"tree_{n}", "type": rng.choice(["mango", "avocado", "apple"]), "phase": "Seedling",
+            "health": 100, "planted_on": "2025-01-28 10:00:00", "watered": rng.random() < 0.5,
+            "fertilized": rng.random() < 0.5, "time_remaining": rng.randint(0, 30), "farmer_id": f"farmer{n % 50}",
+            "farmer_name": f"Farmer {n % 50}", "customer_id": f"customer{n}", "device_id": f"dev{n}"}
+
+
+def device(rng, n):
+    return {"farmer_id": f"farmer{n % 50}", "status": "Active",
+            "assigned_user": f"customer{n}" if rng.random() < 0.5 else None}
+
+
+def order(rng, n):
+    return {"order_id": n, "farmer_id": f"farmer{n % 50}", "buyer_name": f"Customer {n}",
+            "product_name": f"Product {n % 1000}", "quantity": rng.randint(1, 10),
+            "price": round(rng.uniform(0.5, 20), 2), "status": "Pending", "created_at": "2025-01-28 10:00:00"}
+
+
+# (record class, synthetic dict builder, hot-loop read on a dict, the same read on a record)
+TYPES = [
+    (Product, product, lambda r: r.get("quantity", 0) > 0, lambda r: r.quantity > 0),
+    (User, user, lambda r: r.get("balance", 0) > 100, lambda r: r.balance > 100),
+    (Tree, tree, lambda r: r.get("watered", False) and r.get("fertilized", False),
+     lambda r: r.watered and r.fertilized),
+    (IoTDevice, device, lambda r: r.get("assigned_user") is None, lambda r: r.assigned_user is None),
+    (Order, order, lambda r: r.get("status", "Pending") == "Pending", lambda r: r.status == "Pending"),
+]
+
+
+def best_of(function, repeat):
+    """Return the fastest of `repeat` runs, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def loaded_bytes(pickles, load):
+    """Return the memory held by the loaded values."""
+    gc.collect()
+    tracemalloc.start()
+    values = [load(data) for data in pickles]
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del values
+    return held
+
+
+def measure(values, store, load, read, repeat):
+    """Return (pickled bytes, load ms, loaded bytes, hot-loop ms) for a list of values."""
+    pickles = [pickle.dumps(store(value), PICKLE_PROTOCOL) for value in values]
+    load_ms = best_of(lambda: [load(data) for data in pickles], repeat)
+    loop_ms = best_of(lambda: sum(1 for value in values if read(value)), repeat)
+    return sum(len(data) for data in pickles), load_ms, loaded_bytes(pickles, load), loop_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200000, help="Synthetic records per type")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{args.count} records per type, best of {args.repeat}")
+    print(f"{'type':<11}{'form':<8}{'pickled MB':>12}{'load ms':>13}{'loaded MB':>11}{'hot loop ms':>13}")
+    for record_class, build, read_dict, read_record in TYPES:
+        rng = random.Random(record_class.__name__)
+        dicts = [build(rng, n) for n in range(args.count)]
+        records = [record_class.from_dict(data) for data in dicts]
+        results = [
+            ("dict", measure(dicts, lambda value: value, pickle.loads, read_dict, args.repeat)),
+            ("record", measure(records, record_class.pack, lambda data: record_class.unpack(pickle.loads(data)),
+                               read_record, args.repeat)),
+        ]
+        for form, (size, load_ms, held, loop_ms) in results:
+            print(f"{record_class.__name__:<11}{form:<8}{size / 1e6:>12.2f}{load_ms:>13.1f}{held / 1e6:>11.2f}"
+                  f"{loop_ms:>13.1f}")
+        (dict_size, dict_ms, dict_held, dict_loop_ms), (size, load_ms, held, loop_ms) = (
+            result for _, result in results)
+        print(f"{'':<11}{'saved':<8}{1 - size / dict_size:>12.0%}{1 - load_ms / dict_ms:>13.0%}"
+              f"{1 - held / dict_held:>11.0%}{1 - loop_ms / dict_loop_ms:>13.0%}")
+
+
+if __name__ == "__main__":
+    main()
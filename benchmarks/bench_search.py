@@ -0,0 +1,85 @@
+"""
+Measure catalog search latency as the catalog grows: trigram index vs. the old full scan.
+
+    python benchmarks/bench_search.py [--sizes 1000 10000 100000] [--backend shelve|sqlite]
+"""
+import argparse
+import os
+import pickle
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import STORE_POOL, EnhancedDatabaseManager, record_key  # noqa: E402
+
+WORDS = ["apple", "carrot", "kale", "plum", "rice", "tomato", "basil", "onion", "pepper", "melon",
+         "organic", "fresh", "red", "green", "sweet", "baby", "wild", "golden", "heirloom", "local"]
+CATEGORIES = ["Vegetables", "Fruits", "Dairy", "Grains", "Herbs"]
+QUERIES = ["carrot", "arr", "tomatto", "heirloom plum", "ba"]
+
+
+def build_catalog(path, size):
+    """Write `size` synthetic products, then build their indexes in one pass."""
+    rng = random.Random(size)
+    manager = EnhancedDatabaseManager(path)
+    with manager._records(write=True) as store:
+        for product_id in range(1, size + 1):
+            # Raw writes: indexing every record one by one is what rebuild_indexes() avoids
+            record = {
+                "name": " ".join(rng.sample(WORDS, 3)) + f" {product_id}", "price": 1.0, "quantity": 10,
+                "category": rng.choice(CATEGORIES), "farmer_id": "farmer1", "image_url": "",
+                "nutritional_facts": rng.choice(["", "vitamin c", "iron", "fibre"]),
+            }
+            if hasattr(store, "shelf"):
+                store.shelf[record_key("products", product_id)] = record
+            else:
+                store.conn.execute(
+                    "INSERT INTO products (id, data) VALUES (?, ?)", (product_id, pickle.dumps(record)))
+        store.rebuild_indexes()
+    return manager
+
+
+def scan(manager, query):
+    """The previous implementation: substring test against every product name."""
+    return [product_id for product_id, product in manager.get_products().items() if query in product["name"].lower()]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--backend", choices=["shelve", "sqlite"], default="shelve")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'products':>9}  {'query':<14}{'index ms':>10}{'scan ms':>10}{'results':>9}")
+    for size in args.sizes:
+        directory = tempfile.mkdtemp(prefix="hh_search_")
+        path = os.path.join(directory, "bench.sqlite3" if args.backend == "sqlite" else "bench.db")
+        try:
+            manager = build_catalog(path, size)
+            for query in QUERIES:
+                indexed = timed(lambda: manager.search_products(query), args.repeat)
+                scanned = timed(lambda: scan(manager, query), args.repeat)
+                print(f"{size:>9}  {query:<14}{indexed:>10.2f}{scanned:>10.2f}{len(manager.search_products(query)):>9}")
+        finally:
+            STORE_POOL.close()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Measure snapshot throughput and the latency it adds to concurrent writes.
+
+Builds a synthetic shelve store, times a stream of product updates on its own, then times the
+same updates while `manage_db.py snapshot` runs in another process.
+
+    python benchmarks/bench_snapshot.py [--products 5000] [--batch 256]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import STORE_POOL, EnhancedDatabaseManager  # noqa: E402
+from snapshot import SNAPSHOT_BATCH  # noqa: E402
+
+
+def build_store(path, products):
+    manager = EnhancedDatabaseManager(path)
+    manager.initialize_database()
+    with manager.transaction() as tx:
+        first = tx.allocate_ids("products", products)[0]
+        for product_id in range(first, first + products):
+            tx.put("products", product_id, {
+                "name": f"Product {product_id}", "price": 1.0, "quantity": 100, "category": "Vegetables",
+                "farmer_id": "farmer1", "image_url": "", "nutritional_facts": "fibre " * 20,
+            })
+    return manager, list(range(first, first + products))
+
+
+def update(manager, product_id, n):
+    product = manager.get_product(product_id)
+    product["quantity"] = n
+    start = time.perf_counter()
+    manager.update_product(product_id, product)
+    return time.perf_counter() - start
+
+
+def summary(samples):
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"{len(samples):>6} writes  median {statistics.median(samples) * 1000:7.2f} ms  p99 {p99 * 1000:7.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=SNAPSHOT_BATCH)
+    parser.add_argument("--writes", type=int, default=200, help="Writes timed without a snapshot")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="hh_snapshot_")
+    path = os.path.join(directory, "bench.db")
+    try:
+        manager, product_ids = build_store(path, args.products)
+        baseline = [update(manager, product_ids[n % len(product_ids)], n) for n in range(args.writes)]
+
+        snapshotter = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "manage_db.py"), "--db", path, "snapshot",
+             os.path.join(directory, "bench.snapshot"), "--batch", str(args.batch)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        during = []
+        n = 0
+        while snapshotter.poll() is None:
+            during.append(update(manager, product_ids[n % len(product_ids)], n))
+            n += 1
+        report = snapshotter.communicate()[0]
+    finally:
+        STORE_POOL.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{args.products} products, snapshot batch {args.batch}")
+    print(report.strip())
+    print(f"writes alone:           {summary(baseline)}")
+    if during:
+        print(f"writes during snapshot: {summary(during)}")
+
+
+if __name__ == "__main__":
+    main()
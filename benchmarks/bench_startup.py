@@ -0,0 +1,90 @@
+"""
+Measure worker cold-start: importing the app, create_app(), the first request and, for comparison,
+the store initialization every worker used to run at import.
+
+Builds a store with `manage_db.py init`, then times each step in `--runs` fresh processes and
+prints the median of each.
+
+    python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+STEPS = ["import", "create_app", "first request", "initialize_store"]
+
+
+def run_worker(initialize):
+    """Start the app the way a worker does and print the time of each step as JSON."""
+    timings = {}
+    start = time.perf_counter()
+    import main_website
+    timings["import"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    app = main_website.create_app()
+    timings["create_app"] = time.perf_counter() - start
+
+    if initialize:
+        start = time.perf_counter()
+        main_website.initialize_store(app)
+        timings["initialize_store"] = time.perf_counter() - start
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = "customer1"
+        session["role"] = "customer"
+    start = time.perf_counter()
+    response = client.get("/products/")
+    timings["first request"] = time.perf_counter() - start
+    assert response.status_code == 200, response.status_code
+    print(json.dumps({step: seconds * 1000 for step, seconds in timings.items()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--initialize", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.initialize)
+        return
+
+    directory = tempfile.mkdtemp(prefix="hh_startup_")
+    env = dict(os.environ, HARVEST_HAVEN_DB=os.path.join(directory, "startup.db"))
+    try:
+        subprocess.run([sys.executable, os.path.join(ROOT, "manage_db.py"), "init"], env=env, cwd=directory,
+                       capture_output=True, check=True)
+        results = {}
+        for mode, flags in (("lazy", []), ("with init", ["--initialize"])):
+            samples = []
+            for _ in range(args.runs):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", *flags], env=env, cwd=directory,
+                    capture_output=True, text=True, check=True,
+                ).stdout
+                samples.append(json.loads(output.strip().splitlines()[-1]))
+            results[mode] = {step: statistics.median(sample.get(step, 0) for sample in samples) for step in STEPS}
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"\nMedian of {args.runs} fresh processes (ms)")
+    print(f"{'step':<20}{'lazy':>10}{'with init':>12}")
+    for step in STEPS + ["total"]:
+        lazy, eager = (sum(result.values()) if step == "total" else result[step] for result in results.values())
+        print(f"{step:<20}{lazy:>10.1f}{eager:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
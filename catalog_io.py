@@ -0,0 +1,249 @@
+"""Bulk work on a farmer's catalog: streaming CSV / JSON Lines import and export, and bulk price / stock updates."""
+import csv
+import io
+import json
+import math
+import operator
+import os
+import re
+
+# Format name -> MIME type of the exported file
+CATALOG_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+# Columns of an export; an import reads the same columns and ignores "id" (every row becomes a new product).
+CATALOG_FIELDS = ("id", "name", "price", "quantity", "category", "nutritional_facts", "image_url")
+CATEGORIES = ("Vegetables", "Fruits", "Animals", "Grains", "Dairy")
+# Rows written per chunk of a streamed export
+EXPORT_CHUNK = 200
+
+# Bulk update rules, e.g. "category=Vegetables, price *= 0.9": filters select the farmer's items, updates change them.
+RULE_FILTERS = ("category",)
+RULE_FIELDS = {"price": "price", "quantity": "stock", "stock": "stock"}  # "stock" = the table's stock field
+RULE_OPERATORS = {"=": lambda old, value: value, "+=": operator.add, "-=": operator.sub, "*=": operator.mul}
+RULE_CLAUSE = re.compile(r"^\s*(\w+)\s*([*+-]?=)\s*(.+?)\s*$")
+
+
+def catalog_format(filename, requested=None):
+    """Pick the format from an explicit choice or the file extension; returns None if unsupported."""
+    fmt = (requested or os.path.splitext(filename or "")[1].lstrip(".")).lower()
+    if fmt in ("ndjson", "json"):
+        fmt = "jsonl"
+    return fmt if fmt in CATALOG_FORMATS else None
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line number, row) for every row of an uploaded catalog file, reading it incrementally.
+
+    :param stream: Binary file object, e.g. the stream of an uploaded file
+    :param fmt: "csv" (with a header row) or "jsonl" (one JSON object per line)
+    :return: Generator of (line, row); a JSON line that does not parse is yielded as its raw text
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, raw in enumerate(text, start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw)
+        except ValueError:
+            yield line, raw
+
+
+def parse_product(row, farmer_id):
+    """
+    Validate one imported row and return the product to store for the farmer.
+
+    :raise ValueError: With a message naming the first invalid field
+    """
+    if not isinstance(row, dict):
+        raise ValueError("not a JSON object")
+    name = str(row.get("name") or "").strip()
+    if not name:
+        raise ValueError("name is required")
+    try:
+        price = float(row.get("price"))
+    except (TypeError, ValueError):
+        raise ValueError("price must be a number") from None
+    if not math.isfinite(price) or price < 0:
+        raise ValueError("price must be zero or more")
+    try:
+        quantity = int(str(row.get("quantity")).strip())
+    except ValueError:
+        raise ValueError("quantity must be a whole number") from None
+    if quantity < 0:
+        raise ValueError("quantity must be zero or more")
+    category = str(row.get("category") or "").strip()
+    if category not in CATEGORIES:
+        raise ValueError(f"category must be one of {', '.join(CATEGORIES)}")
+    return {
+        "name": name,
+        "price": price,
+        "quantity": quantity,
+        "category": category,
+        "nutritional_facts": str(row.get("nutritional_facts") or ""),
+        "image_url": str(row.get("image_url") or ""),  # Empty -> placeholder (see normalize_product)
+        "farmer_id": farmer_id,
+    }
+
+
+def import_catalog(db_manager, stream, fmt, farmer_id):
+    """
+    Import an uploaded catalog file into the farmer's products, skipping invalid rows.
+
+    Rows are validated and written batch by batch (see EnhancedDatabaseManager.import_products),
+    so the file is never held in memory as a whole.
+
+    :return: (number of products added, [(line, error message), ...])
+    """
+    errors = []
+
+    def valid_products():
+        line = 0
+        try:
+            for line, row in read_rows(stream, fmt):
+                try:
+                    yield parse_product(row, farmer_id)
+                except ValueError as error:
+                    errors.append((line, str(error)))
+        except (UnicodeDecodeError, csv.Error):
+            errors.append((line + 1, "unreadable (not UTF-8 text or malformed); the rest of the file was skipped"))
+
+    return len(db_manager.import_products(valid_products())), errors
+
+
+def export_catalog(products, fmt):
+    """
+    Yield an export of (product_id, product) pairs as text chunks of EXPORT_CHUNK rows.
+
+    :param products: Iterable of (product_id, product), e.g. EnhancedDatabaseManager.iter_products()
+    :param fmt: "csv" or "jsonl"
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == "csv" else None
+    if writer:
+        writer.writerow(CATALOG_FIELDS)
+    for count, (product_id, product) in enumerate(products, start=1):
+        row = [product_id] + [product.get(field) for field in CATALOG_FIELDS[1:]]
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(CATALOG_FIELDS, row))) + "\n")
+        if count % EXPORT_CHUNK == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _price(value):
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise ValueError("price must be a number") from None
+    if not math.isfinite(price) or price < 0:
+        raise ValueError("price must be zero or more")
+    return round(price, 2)
+
+
+def _stock(value):
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        stock = int(str(value).strip())
+    except ValueError:
+        raise ValueError("quantity must be a whole number") from None
+    if stock < 0:
+        raise ValueError("quantity must be zero or more")
+    return stock
+
+
+def parse_bulk_changes(entries):
+    """
+    Validate a list of explicit changes.
+
+    :param entries: [{"id": 1, "price": 2.5, "quantity": 10}, ...] or [[id, price, quantity], ...];
+        a missing or null price / quantity leaves that field unchanged
+    :return: [(item_id, price or None, stock or None), ...]
+    :raise ValueError: Naming the first invalid entry
+    """
+    changes = []
+    for position, entry in enumerate(entries, start=1):
+        if isinstance(entry, dict):
+            item_id = entry.get("id")
+            price, stock = entry.get("price"), entry.get("quantity", entry.get("stock"))
+        elif isinstance(entry, (list, tuple)) and len(entry) == 3:
+            item_id, price, stock = entry
+        else:
+            raise ValueError(f"change {position}: expected {{id, price, quantity}} or [id, price, quantity]")
+        try:
+            if isinstance(item_id, bool) or not isinstance(item_id, (int, str)) or not str(item_id).strip().isdigit():
+                raise ValueError("id must be a whole number")
+            changes.append((int(item_id), None if price is None else _price(price),
+                            None if stock is None else _stock(stock)))
+        except ValueError as error:
+            raise ValueError(f"change {position}: {error}") from None
+    return changes
+
+
+def parse_bulk_rule(text):
+    """
+    Parse a rule such as "category=Vegetables, price *= 0.9; quantity += 10".
+
+    :return: ({filter field: value}, [(field, operator, operand), ...]) where field is "price" or "stock"
+    :raise ValueError: If a clause cannot be parsed or the rule changes nothing
+    """
+    filters, updates = {}, []
+    for clause in filter(str.strip, re.split(r"[,;]", text or "")):
+        match = RULE_CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"cannot parse {clause.strip()!r}")
+        field, op, operand = match.groups()
+        field = field.lower()
+        if field in RULE_FILTERS and op == "=":
+            filters[field] = operand
+        elif field in RULE_FIELDS:
+            try:
+                number = float(operand) if field == "price" or op == "*=" else _stock(operand)
+            except ValueError:
+                raise ValueError(f"{clause.strip()!r}: {operand!r} is not a number") from None
+            updates.append((RULE_FIELDS[field], op, number))
+        else:
+            raise ValueError(f"{clause.strip()!r}: filter on {', '.join(RULE_FILTERS)} or change "
+                             f"{', '.join(RULE_FIELDS)}")
+    if not updates:
+        raise ValueError("the rule does not change price or quantity")
+    return filters, updates
+
+
+def parse_bulk_request(payload):
+    """
+    Read a bulk update request body: {"changes": [...]} and/or {"rule": "..."}.
+
+    :return: (changes, rule or None), see parse_bulk_changes and parse_bulk_rule
+    """
+    if not isinstance(payload, dict) or not (payload.get("changes") or payload.get("rule")):
+        raise ValueError('send JSON with "changes": [{"id", "price", "quantity"}, ...] and/or "rule"')
+    changes = payload.get("changes") or []
+    if not isinstance(changes, list):
+        raise ValueError('"changes" must be a list')
+    return parse_bulk_changes(changes), parse_bulk_rule(payload["rule"]) if payload.get("rule") else None
+
+
+def apply_bulk_updates(item, updates, stock_field):
+    """
+    Apply rule updates to one item in place.
+
+    :param stock_field: Name of the item's stock field ("quantity" for products, "stock" for discounted items)
+    :raise ValueError: If a price or stock would drop below zero
+    """
+    for field, op, operand in updates:
+        key = stock_field if field == "stock" else field
+        value = RULE_OPERATORS[op](item.get(key) or 0, operand)
+        if value < 0:
+            raise ValueError(f"{key} of {item.get('name')!r} would drop below zero")
+        item[key] = round(value, 2) if field == "price" else int(round(value))
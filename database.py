@@ -1,642 +1,3223 @@
-import shelve
-import os
-from datetime import datetime, timedelta
-
-DATABASE_FILE = os.path.join(os.path.dirname(__file__), "central_database.db")
-
-
-class EnhancedDatabaseManager:
-    def __init__(self, db_name=DATABASE_FILE):
-        self.db_name = db_name
-
-    def initialize_database(self):
-        """Initialize the database ONLY if it's empty to prevent resetting registrations."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            if "users" not in db:
-                db["users"] = {
-                    "customer1": {"name": "Customer 1", "role": "customer", "points": 1000, "balance": 200.0,
-                                  "password": "customer123"},
-                    "farmer1": {"name": "Farmer 1", "role": "farmer", "points": 200, "balance": 500.0,
-                                "password": "farmer123"},
-                    "farmer2": {"name": "Farmer 2", "role": "farmer", "points": 150, "balance": 300.0,
-                                "password": "farmer123"},
-                }
-
-            if "farmers_registered" not in db:  # ✅ This prevents overwriting the registrations
-                db["farmers_registered"] = {}
-
-            print("Database initialized without resetting existing values.")
-
-
-
-            # Default products
-            if "products" not in db:
-                db["products"] = {
-                    1: {"name": "Carrot", "price": 1.50, "quantity": 100, "category": "Vegetables",
-                        "image_url": "placeholder.png", "uploaded_by": "farmer1", "farmer_id": "farmer1"},
-                    2: {"name": "Tomato", "price": 2.00, "quantity": 50, "category": "Vegetables",
-                        "image_url": "placeholder.png", "uploaded_by": "farmer2", "farmer_id": "farmer2"},
-                }
-                for product_id, product in db["products"].items():
-                    if "farmer_id" not in product:
-                        product["farmer_id"] = product.get("uploaded_by", "unknown_farmer")  # Assign dynamically
-                db["products"] = db["products"]  # Save changes
-
-                # Default ownership
-                if "ownership" not in db:
-                    db["ownership"] = {
-                        "farmer1": {
-                            "products": [1, 2, 3],
-                            "returns": {},
-                            "plants": [],
-                            "watering_price": 5.0,  # Default watering price
-                            "fertilizer_price": 10.0,  # Default fertilizer price
-                        },
-                        "customer1": {
-                            "products": [],
-                            "returns": {},
-                            "plants": [],
-                        },
-                    }
-
-            # Default rewards
-            if "reward_products" not in db:
-                db["reward_products"] = {
-                    1: {"name": "Discounted Carrot", "points": 50, "quantity": 20},
-                }
-
-            print("Database initialized with default values.")
-
-            if "discounted_items" not in db:
-                db["discounted_items"] = {
-                    1: {
-                        "name": "Discounted Carrot",
-                        "price": 1.00,
-                        "stock": 20,
-                        "category": "Vegetables",  # ✅ Added category
-                        "expiry_date": (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"),
-                        "image_url": "https://gallery.yopriceville.com/var/resizes/Free-Clipart-Pictures/Vegetables-PNG/Fresh_Carrot_PNG_Clip_Art_Image.png?m=1629833771",
-                    },
-                    2: {
-                        "name": "Discounted Tomato",
-                        "price": 1.50,
-                        "stock": 15,
-                        "category": "Fruits",  # ✅ Added category
-                        "expiry_date": (datetime.now() + timedelta(days=5)).strftime("%Y-%m-%d"),
-                        "image_url": "https://pngimg.com/uploads/tomato/tomato_PNG12592.png",
-                    },
-                }
-            if "tree_types" not in db:
-                db["tree_types"] = {
-                    "mango": {
-                        "name": "Mango Tree",
-                        "price": 5.0,  # Price in dollars
-                        "investment_return": 50.0,  # Expected investment value in dollars
-                    },
-                    "avocado": {
-                        "name": "Avocado Tree",
-                        "price": 7.0,
-                        "investment_return": 70.0,
-                    },
-                    "apple": {
-                        "name": "Apple Tree",
-                        "price": 6.0,
-                        "investment_return": 60.0,
-                    },
-                }
-            if "orders" not in db:
-                db["orders"] = {}
-
-            if "reports" not in db:
-                db["reports"] = {}
-
-            print("Database initialized with default values.")
-
-    def get_users(self):
-        """Retrieve all users."""
-        with shelve.open(self.db_name) as db:
-            return db.get("users", {})
-
-    def register_farmer_for_future(self, farmer_id):
-        """Marks a farmer as registered for Plant a Future."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            if "farmers_registered" not in db:
-                db["farmers_registered"] = {}  # Ensure the key exists
-            farmers_registered = db["farmers_registered"]
-
-            if farmer_id in farmers_registered:  # If already registered, do nothing
-                print(f"DEBUG: Farmer {farmer_id} is already registered!")
-                return
-
-            farmers_registered[farmer_id] = True  # Mark as registered
-            db["farmers_registered"] = farmers_registered
-            db.sync()  # Force save to shelve
-            print(f"DEBUG: Registered Farmer {farmer_id} Successfully!")
-
-    def get_farmer_notifications(self, farmer_id):
-        """Fetch pending return requests for the specified farmer."""
-        with shelve.open(self.db_name) as db:
-            return_transactions = db.get("return_transactions", {})
-            products = db.get("products", {})
-            farmer_returns = []
-
-            for customer_id, transactions in return_transactions.items():
-                for transaction in transactions:
-                    product_name = transaction.get("product_name")
-                    for product_id, product_data in products.items():
-                        if (
-                                product_data["name"] == product_name
-                                and product_data.get(
-                            "uploaded_by") == farmer_id  # Ensure only farmer's products are retrieved
-                                and transaction.get("status", "pending") == "pending"
-                        ):
-                            farmer_returns.append({
-                                "id": product_id,
-                                "product_name": product_name,
-                                "quantity": transaction.get("quantity", 1),
-                                "reason": transaction.get("reason"),
-                                "customer_id": customer_id,
-                                "status": transaction.get("status", "pending"),
-                            })
-
-            print(f"DEBUG: Returns fetched for farmer {farmer_id}: {farmer_returns}")
-            return farmer_returns
-
-    def get_products(self):
-        """Retrieve all products and ensure each product has a farmer_id and correct image path."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            products = db.get("products", {})
-
-            # Ensure every product has a farmer_id or uploaded_by
-            for product_id, product in products.items():
-                if "farmer_id" not in product:
-                    product["farmer_id"] = product.get("uploaded_by", "unknown_farmer")
-
-                # ✅ Ensure correct image paths
-                if not product.get("image_url") or product["image_url"] == "placeholder.png":
-                    product["image_url"] = "static/uploads/placeholder.png"
-                else:
-                    product["image_url"] = product["image_url"].replace("static/", "")
-
-            db["products"] = products  # Save changes
-
-        return products
-
-    def get_ownership(self, user_id):
-        """Retrieve ownership details for a user."""
-        with shelve.open(self.db_name) as db:
-            ownership = db.get("ownership", {})
-            user_ownership = ownership.get(user_id, {})
-            # Ensure "returns" is initialized as a dictionary
-            user_ownership.setdefault("returns", {})
-            return user_ownership
-
-    def get_reward_products(self):
-        """Retrieve all reward products."""
-        with shelve.open(self.db_name) as db:
-            return db.get("reward_products", {})
-
-    def get_nav_options(self, role):
-        """Return navigation options based on user role."""
-        nav_options = {
-            "farmer": [
-                {"name": "Products", "url": "/products/"},
-                {"name": "Discounted Products", "url": "/discounted/"},
-                {"name": "Your Farm", "url": "/rewards/farmer_plant_a_future"},
-                {"name": "Returns", "url": "/returns/farmer_returns"},
-            ],
-            "customer": [
-                {"name": "Products", "url": "/products/"},
-                {"name": "Discounted Products", "url": "/discounted/"},
-                {"name": "Plant a Future", "url": "/rewards/plant_a_future"},
-                {"name": "Returns", "url": "/returns/"},
-                {"name": "Checkout", "url": "/checkout/"},
-            ],
-        }
-
-        # ✅ Ensure the Rewards URL is correct in the dropdown
-        dropdown_options = [
-            {"name": "Profile", "url": "/profile/profile"},
-            {"name": "Rewards", "url": "/rewards/"},
-            {"name": "Divider", "url": None},  # Divider for better separation
-            {"name": "Logout", "url": "/profile/logout", "class": "text-danger"},
-        ]
-
-        return {"nav": nav_options.get(role, []), "dropdown": dropdown_options}
-
-    def get_all_items(self):
-        """Retrieve all discounted items."""
-        with shelve.open(self.db_name) as db:
-            return db.get("discounted_items", {})
-
-    def save_items(self, items):
-        """Save the updated discounted items dictionary."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            db["discounted_items"] = items
-
-    def adjust_user_balance(self, user_id, balance_delta):
-        """Adjust the user's balance."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            users = db.get("users", {})
-            user = users.get(user_id)
-
-            if not user:
-                raise ValueError(f"User with ID '{user_id}' not found.")
-
-            new_balance = round(user.get("balance", 0) + balance_delta, 2)
-
-            if new_balance < 0:
-                raise ValueError("Insufficient balance for this transaction.")
-
-            user["balance"] = new_balance
-            users[user_id] = user
-            db["users"] = users
-
-    def update_ownership(self, user_id, category, item_id):
-        """
-        Add an item to a user's ownership in the specified category.
-
-        :param user_id: ID of the user
-        :param category: Category to update (e.g., "products", "returns", etc.)
-        :param item_id: ID of the item to add
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            ownership = db.setdefault("ownership", {})
-            user_ownership = ownership.setdefault(user_id, {})
-            category_items = user_ownership.setdefault(category, [])
-
-            if item_id not in category_items:
-                category_items.append(item_id)
-
-            db["ownership"] = ownership
-
-    def add_transaction(self, user_id, product_name, amount, quantity):
-        """
-        Add a transaction to the user's history.
-
-        :param user_id: ID of the user
-        :param product_name: Name of the purchased product
-        :param amount: Total cost of the transaction
-        :param quantity: Quantity of the product purchased
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            transactions = db.setdefault("transactions", {})
-            user_transactions = transactions.setdefault(user_id, [])
-
-            user_transactions.append({
-                "product_name": product_name,
-                "amount": round(amount, 2),
-                "quantity": quantity,
-                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current date and time
-            })
-
-            db["transactions"] = transactions
-
-    def get_transactions(self, user_id):
-        """Retrieve the transaction history for a user."""
-        try:
-            with shelve.open(self.db_name) as db:
-                transactions = db.get("transactions", {})
-                return transactions.get(user_id, [])
-        except Exception as e:
-            print(f"Error reading transactions: {e}")
-            return []
-
-    def save_products(self, products):
-        """Save the updated products dictionary."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            db["products"] = products
-
-    def get_products(self):
-        """Retrieve all products."""
-        with shelve.open(self.db_name) as db:
-            return db.get("products", {})
-
-    def add_transaction(self, user_id, product_name, amount, quantity):
-        """
-        Add a transaction to the user's history.
-
-        :param user_id: ID of the user
-        :param product_name: Name of the purchased or redeemed product
-        :param amount: Total cost of the transaction (0 for redemptions)
-        :param quantity: Quantity of the product purchased or redeemed
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            transactions = db.setdefault("transactions", {})
-            user_transactions = transactions.setdefault(user_id, [])
-
-            user_transactions.append({
-                "product_name": product_name,
-                "amount": round(amount, 2),  # Will be 0 for redemptions
-                "quantity": quantity,
-                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current date and time
-            })
-
-            db["transactions"] = transactions
-
-    def get_return_transactions(self, user_id):
-        """
-        Retrieve the return transaction history for a user.
-
-        :param user_id: ID of the user
-        :return: List of return transactions
-        """
-        with shelve.open(self.db_name) as db:
-            return_transactions = db.get("return_transactions", {})
-            return return_transactions.get(user_id, [])
-
-    def create_profile(self, username, name, email, role, points, password):
-        """
-        Create a new user profile and save it to the database.
-
-        :param username: Unique username for the user
-        :param name: Full name of the user
-        :param email: Email address of the usaer
-        :param role: Role of the user (customer or farmer)
-        :param points: Initial points for the user
-        :param password: Password for the user
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            users = db.get("users", {})
-            if username in users:
-                raise ValueError(f"Username '{username}' already exists.")
-
-            users[username] = {
-                "name": name,
-                "email": email,
-                "role": role,
-                "points": points,
-                "balance": 0.0,  # Default balance for new accounts
-                "password": password,
-            }
-            db["users"] = users
-
-    def save_ownership(self, user_id, ownership):
-        """
-        Save updated ownership details for a user.
-
-        :param user_id: ID of the user
-        :param ownership: Updated ownership dictionary
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            all_ownership = db.get("ownership", {})
-            all_ownership[user_id] = ownership
-            db["ownership"] = all_ownership
-
-    def add_return_transaction(self, user_id, product_name, reason):
-        """
-        Add a return transaction to the user's history.
-
-        :param user_id: ID of the user
-        :param product_name: Name of the returned product
-        :param reason: Reason for the return
-        """
-        with shelve.open(self.db_name, writeback=True) as db:
-            return_transactions = db.setdefault("return_transactions", {})
-            user_returns = return_transactions.setdefault(user_id, [])
-            user_returns.append({
-                "product_name": product_name,
-                "reason": reason,
-                "status": "pending",  # Ensure status is set
-                "instructions": None,  # Default instructions
-                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-            return_transactions[user_id] = user_returns
-            db["return_transactions"] = return_transactions
-
-        print("DEBUG: Return Transactions for User:", return_transactions.get(user_id, []))
-
-    def save_users(self, users):
-        """Save the updated users dictionary."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            db["users"] = users
-
-    def adjust_user_points(self, user_id, points_delta):
-        """Adjusts user points and ensures they do not go negative."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            users = db.get("users", {})
-            user = users.get(user_id)
-
-            if not user:
-                raise ValueError(f"User '{user_id}' not found.")
-
-            new_points = user.get("points", 0) + points_delta
-
-            if new_points < 0:
-                raise ValueError("Insufficient points for this transaction.")
-
-            user["points"] = new_points
-            db["users"] = users  # ✅ Save updated user data
-
-    def submit_report(self, user_id, report_content, category):
-        """Submit a report and save it to the database."""
-        report_id = self.generate_report_id()
-
-        report = {
-            "user_id": user_id,
-            "content": report_content,
-            "category": category,
-            "status": "pending",
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        }
-
-        with shelve.open(self.db_name, writeback=True) as db:
-            reports = db.get("reports", {})
-            reports[report_id] = report
-            db["reports"] = reports
-
-        print(f"Report submitted with ID: {report_id}")
-        return report_id
-
-    def generate_report_id(self):
-        """Generate a unique report ID."""
-        with shelve.open(self.db_name) as db:
-            reports = db.get("reports", {})
-            return len(reports) + 1
-
-    def get_reports(self, user_id=None, category=None):
-        """Retrieve all reports, optionally filtered by user or category."""
-        with shelve.open(self.db_name) as db:
-            reports = db.get("reports", {})
-
-        if user_id:
-            reports = {k: v for k, v in reports.items() if v["user_id"] == user_id}
-
-        if category:
-            reports = {k: v for k, v in reports.items() if v["category"] == category}
-
-        return reports
-
-    def update_report_status(self, report_id, new_status):
-        """Update the status of a report."""
-        if new_status not in ["pending", "resolved", "closed"]:
-            raise ValueError("Invalid status. Must be 'pending', 'resolved', or 'closed'.")
-
-        with shelve.open(self.db_name, writeback=True) as db:
-            reports = db.get("reports", {})
-            if report_id in reports:
-                reports[report_id]["status"] = new_status
-                db["reports"] = reports
-                print(f"Updated report {report_id} to status '{new_status}'")
-                return reports[report_id]
-
-    def save_products(self, products):
-        """Save the updated products dictionary."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            db["products"] = products
-
-    def add_order(self, farmer_id, buyer_name, product_name, quantity, price):
-        """Store order details under the respective farmer."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            orders = db.setdefault("orders", {})  # Ensure "orders" key exists
-            order_id = len([o for v in orders.values() for o in v]) + 1  # Generate unique order ID
-
-            order = {
-                "order_id": order_id,
-                "farmer_id": farmer_id,
-                "buyer_name": buyer_name,
-                "product_name": product_name,
-                "quantity": quantity,
-                "price": price,
-                "status": "Pending",
-                "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
-            }
-
-            # Store the order under the farmer's ID
-            orders.setdefault(farmer_id, []).append(order)
-
-            db["orders"] = orders  # Save changes
-
-    def get_farmer_orders(self, farmer_id):
-        """Retrieve all orders for a given farmer."""
-        with shelve.open(self.db_name) as db:
-            orders = db.get("orders", {})  # Ensure "orders" key exists
-            farmer_orders = orders.get(farmer_id, [])
-            print(f"DEBUG: Orders fetched for farmer {farmer_id}: {farmer_orders}")  # Debugging
-            return farmer_orders  # Return orders for the specific farmer
-
-    def update_device_status(self, device_id, status):
-        """Updates the status of an IoT device."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            if device_id in db.get("iot_devices", {}):
-                db["iot_devices"][device_id]["status"] = status
-
-    def move_plant_to_another_device(self, plant_id, farmer_id):
-        """Moves a plant to another available IoT device under the same farmer."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            available_devices = [
-                device_id for device_id, device in db.get("iot_devices", {}).items()
-                if device["farmer_id"] == farmer_id and device["status"] == "Active"
-            ]
-            if available_devices:
-                new_device_id = available_devices[0]  # Move to the first available device
-                db["plants"][plant_id]["device_id"] = new_device_id
-                return new_device_id
-            return None
-
-    def log_failure(self, device_id, failure_type):
-        """Logs a failure event for an IoT device."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            failure_logs = db.setdefault("failures", {})
-            failure_logs[device_id] = {
-                "failure_type": failure_type,
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "status": "Pending"
-            }
-            db["failures"] = failure_logs
-
-    def check_and_refund_if_plant_dies(self, plant_id):
-        """Checks if a plant has died and refunds the user if necessary."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            plants = db.get("plants", {})
-            users = db.get("users", {})
-            if plant_id in plants and plants[plant_id]["status"] == "Dead":
-                user_id = plants[plant_id]["user_id"]
-                investment = plants[plant_id]["investment"]
-                users[user_id]["balance"] += investment  # Refund the user
-                del plants[plant_id]  # Remove the dead plant
-                db["plants"] = plants
-                db["users"] = users
-
-    def register_iot_device(self, farmer_id, device_id):
-        """Registers an IoT device to a farmer."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            iot_devices = db.setdefault("iot_devices", {})
-
-            # Ensure the farmer exists
-            users = db.get("users", {})
-            if farmer_id not in users or users[farmer_id]["role"] != "farmer":
-                return {"error": "Farmer does not exist or is not a valid farmer."}
-
-            # Store the IoT device under the farmer's ID
-            iot_devices[device_id] = {
-                "farmer_id": farmer_id,
-                "status": "Active",
-                "assigned_user": None  # Ensure device starts unassigned
-            }
-            db["iot_devices"] = iot_devices  # Save to database
-            return {"message": f"IoT Device {device_id} registered successfully!"}
-
-    def add_discounted_item(self, item_id, name, price, stock, days_until_expiry):
-        """Add a new discounted item with an expiry date."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            discounted_items = db.setdefault("discounted_items", {})
-            discounted_items[item_id] = {
-                "name": name,
-                "price": price,
-                "stock": stock,
-                "expiry_date": (datetime.now() + timedelta(days=days_until_expiry)).strftime("%Y-%m-%d"),
-            }
-            db["discounted_items"] = discounted_items
-
-    def get_valid_discounted_items(self):
-        """Retrieve only valid (non-expired) discounted items."""
-        with shelve.open(self.db_name, writeback=True) as db:
-            discounted_items = db.get("discounted_items", {})
-            today = datetime.now().strftime("%Y-%m-%d")
-
-            valid_items = {
-                item_id: item for item_id, item in discounted_items.items()
-                if item["expiry_date"] >= today
-            }
-
-            # Optionally remove expired items
-            db["discounted_items"] = valid_items
-
-            return valid_items
-
-    def get_discounted_items(self):
-        """Retrieve all discounted items."""
-        with shelve.open(self.db_name) as db:
-            return db.get("discounted_items", {})
-
-
-    def log_report(self, user_id, product_id, customer_id, issue):
-        """
-        Logs a report for a return issue.
-
-        :param user_id: ID of the farmer who is reporting the issue
-        :param product_id: ID of the product being reported
-        :param customer_id: ID of the customer who made the return
-        :param issue: Description of the issue
-        """
-        # Open the database (shelve or whatever you're using)
-        with shelve.open("central_database.db", writeback=True) as db:
-            # Get existing reports or create an empty dictionary if none exists
-            reports = db.get("return_reports", {})
-
-            # Create a new entry for the report under the customer's ID
-            if customer_id not in reports:
-                reports[customer_id] = []
-
-            # Add the new report
-            reports[customer_id].append({
-                "product_id": product_id,
-                "issue": issue,
-                "reported_by": user_id,  # Who reported the issue
-                "status": "reported",  # Optional: You can track the status of the report
-            })
-
-            # Save the reports back into the database
-            db["return_reports"] = reports
-
+import ast
+import atexit
+import bisect
+import dbm
+import dbm.dumb
+import lzma
+import pickle
+import shelve
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import islice
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process locks apply
+    fcntl = None
+
+from archive import HistoryArchive
+from catalog_io import apply_bulk_updates
+from journal import PAGE_SIZE, RETURNS, TRANSACTIONS, TransactionJournal, encode_frame, read_frame, select_page
+from records import RECORD_CLASSES, Cart, Order, as_record, pack_record
+from search_index import SEARCH_FIELDS, SEARCH_LIMIT, block_of, query_grams, rank, record_grams
+
+# Set HARVEST_HAVEN_DB to run on another file; a .sqlite/.sqlite3 path selects the SQLite backend.
+DATABASE_FILE = os.environ.get("HARVEST_HAVEN_DB", os.path.join(os.path.dirname(__file__), "central_database.db"))
+SQLITE_SUFFIXES = (".sqlite", ".sqlite3")
+
+# Every table entry is stored under its own "<table>/<record id>" key, so a write only
+# re-serializes the record it touches instead of the whole table.
+KEY_SEPARATOR = "/"
+LAYOUT_KEY = "__layout__"
+RECORD_LAYOUT_VERSION = 1
+
+# Tables stored one record per key; all but "holds", "carts" and the idempotency tables used to be
+# pickled as one dict under a single key.
+RECORD_TABLES = (
+    "users", "farmers_registered", "products", "ownership", "reward_products", "discounted_items",
+    "tree_types", "orders", "reports", "transactions", "return_transactions", "return_reports",
+    "iot_devices", "failures", "plants", "trees", "holds", "carts", "idempotency",
+    "idempotency_responses",
+)
+
+# Tables keyed by integer IDs (everything else is keyed by a string such as a username).
+INT_KEYED_TABLES = {"products", "discounted_items", "reward_products", "reports", "holds"}
+
+# Nested fields kept as records of their own: ownership[user]["plants"] lives under "trees/<user>".
+SPLIT_FIELDS = {"ownership": ("plants", "trees")}
+
+# Record lists read a page at a time, newest first: table -> (cursor field, date field). Elements
+# are appended in time order, so both fields grow along the list.
+PAGED_LISTS = {"orders": ("order_id", "created_at")}
+
+# Bump when normalize_product / normalize_discounted_item change so migrate_catalog() reruns.
+CATALOG_VERSION_KEY = "__catalog_version__"
+CATALOG_SCHEMA_VERSION = 1
+PLACEHOLDER_IMAGE = "static/uploads/placeholder.png"
+
+# Products written per store write by bulk imports, and read per read-lock hold by exports.
+CATALOG_BATCH = 500
+# Stock held by carts: holds/<product_id> = {user_id: [quantity, expires_at]}, expires_at a time.time()
+# stamp. A product's available stock is its quantity minus the unexpired holds of other customers;
+# checkout turns the buyer's holds into stock decrements (see take_held_stock).
+HOLDS = "holds"
+HOLD_TTL = int(os.environ.get("HARVEST_HAVEN_HOLD_TTL", "900"))
+HOLD_SWEEP_INTERVAL = int(os.environ.get("HARVEST_HAVEN_HOLD_SWEEP_INTERVAL", "0"))
+
+# Carts live in the store, carts/<user_id> = records.Cart, instead of the session cookie. Carts left
+# untouched for CART_IDLE_DAYS are evicted with their holds (see evict_idle_carts).
+CARTS = "carts"
+CART_IDLE_DAYS = int(os.environ.get("HARVEST_HAVEN_CART_IDLE_DAYS", "30"))
+# Stages of checkout_cart, in order. Every checkout reports how long each took, and the process
+# keeps running totals in CHECKOUT_STATS (see get_store_stats).
+CHECKOUT_STAGES = ("load", "validate", "stock", "ownership", "orders", "transactions", "commit")
+
+# Idempotency keys of routes that are safe to retry (see idempotency.py): idempotency/<user_id> =
+# {key: [expires_at, request fingerprint, slot, answered]}, oldest first, and the recorded response
+# of each key in idempotency_responses/<user_id>/<slot>. A user has at most IDEMPOTENCY_KEYS_PER_USER
+# keys, so a slot is reused (overwritten, never deleted) once its key expires or is evicted. A key is
+# replayed for IDEMPOTENCY_TTL seconds; a claim whose request never finished is freed after
+# IDEMPOTENCY_PENDING_TTL.
+IDEMPOTENCY = "idempotency"
+IDEMPOTENCY_RESPONSES = "idempotency_responses"
+IDEMPOTENCY_TTL = int(os.environ.get("HARVEST_HAVEN_IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_PENDING_TTL = int(os.environ.get("HARVEST_HAVEN_IDEMPOTENCY_PENDING_TTL", "60"))
+IDEMPOTENCY_KEYS_PER_USER = int(os.environ.get("HARVEST_HAVEN_IDEMPOTENCY_KEYS_PER_USER", "100"))
+IDEMPOTENCY_PENDING = "pending"
+
+# Tables farmers can bulk update (see bulk_update_items): table -> (owner field, stock field)
+BULK_UPDATE_TABLES = {"products": ("farmer_id", "quantity"), "discounted_items": ("owner_id", "stock")}
+
+# Owned products are kept as one counter per product, {product_id: {"quantity", "returned",
+# "first_acquired", "last_acquired"}}, instead of one list entry per unit acquired.
+OWNERSHIP_VERSION_KEY = "__ownership_version__"
+OWNERSHIP_SCHEMA_VERSION = 1
+
+# Products, users, trees, IoT devices and orders are stored packed (see records.py) instead of as dicts.
+RECORDS_VERSION_KEY = "__records_version__"
+RECORDS_SCHEMA_VERSION = 1
+
+# Transactions and returns live in an append-only journal next to the shelve files.
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_VERSION_KEY = "__journal_version__"
+JOURNAL_SCHEMA_VERSION = 1
+
+# History that no longer changes moves to a compressed archive next to the database (see archive.py)
+# once it is older than ARCHIVE_AFTER_DAYS: transactions, resolved returns and closed reports.
+ARCHIVE_SUFFIX = ".archive"
+ARCHIVE_AFTER_DAYS = int(os.environ.get("HARVEST_HAVEN_ARCHIVE_DAYS", "365"))
+REPORTS = "reports"
+CLOSED_REPORT_STATUSES = ("resolved", "closed")
+
+# Secondary indexes: for each indexed field, "<table>#<field>/<value>" holds the sorted IDs of the
+# records with that value. Names are indexed in normalized form (see normalize_name).
+# The search index keeps one posting list per trigram and block of IDs under
+# "<table>#grams/<gram>/<block>", and the blocks a trigram occurs in under "<table>#gram_blocks/<gram>".
+INDEX_SEPARATOR = "#"
+INDEX_VERSION_KEY = "__index_version__"
+INDEX_SCHEMA_VERSION = 2
+SEARCH_GRAMS = "grams"
+SEARCH_GRAM_BLOCKS = "gram_blocks"
+
+# Persistent ID sequences: the last ID handed out per entity, kept as store meta.
+SEQUENCE_PREFIX = "__sequence__"
+SEQUENCES_VERSION_KEY = "__sequences_version__"
+SEQUENCES_SCHEMA_VERSION = 1
+SEQUENCE_ENTITIES = ("products", "discounted_items", "orders", "reports", "trees")
+
+# Lock file shared by every worker process that opens the same database.
+LOCK_SUFFIX = ".lock"
+
+# Compaction copies the live values of a dbm.dumb store into "<db>.compact.dat/.dir"; the
+# ".compact.ready" marker is written once the copy is complete, so an interrupted swap can be
+# finished on the next open. Set HARVEST_HAVEN_COMPACT_INTERVAL (seconds) to compact in the
+# background whenever at least COMPACT_MIN_DEAD_RATIO of the data file is dead space.
+COMPACT_SUFFIX = ".compact"
+COMPACT_READY_SUFFIX = ".compact.ready"
+COMPACT_INTERVAL = int(os.environ.get("HARVEST_HAVEN_COMPACT_INTERVAL", "0"))
+COMPACT_MIN_DEAD_RATIO = 0.5
+COMPACT_RETRIES = 3
+DUMB_BLOCK_BYTES = 512  # dbm.dumb starts every value on a block boundary
+
+# While a snapshot is being taken "<db>.snapshot" exists, and writers save the value each key had
+# before its first change to "<db>.preimages", so the snapshot copies the store as it was when it
+# started while writes carry on (see snapshot.py).
+SNAPSHOT_MARKER_SUFFIX = ".snapshot"
+PREIMAGE_SUFFIX = ".preimages"
+
+# Stored values are pickles. Pickles of at least COMPRESS_OVER_BYTES (one dbm.dumb block; smaller
+# values take a whole block either way) are stored compressed behind a one-byte codec tag.
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+COMPRESS_OVER_BYTES = DUMB_BLOCK_BYTES
+COMPRESS_LEVEL = 6
+
+# Upper bound on the in-process read cache (pickled bytes).
+RECORD_CACHE_BYTES = 32 * 1024 * 1024
+
+
+# Codec tag -> (compress, decompress). Pickles start with the PROTO opcode b"\x80", so values
+# without a tag (everything written before the codec existed) are read as plain pickles.
+COMPRESSORS = {
+    b"z": (lambda data: zlib.compress(data, COMPRESS_LEVEL), zlib.decompress),
+    b"x": (lzma.compress, lzma.decompress),
+}
+
+
+def register_compressor(tag, compress, decompress):
+    """Make another compressor available to RecordCodec under a one-byte tag."""
+    if len(tag) != 1 or tag == b"\x80":
+        raise ValueError("Codec tags are one byte other than b'\\x80'")
+    COMPRESSORS[tag] = (compress, decompress)
+
+
+class RecordCodec:
+    """
+    Turns stored values into bytes and back.
+
+    Values are pickled with `protocol`; a pickle of at least `compress_over` bytes is compressed
+    with the compressor under `tag` when that makes it smaller, and stored behind the tag.
+    Decoding goes by each value's own tag, so values written with other settings stay readable.
+    """
+
+    def __init__(self, protocol=PICKLE_PROTOCOL, tag=b"z", compress_over=COMPRESS_OVER_BYTES):
+        self.protocol = protocol
+        self.tag = tag
+        self.compress_over = compress_over
+
+    def encode(self, value):
+        data = pickle.dumps(value, self.protocol)
+        if self.tag is None or len(data) < self.compress_over:
+            return data
+        compressed = self.tag + COMPRESSORS[self.tag][0](data)
+        return compressed if len(compressed) < len(data) else data
+
+    @staticmethod
+    def unwrap(data):
+        """Return the plain pickle inside a stored value."""
+        decompress = COMPRESSORS.get(bytes(data[:1]))
+        return decompress[1](data[1:]) if decompress else data
+
+    def decode(self, data):
+        return pickle.loads(self.unwrap(data))
+
+
+CODEC = RecordCodec()
+
+
+def record_key(table, record_id):
+    """Build the shelve key for a single record."""
+    return f"{table}{KEY_SEPARATOR}{record_id}"
+
+
+def normalize_name(name):
+    """Lower-case a product name and collapse its whitespace for index lookups."""
+    return " ".join(str(name or "").lower().split())
+
+
+# table -> {field: function turning the stored value into its index key}
+INDEXED_FIELDS = {
+    "products": {"farmer_id": str, "category": str, "name": normalize_name},
+}
+
+
+def index_table(table, field):
+    """Name of the table that holds the secondary index of one field."""
+    return f"{table}{INDEX_SEPARATOR}{field}"
+
+
+def index_values(table, record):
+    """Return {field: index key} for the indexed fields a record has a value for."""
+    if not isinstance(record, Mapping):
+        return {}
+    return {
+        field: key(record[field])
+        for field, key in INDEXED_FIELDS.get(table, {}).items()
+        if record.get(field) is not None
+    }
+
+
+def parse_record_key(key):
+    """Split a shelve key into (table, record_id), or return None for non-record keys."""
+    table, sep, raw_id = key.partition(KEY_SEPARATOR)
+    if not sep or table not in RECORD_TABLES:
+        return None
+    if table in INT_KEYED_TABLES:
+        try:
+            return table, int(raw_id)
+        except ValueError:
+            pass
+    return table, raw_id
+
+
+class LockWaitStats:
+    """Counts lock acquisitions and how long they waited."""
+
+    def __init__(self):
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, waited):
+        with self._lock:
+            self.acquisitions += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+    def as_dict(self):
+        return {
+            "acquisitions": self.acquisitions,
+            "total_wait_ms": round(self.total_wait * 1000, 3),
+            "avg_wait_ms": round(self.total_wait * 1000 / self.acquisitions, 3) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class ReadWriteLock:
+    """
+    Any number of threads may read at once; a writer waits for readers and runs alone.
+
+    Readers and writers take turns: once a writer is waiting, new readers queue behind it, and
+    when a writer finishes, the readers that queued meanwhile go before the next writer. Neither
+    a steady stream of reads nor of writes can starve the other side, and writers go in the
+    order they arrived. A thread that already holds the read lock may still nest reads.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._read_depth = {}  # thread ident -> nested read acquisitions
+        self._readers_waiting = 0
+        self._readers_turn = False
+        self._writers_waiting = 0
+        self._next_ticket = 0  # Writers are served in ticket order
+        self._serving = 0
+        self._abandoned = set()
+        self._writer = None
+        self._writer_depth = 0
+        self.read_waits = LockWaitStats()
+        self.write_waits = LockWaitStats()
+
+    def acquire_read(self):
+        """Acquire shared access; returns False when nested inside this thread's own write."""
+        started = time.perf_counter()
+        with self._cond:
+            me = threading.get_ident()
+            if self._writer == me:
+                self._writer_depth += 1  # Reading inside our own write block
+                return False
+            if me not in self._read_depth:
+                self._readers_waiting += 1
+                try:
+                    while self._writer is not None or (self._writers_waiting and not self._readers_turn):
+                        self._cond.wait()
+                finally:
+                    self._readers_waiting -= 1
+                    if not self._readers_waiting and self._readers_turn:
+                        self._readers_turn = False  # Every queued reader is in: writers are next
+                        self._cond.notify_all()
+            self._read_depth[me] = self._read_depth.get(me, 0) + 1
+            self._readers += 1
+        self.read_waits.record(time.perf_counter() - started)
+        return True
+
+    def release_read(self):
+        with self._cond:
+            me = threading.get_ident()
+            if self._writer == me:
+                self._writer_depth -= 1
+                return
+            self._read_depth[me] -= 1
+            if not self._read_depth[me]:
+                del self._read_depth[me]
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """Acquire exclusive access; returns True for the outermost acquisition."""
+        started = time.perf_counter()
+        with self._cond:
+            me = threading.get_ident()
+            if self._writer == me:
+                self._writer_depth += 1
+                return False
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._writers_waiting += 1
+            try:
+                while (ticket != self._serving or self._writer is not None or self._readers
+                       or self._readers_turn):
+                    self._cond.wait()
+            except BaseException:
+                self._abandoned.add(ticket)  # Interrupted while queued: give up the place in line
+                self._skip_abandoned()
+                raise
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+        self.write_waits.record(time.perf_counter() - started)
+        return True
+
+    def release_write(self):
+        with self._cond:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._serving += 1
+                self._skip_abandoned()
+                self._readers_turn = bool(self._readers_waiting)
+                self._cond.notify_all()
+
+    def _skip_abandoned(self):
+        while self._serving in self._abandoned:
+            self._abandoned.discard(self._serving)
+            self._serving += 1
+        self._cond.notify_all()
+
+
+class FileLock:
+    """
+    Shared/exclusive `fcntl.flock` on "<database>.lock", coordinating worker processes.
+
+    The lock file also holds the store's write generation: every write bumps it, so another
+    process can tell that its open handle and read cache are stale. Without fcntl (Windows)
+    only the in-process locks apply.
+    """
+
+    def __init__(self, path):
+        self.path = path + LOCK_SUFFIX
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        self.shared_waits = LockWaitStats()
+        self.exclusive_waits = LockWaitStats()
+
+    def acquire(self, exclusive):
+        started = time.perf_counter()
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        (self.exclusive_waits if exclusive else self.shared_waits).record(time.perf_counter() - started)
+
+    def release(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def generation(self):
+        return int.from_bytes(os.pread(self._fd, 8, 0) or b"\0", "big")
+
+    def bump(self):
+        """Record a write (call with the exclusive lock held); returns the new generation."""
+        generation = self.generation() + 1
+        os.pwrite(self._fd, generation.to_bytes(8, "big"), 0)
+        return generation
+
+    def close(self):
+        os.close(self._fd)
+
+
+def _mark_synced(shelf):
+    """
+    Tell a dbm.dumb handle its index is on disk.
+
+    dbm.dumb never clears its modified flag, so once a handle has written, every later sync or
+    close rewrites the .dir file from memory. A handle dropped as stale would then overwrite
+    another process's keys with an outdated index.
+    """
+    if hasattr(shelf.dict, "_modified"):
+        shelf.dict._modified = False
+
+
+class PreimageLog:
+    """
+    Append-only log of the values keys had when the running snapshot started.
+
+    The first frame is a token naming the snapshot; the rest are (key, value), value None for a
+    key that did not exist yet, and only a key's first change is logged. Writers append while
+    holding the exclusive lock and the snapshot reads under the shared lock, so every process
+    sees whole frames.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self.saved = 0
+        self.save_time = 0.0
+        self._offset = 0
+        self._token = None
+
+    def start(self):
+        """Begin an empty log for a new snapshot."""
+        with open(self.path, "wb") as f:
+            f.write(encode_frame(("snapshot", os.getpid(), time.time_ns())))
+
+    def refresh(self):
+        """Load the frames appended since the last call, possibly by other processes."""
+        if not os.path.exists(self.path):
+            self.values, self._offset, self._token = {}, 0, None
+            return self.values
+        with open(self.path, "rb") as f:
+            token = read_frame(f)
+            if token != self._token:  # Another snapshot's log
+                self.values, self._offset, self._token = {}, f.tell(), token
+            f.seek(self._offset)
+            while True:
+                frame = read_frame(f)
+                if frame is None:
+                    break
+                self.values.setdefault(frame[0], frame[1])
+                self._offset = f.tell()
+        return self.values
+
+    def save(self, db, key):
+        """Log a key's current value unless an earlier change already did."""
+        if key in self.values:
+            return
+        started = time.perf_counter()
+        value = db[key] if key in db else None
+        with open(self.path, "ab") as f:
+            f.write(encode_frame((key, value)))
+            self._offset = f.tell()
+        self.values[key] = value
+        self.saved += 1
+        self.save_time += time.perf_counter() - started
+
+
+class _PreimageRecorder:
+    """Stands in for a dbm handle during a write while a snapshot runs, logging values before they change."""
+
+    def __init__(self, db, log):
+        self.db = db
+        self.log = log
+
+    def _key(self, key):
+        return key.encode("utf-8") if isinstance(key, str) else bytes(key)
+
+    def __setitem__(self, key, value):
+        self.log.save(self.db, self._key(key))
+        self.db[key] = value
+
+    def __delitem__(self, key):
+        self.log.save(self.db, self._key(key))
+        del self.db[key]
+
+    def __getitem__(self, key):
+        return self.db[key]
+
+    def __contains__(self, key):
+        return key in self.db
+
+    def __iter__(self):
+        return iter(self.db.keys())
+
+    def __len__(self):
+        return len(self.db)
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+class _PoolEntry:
+    """Locks and bookkeeping for one pooled database file."""
+
+    def __init__(self, path):
+        self.lock = ReadWriteLock()
+        self.file_lock = FileLock(path)
+        self.guard = threading.Lock()
+        self.readers = 0  # In-process readers sharing the process's shared file lock
+        self.generation = None  # Last write generation this process has caught up with
+        self.preimages = PreimageLog(path + PREIMAGE_SUFFIX)
+
+
+class StoreHandlePool:
+    """
+    Process-wide pool that keeps one shelve handle per database file open for the life of the
+    worker instead of opening (and re-reading the .dir index) on every call.
+
+    Access is guarded twice: a reader/writer lock between threads and a shared/exclusive file
+    lock between processes. Readers never block each other in either. When another process has
+    written since this one last looked, the handle is reopened and the read cache dropped
+    before use, so a stale in-memory index is never read from or written back.
+    """
+
+    def __init__(self):
+        self._handles = {}
+        self._entries = {}
+        self._guard = threading.Lock()
+        self.opens = 0
+        self.closes = 0
+        self.checkouts = 0
+        self.reloads = 0
+
+    def _entry(self, db_name):
+        path = os.path.abspath(db_name)
+        with self._guard:
+            if path not in self._entries:
+                self._entries[path] = _PoolEntry(path)
+            self.checkouts += 1
+            return path, self._entries[path]
+
+    def _handle(self, path):
+        with self._guard:
+            shelf = self._handles.get(path)
+            if shelf is None:
+                finish_compaction(path)
+                shelf = shelve.open(path)
+                self._handles[path] = shelf
+                self.opens += 1
+            return shelf
+
+    def _catch_up(self, path, entry):
+        """Drop the handle and cache if another process wrote since we last held the lock."""
+        generation = entry.file_lock.generation()
+        if entry.generation is not None and generation != entry.generation:
+            with self._guard:
+                shelf = self._handles.pop(path, None)
+            if shelf is not None:
+                shelf.close()  # Nothing unsynced: our writes are synced before the lock is released
+                self.closes += 1
+            cache_for(path).clear()
+            self.reloads += 1
+        entry.generation = generation
+
+    @contextmanager
+    def shared(self, db_name):
+        """Hold the store's shared locks without borrowing its handle; yields the resolved path."""
+        path, entry = self._entry(db_name)
+        shared = entry.lock.acquire_read()
+        try:
+            if shared:
+                with entry.guard:
+                    if not entry.readers:
+                        entry.file_lock.acquire(exclusive=False)
+                        self._catch_up(path, entry)
+                    entry.readers += 1
+            try:
+                yield path
+            finally:
+                if shared:
+                    with entry.guard:
+                        entry.readers -= 1
+                        if not entry.readers:
+                            entry.file_lock.release()
+        finally:
+            entry.lock.release_read()
+
+    @contextmanager
+    def reading(self, db_name):
+        """Borrow the shared handle for reading; other readers are not blocked."""
+        with self.shared(db_name) as path:
+            yield self._handle(path)
+
+    @contextmanager
+    def writing(self, db_name):
+        """Borrow the shared handle exclusively; changes are synced to disk on release."""
+        path, entry = self._entry(db_name)
+        outermost = entry.lock.acquire_write()
+        try:
+            if outermost:
+                entry.file_lock.acquire(exclusive=True)
+                self._catch_up(path, entry)
+            try:
+                shelf = self._handle(path)
+                if outermost and os.path.exists(path + SNAPSHOT_MARKER_SUFFIX):
+                    shelf.dict = _PreimageRecorder(shelf.dict, entry.preimages)
+                    entry.preimages.refresh()
+                yield shelf
+            finally:
+                if outermost:
+                    try:
+                        if path in self._handles:
+                            if isinstance(shelf.dict, _PreimageRecorder):
+                                shelf.dict = shelf.dict.db
+                            shelf.sync()
+                            _mark_synced(shelf)
+                        entry.generation = entry.file_lock.bump()
+                    finally:
+                        entry.file_lock.release()
+        finally:
+            entry.lock.release_write()
+
+    def generation(self, db_name):
+        """Return the write generation this process last caught up with."""
+        return self._entry(db_name)[1].generation
+
+    def close(self, db_name=None):
+        """Close one pooled handle, or all of them."""
+        paths = [os.path.abspath(db_name)] if db_name else list(self._handles)
+        for path in paths:
+            entry = self._entries.get(path)
+            if entry is None:
+                continue
+            entry.lock.acquire_write()
+            try:
+                shelf = self._handles.pop(path, None)
+                if shelf is not None:
+                    shelf.close()
+                    self.closes += 1
+            finally:
+                entry.lock.release_write()
+
+    def stats(self):
+        """Report handle usage, including how many opens and closes pooling saved, and lock waits."""
+        return {
+            "open_handles": len(self._handles),
+            "opens": self.opens,
+            "closes": self.closes,
+            "checkouts": self.checkouts,
+            "saved_opens": self.checkouts - self.opens,
+            "saved_closes": self.checkouts - self.closes,
+            "reloads": self.reloads,
+            "snapshot_preimages": {
+                path: {"saved": entry.preimages.saved, "save_ms": round(entry.preimages.save_time * 1000, 3)}
+                for path, entry in list(self._entries.items())
+            },
+            "locks": {
+                path: {
+                    "thread_read": entry.lock.read_waits.as_dict(),
+                    "thread_write": entry.lock.write_waits.as_dict(),
+                    "process_shared": entry.file_lock.shared_waits.as_dict(),
+                    "process_exclusive": entry.file_lock.exclusive_waits.as_dict(),
+                }
+                for path, entry in list(self._entries.items())
+            },
+        }
+
+
+STORE_POOL = StoreHandlePool()
+atexit.register(STORE_POOL.close)
+
+
+class RecordCache:
+    """
+    Bounded LRU cache of pickled records and assembled tables.
+
+    Every entry is tagged with the write version of its table when it is filled. Writes bump
+    the table's version, so stale entries are simply never served again and age out of the
+    LRU. A table's ID list has a version of its own, bumped only when records are added or
+    removed, so changing a value does not force the next listing to rescan the keyspace.
+    Values are cached as pickled bytes, which keeps them immutable and lets the size bound
+    be measured in bytes.
+    """
+
+    def __init__(self, max_bytes=RECORD_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.versions = defaultdict(int)
+        self.id_versions = defaultdict(int)
+        self.write_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _version(self, table, kind):
+        return (self.id_versions if kind == "ids" else self.versions)[table]
+
+    def get(self, table, kind, record_id=None):
+        """Return the cached bytes for an entry, or None on a miss."""
+        key = (table, kind, record_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != self._version(table, kind):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, table, kind, record_id, data):
+        """Cache the pickled bytes for an entry, evicting the least recently used ones."""
+        key = (table, kind, record_id)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = (self._version(table, kind), data)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def bump(self, table, ids=False):
+        """Invalidate the cached records of a table, and its ID list too if `ids` (records were added or removed)."""
+        with self._lock:
+            self.versions[table] += 1
+            if ids:
+                self.id_versions[table] += 1
+            self.write_version += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Report hit/miss counters and current size for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "write_version": self.write_version,
+        }
+
+
+_CACHES = {}
+_CACHES_GUARD = threading.Lock()
+
+
+def cache_for(db_name):
+    """Return the process-wide record cache for a database file."""
+    path = os.path.abspath(db_name)
+    with _CACHES_GUARD:
+        if path not in _CACHES:
+            _CACHES[path] = RecordCache()
+        return _CACHES[path]
+
+
+class RecordStore:
+    """Record-level access to a shelf that uses the per-record keyspace layout."""
+
+    def __init__(self, shelf, cache=None):
+        self.shelf = shelf
+        self.cache = cache
+        self._pending = None  # (postings table, key) -> IDs, while put_many defers posting writes
+
+    def _read(self, table, record_id):
+        """Return the pickled bytes of one stored record, or None if it does not exist."""
+        if self.cache is not None:
+            data = self.cache.get(table, "record", record_id)
+            if data is not None:
+                return data
+        key = record_key(table, record_id).encode(self.shelf.keyencoding)
+        if key not in self.shelf.dict:
+            return None
+        data = CODEC.unwrap(self.shelf.dict[key])
+        if self.cache is not None:
+            self.cache.put(table, "record", record_id, data)
+        return data
+
+    def _changed(self, table, ids=False):
+        """Bump the cache version of a table and of any table that embeds it (see RecordCache.bump)."""
+        if self.cache is None:
+            return
+        self.cache.bump(table, ids)
+        for parent, (_, split_table) in SPLIT_FIELDS.items():
+            if split_table == table:
+                self.cache.bump(parent)
+
+    def get(self, table, record_id, default=None):
+        """Return one record, or `default` if it does not exist."""
+        data = self._read(table, record_id)
+        if data is None:
+            return default
+        record = as_record(table, pickle.loads(data))
+        split = SPLIT_FIELDS.get(table)
+        if split and isinstance(record, dict):
+            field, split_table = split
+            record[field] = self.get(split_table, record_id, [])
+        return record
+
+    def put(self, table, record_id, record):
+        """Write one record."""
+        split = SPLIT_FIELDS.get(table)
+        if split and isinstance(record, dict) and split[0] in record:
+            field, split_table = split
+            record = dict(record)
+            self.put(split_table, record_id, record.pop(field))
+        record = as_record(table, record)
+        if table in INDEXED_FIELDS or table in SEARCH_FIELDS:
+            self._reindex(table, record_id, self.get(table, record_id), record)
+        key = record_key(table, record_id).encode(self.shelf.keyencoding)
+        inserted = key not in self.shelf.dict
+        self.shelf.dict[key] = CODEC.encode(pack_record(table, record))
+        self._changed(table, ids=inserted)
+
+    def extend(self, table, record_id, items):
+        """Append elements to a record list; returns the list's previous length (see truncate)."""
+        current = self.get(table, record_id, [])
+        self.put(table, record_id, current + list(items))
+        return len(current)
+
+    def truncate(self, table, record_id, length):
+        """Cut a record list back to its first `length` elements, removing it when none are left (undoes extend)."""
+        if length:
+            self.put(table, record_id, self.get(table, record_id, [])[:length])
+        else:
+            self.delete(table, record_id)
+
+    def put_many(self, table, records):
+        """
+        Write many records of one table, rewriting each index posting list they touch only once.
+
+        :param records: {record_id: record}
+        """
+        self._pending = {}
+        try:
+            for record_id, record in records.items():
+                self.put(table, record_id, record)
+        finally:
+            pending, self._pending = self._pending, None
+            for (postings_table, key), ids in pending.items():
+                if ids:
+                    self.put(postings_table, key, ids)
+                else:
+                    self.delete(postings_table, key)
+
+    def delete(self, table, record_id):
+        """Remove one record (and any split-out fields)."""
+        key = record_key(table, record_id)
+        if key in self.shelf:
+            if table in INDEXED_FIELDS or table in SEARCH_FIELDS:
+                self._reindex(table, record_id, self.get(table, record_id), None)
+            del self.shelf[key]
+            self._changed(table, ids=True)
+        split = SPLIT_FIELDS.get(table)
+        if split:
+            self.delete(split[1], record_id)
+
+    def _reindex(self, table, record_id, old, new):
+        """Move a record between index entries for every indexed field whose value changed."""
+        before, after = index_values(table, old), index_values(table, new)
+        for field in INDEXED_FIELDS.get(table, ()):
+            if before.get(field) == after.get(field):
+                continue
+            postings_table = index_table(table, field)
+            if field in before:
+                self._unpost(postings_table, before[field], record_id)
+            if field in after:
+                self._post(postings_table, after[field], record_id)
+
+        if table in SEARCH_FIELDS:
+            old_grams, new_grams = record_grams(table, old), record_grams(table, new)
+            block = block_of(record_id)
+            grams_table, blocks_table = index_table(table, SEARCH_GRAMS), index_table(table, SEARCH_GRAM_BLOCKS)
+            for gram in old_grams - new_grams:
+                if not self._unpost(grams_table, f"{gram}{KEY_SEPARATOR}{block}", record_id):
+                    self._unpost(blocks_table, gram, block)
+            for gram in new_grams - old_grams:
+                if self._post(grams_table, f"{gram}{KEY_SEPARATOR}{block}", record_id) == 1:
+                    self._post(blocks_table, gram, block)
+
+    def _postings(self, postings_table, key):
+        """Return a posting list, from the lists put_many holds back if it is running."""
+        if self._pending is None:
+            return self.get(postings_table, key, [])
+        if (postings_table, key) not in self._pending:
+            self._pending[(postings_table, key)] = self.get(postings_table, key, [])
+        return self._pending[(postings_table, key)]
+
+    def _post(self, postings_table, key, record_id):
+        """Add an ID to a sorted posting list; returns the new length of the list."""
+        ids = self._postings(postings_table, key)
+        position = bisect.bisect_left(ids, record_id)
+        if position == len(ids) or ids[position] != record_id:
+            ids.insert(position, record_id)
+            if self._pending is None:
+                self.put(postings_table, key, ids)
+        return len(ids)
+
+    def _unpost(self, postings_table, key, record_id):
+        """Remove an ID from a posting list, dropping the list once empty; returns the new length."""
+        ids = self._postings(postings_table, key)
+        ids[:] = [i for i in ids if i != record_id]
+        if self._pending is None:
+            if ids:
+                self.put(postings_table, key, ids)
+            else:
+                self.delete(postings_table, key)
+        return len(ids)
+
+    def find(self, table, **fields):
+        """
+        Return {record_id: record} for the records whose indexed fields equal the given values.
+
+        :param fields: Field/value pairs, e.g. farmer_id="farmer1"; only indexed fields are accepted
+        """
+        if not fields:
+            return self.load_table(table)
+        return {record_id: self.get(table, record_id) for record_id in self.find_ids(table, **fields)}
+
+    def find_ids(self, table, **fields):
+        """Like find, but return only the sorted IDs of the matching records."""
+        matches = None
+        for field, value in fields.items():
+            if field not in INDEXED_FIELDS.get(table, {}):
+                raise ValueError(f"{table} has no index on {field}")
+            ids = self.get(index_table(table, field), INDEXED_FIELDS[table][field](value), [])
+            if matches is not None:
+                wanted = set(ids)
+                ids = [record_id for record_id in matches if record_id in wanted]
+            matches = ids
+        return sorted(self.ids(table)) if matches is None else matches
+
+    def search(self, table, query, limit=SEARCH_LIMIT):
+        """
+        Find records whose searched fields contain the query, tolerating typos.
+
+        Only the posting lists of the query's trigrams are read, so the cost follows the number
+        of matches rather than the size of the table.
+
+        :return: [(record_id, record), ...] ordered by relevance
+        """
+        grams_table, blocks_table = index_table(table, SEARCH_GRAMS), index_table(table, SEARCH_GRAM_BLOCKS)
+        hits = defaultdict(int)
+        for gram in query_grams(query):
+            for block in self.get(blocks_table, gram, []):
+                for record_id in self.get(grams_table, f"{gram}{KEY_SEPARATOR}{block}", []):
+                    hits[record_id] += 1
+        return rank(table, query, hits, lambda record_id: self.get(table, record_id), limit)
+
+    def rebuild_indexes(self):
+        """Recompute every secondary and search index from the records themselves."""
+        for table in set(INDEXED_FIELDS) | set(SEARCH_FIELDS):
+            fields = list(INDEXED_FIELDS.get(table, ()))
+            if table in SEARCH_FIELDS:
+                fields += [SEARCH_GRAMS, SEARCH_GRAM_BLOCKS]
+            prefixes = tuple(index_table(table, field) + KEY_SEPARATOR for field in fields)
+            for key in [key for key in self.shelf.keys() if key.startswith(prefixes)]:
+                del self.shelf[key]
+            for field in fields:
+                self._changed(index_table(table, field), ids=True)
+
+            postings = defaultdict(list)
+            for record_id in sorted(self.ids(table)):
+                record = self.get(table, record_id)
+                for field, value in index_values(table, record).items():
+                    postings[(field, value)].append(record_id)
+                if table in SEARCH_FIELDS:
+                    block = block_of(record_id)
+                    for gram in record_grams(table, record):
+                        postings[(SEARCH_GRAMS, f"{gram}{KEY_SEPARATOR}{block}")].append(record_id)
+                        blocks = postings[(SEARCH_GRAM_BLOCKS, gram)]
+                        if not blocks or blocks[-1] != block:
+                            blocks.append(block)
+            for (field, value), ids in postings.items():
+                self.put(index_table(table, field), value, ids)
+
+    def ids(self, table):
+        """List the IDs of every record in a table."""
+        if self.cache is not None:
+            data = self.cache.get(table, "ids")
+            if data is not None:
+                return pickle.loads(data)
+        ids = []
+        for key in self.shelf.keys():
+            parsed = parse_record_key(key)
+            if parsed and parsed[0] == table:
+                ids.append(parsed[1])
+        if self.cache is not None:
+            self.cache.put(table, "ids", None, pickle.dumps(ids, pickle.HIGHEST_PROTOCOL))
+        return ids
+
+    def has_table(self, table):
+        """Check whether a table has at least one record."""
+        return bool(self.ids(table))
+
+    def get_meta(self, key, default=None):
+        """Read a store-level marker such as a schema version."""
+        data = self.shelf.dict.get(key.encode(self.shelf.keyencoding))
+        return default if data is None else CODEC.decode(data)
+
+    def set_meta(self, key, value):
+        self.shelf.dict[key.encode(self.shelf.keyencoding)] = CODEC.encode(value)
+
+    def load_table(self, table):
+        """Assemble a whole table as the legacy {record_id: record} dict."""
+        if self.cache is not None:
+            data = self.cache.get(table, "table")
+            if data is not None:
+                return pickle.loads(data)
+        records = {record_id: self.get(table, record_id) for record_id in self.ids(table)}
+        if self.cache is not None:
+            self.cache.put(table, "table", None, pickle.dumps(records, pickle.HIGHEST_PROTOCOL))
+        return records
+
+    def save_table(self, table, records):
+        """Write back a whole table, touching only the records that changed."""
+        existing = set(self.ids(table))
+        for record_id, record in records.items():
+            if record_id not in existing or self.get(table, record_id) != record:
+                self.put(table, record_id, record)
+        for record_id in existing - set(records):
+            self.delete(table, record_id)
+
+    def page(self, table, record_id, before=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Return one page of a record list (see PAGED_LISTS), newest first.
+
+        :param before: Cursor returned with the previous page
+        :return: ([element, ...], cursor of the next page or None on the last one)
+        """
+        cursor_field, date_field = PAGED_LISTS[table]
+        items = self.get(table, record_id, [])
+        if before is not None:
+            items = [item for item in items if item.get(cursor_field) is not None and item[cursor_field] < before]
+        return select_page(((item.get(cursor_field), item.get(date_field) or "", item) for item in reversed(items)),
+                           limit, since, until)
+
+
+class TableView:
+    """
+    Dict-of-tables view over a RecordStore for code that works on whole tables.
+
+    Behaves like the old `shelve.open(...)` handle: `db["users"]` returns the full table and,
+    with `writeback=True`, tables that were read or assigned are written back on close. Only
+    records that actually changed are rewritten.
+    """
+
+    def __init__(self, store, writeback=False):
+        self.store = store
+        self.writeback = writeback
+        self._tables = {}
+
+    def __getitem__(self, table):
+        if table not in self._tables:
+            if table not in RECORD_TABLES and not self.store.has_table(table):
+                raise KeyError(table)
+            self._tables[table] = self.store.load_table(table)
+        return self._tables[table]
+
+    def __setitem__(self, table, records):
+        self._tables[table] = records
+
+    def __contains__(self, table):
+        return table in self._tables or self.store.has_table(table)
+
+    def get(self, table, default=None):
+        if table in RECORD_TABLES or table in self:
+            return self[table]
+        return default
+
+    def setdefault(self, table, default=None):
+        if table not in self:
+            self[table] = default if default is not None else {}
+        return self[table]
+
+    def sync(self):
+        """Write the tables this view has touched back to the store."""
+        for table, records in self._tables.items():
+            self.store.save_table(table, records)
+
+
+class UnitOfWork:
+    """
+    Batches record reads and writes across tables and applies them in one commit.
+
+    Records are read through an identity map, so getting the same record twice returns the same
+    object and in-place changes are picked up at commit time. Nothing touches the store until
+    commit(); rollback() simply discards the staged changes. Journal events are held back until
+    the records are written, so a failed commit leaves neither in place.
+    """
+
+    def __init__(self, store, journal):
+        self.store = store
+        self.journal = journal
+        self._loaded = {}  # (table, record_id) -> (record, pickled original or None)
+        self._deleted = set()
+        self._extended = []  # (table, record_id, elements appended to the record list)
+        self._events = []
+
+    def get(self, table, record_id, default=None):
+        """Return one record (tracked for commit), or `default` if it does not exist."""
+        key = (table, record_id)
+        if key in self._deleted:
+            return default
+        if key not in self._loaded:
+            record = self.store.get(table, record_id)
+            if record is None:
+                return default
+            self._loaded[key] = (record, pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+        return self._loaded[key][0]
+
+    def put(self, table, record_id, record):
+        """Stage a new or replaced record."""
+        key = (table, record_id)
+        self._deleted.discard(key)
+        self._loaded[key] = (record, None)  # No original to compare against: always written
+
+    def delete(self, table, record_id):
+        """Stage the removal of a record."""
+        self._loaded.pop((table, record_id), None)
+        self._deleted.add((table, record_id))
+
+    def extend(self, table, record_id, items):
+        """
+        Stage elements to append to a record list such as a farmer's orders.
+
+        The list is not read: at commit the backend appends the elements (SQLite inserts just their
+        rows). Unless the list was already read through get(), the elements only show up after commit.
+        """
+        key = (table, record_id)
+        if key in self._loaded and key not in self._deleted:
+            self._loaded[key][0].extend(items)
+        else:
+            self._extended.append((table, record_id, list(items)))
+
+    def ids(self, table):
+        """List the IDs of a table, including staged additions and removals."""
+        ids = [record_id for record_id in self.store.ids(table) if (table, record_id) not in self._deleted]
+        known = set(ids)
+        ids.extend(record_id for (t, record_id) in self._loaded if t == table and record_id not in known)
+        return ids
+
+    def records(self, table):
+        """Return a whole table as {record_id: record}; every record is tracked for commit."""
+        return {record_id: self.get(table, record_id) for record_id in self.ids(table)}
+
+    def allocate_ids(self, entity, count=1):
+        """Reserve IDs from an entity's sequence (see allocate_ids); they are not returned on rollback."""
+        return allocate_ids(self.store, entity, count)
+
+    def add_transaction(self, user_id, product_name, amount, quantity, kind="purchase"):
+        """Stage a purchase, redemption or refund for the user's transaction history."""
+        self._events.append((kind, user_id, transaction_record(product_name, amount, quantity, kind)))
+
+    def add_transactions(self, user_id, items, kind="purchase"):
+        """Stage one transaction per cart line."""
+        for item in items:
+            self.add_transaction(user_id, item["name"], item["price"] * item["quantity"], item["quantity"], kind)
+
+    def add_return(self, user_id, product_name, reason):
+        """Stage a return request for the user's return history."""
+        self._events.append(("return", user_id, return_record(product_name, reason)))
+
+    def _changes(self):
+        for (table, record_id), (record, original) in self._loaded.items():
+            if original is None or pickle.dumps(record, pickle.HIGHEST_PROTOCOL) != original:
+                yield table, record_id, record
+
+    def commit(self):
+        """
+        Write every changed record and staged event.
+
+        :return: Number of records written or deleted
+        """
+        writes = list(self._changes())
+        undo, extended = [], []
+        try:
+            for table, record_id, record in writes:
+                undo.append((table, record_id, self.store.get(table, record_id)))
+                self.store.put(table, record_id, record)
+            for table, record_id in self._deleted:
+                undo.append((table, record_id, self.store.get(table, record_id)))
+                self.store.delete(table, record_id)
+            for table, record_id, items in self._extended:
+                extended.append((table, record_id, self.store.extend(table, record_id, items)))
+            if self._events:
+                self.journal.append_many(self._events)
+        except Exception:
+            for table, record_id, length in reversed(extended):
+                self.store.truncate(table, record_id, length)
+            for table, record_id, previous in reversed(undo):  # Put back what was already written
+                if previous is None:
+                    self.store.delete(table, record_id)
+                else:
+                    self.store.put(table, record_id, previous)
+            raise
+        finally:
+            self.rollback()
+        return len(undo) + len(extended)
+
+    def rollback(self):
+        """Discard everything staged so far."""
+        self._loaded.clear()
+        self._deleted.clear()
+        self._extended.clear()
+        self._events.clear()
+
+
+def migrate_to_record_layout(db_name=DATABASE_FILE):
+    """
+    Convert a database that stores whole tables under single keys to the per-record layout.
+
+    Safe to run repeatedly: tables are split one at a time and the layout marker is only
+    written once every table has been converted.
+
+    :param db_name: Path of the shelve database to convert in place
+    :return: Number of records written, or 0 if the database was already converted
+    """
+    with STORE_POOL.writing(db_name) as shelf:
+        if shelf.get(LAYOUT_KEY) == RECORD_LAYOUT_VERSION:
+            return 0
+
+        store = RecordStore(shelf, cache_for(db_name))
+        migrated = 0
+        for table in RECORD_TABLES:
+            if table not in shelf:
+                continue
+            records = shelf[table]
+            if isinstance(records, dict):
+                for record_id, record in records.items():
+                    store.put(table, record_id, record)
+                    migrated += 1
+            del shelf[table]
+
+        shelf[LAYOUT_KEY] = RECORD_LAYOUT_VERSION
+
+    if migrated:
+        print(f"Migrated {migrated} records to the per-record layout.")
+    return migrated
+
+
+def normalize_product(product):
+    """Return a copy of a product with the fields every stored product must have."""
+    product = dict(product)
+    if product.get("farmer_id") is None:
+        product["farmer_id"] = product.get("uploaded_by") or "unknown_farmer"
+    if not product.get("image_url") or product["image_url"] == "placeholder.png":
+        product["image_url"] = PLACEHOLDER_IMAGE
+    product.setdefault("nutritional_facts", "")
+    return product
+
+
+def normalize_discounted_item(item):
+    """Return a copy of a discounted item with a clean expiry date string."""
+    item = dict(item)
+    item["expiry_date"] = (item.get("expiry_date") or "").strip()
+    return item
+
+
+def is_expired(item, today):
+    """Check a discounted item against today's "YYYY-MM-DD" date; items without a valid date never expire."""
+    try:
+        datetime.strptime(item.get("expiry_date", ""), "%Y-%m-%d")
+    except ValueError:
+        return False
+    return item["expiry_date"] < today
+
+
+def add_owned_product(ownership, product_id, quantity=1, when=None):
+    """
+    Count units of a product as acquired (bought or redeemed) in an ownership record.
+
+    :param when: "YYYY-MM-DD HH:MM:SS" of the acquisition, now by default
+    :return: The product's counter
+    """
+    when = when or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    counter = ownership.setdefault("products", {}).setdefault(
+        product_id, {"quantity": 0, "returned": 0, "first_acquired": when, "last_acquired": when})
+    counter["quantity"] += quantity
+    counter["last_acquired"] = when
+    return counter
+
+
+def returnable_quantity(ownership, product_id):
+    """Units of a product that were acquired and not returned yet."""
+    counter = ownership.get("products", {}).get(product_id)
+    return counter["quantity"] - counter["returned"] if counter else 0
+
+
+def return_owned_product(ownership, product_id, quantity):
+    """Count units of a product as returned; raises ValueError if fewer are left to return."""
+    if quantity <= 0 or quantity > returnable_quantity(ownership, product_id):
+        raise ValueError(f"Cannot return {quantity} of product {product_id}.")
+    ownership["products"][product_id]["returned"] += quantity
+
+
+def active_holds(holds, now=None):
+    """Return the unexpired entries of a product's holds record as a new dict."""
+    now = time.time() if now is None else now
+    return {user_id: hold for user_id, hold in (holds or {}).items() if hold[1] > now}
+
+
+def available_quantity(product, holds, user_id=None, now=None):
+    """Stock of a product not held by other customers' carts; the user's own hold counts as available."""
+    held = sum(quantity for holder, (quantity, _) in active_holds(holds, now).items() if holder != user_id)
+    return max((product.get("quantity") or 0) - held, 0)
+
+
+def _save_holds(store, product_id, stored, holds):
+    """
+    Write a product's holds record if it changed.
+
+    An emptied record is kept as {} and removed by the next sweep (see sweep_expired_holds):
+    a dbm.dumb delete rewrites the store's whole index, which a checkout would otherwise pay once per line.
+    """
+    if holds != (stored or {}):
+        store.put(HOLDS, product_id, holds)
+
+
+def set_hold(store, user_id, product_id, quantity, ttl=HOLD_TTL, now=None):
+    """
+    Set a customer's hold on a product to `quantity` for `ttl` seconds; 0 releases it.
+
+    Works on a record store or a transaction. Expired holds of the product are dropped on the way.
+
+    :return: Stock of the product available to the customer (at least `quantity`)
+    :raise ValueError: If the product does not exist or too little of it is available
+    """
+    now = time.time() if now is None else now
+    stored = store.get(HOLDS, product_id)
+    holds = active_holds(stored, now)
+    if quantity <= 0:
+        holds.pop(user_id, None)
+        _save_holds(store, product_id, stored, holds)
+        return 0
+
+    product = store.get("products", product_id)
+    if product is None:
+        raise ValueError("Product not found.")
+    available = available_quantity(product, holds, user_id, now)
+    if available < quantity:
+        raise ValueError(f"Only {available} of '{product['name']}' available.")
+    holds[user_id] = [quantity, now + ttl]
+    _save_holds(store, product_id, stored, holds)
+    return available
+
+
+def take_held_stock(tx, user_id, items, now=None):
+    """
+    Turn a customer's holds on bought items into stock decrements, inside a transaction.
+
+    Items whose hold has expired (or was never placed) are taken from unheld stock if enough is left.
+
+    :param items: Cart lines [{"id", "name", "quantity"}, ...]
+    :raise ValueError: Naming the first item with too little stock; the transaction then writes nothing
+    """
+    for item in items:
+        product = tx.get("products", item["id"])
+        stored = tx.get(HOLDS, item["id"])
+        holds = active_holds(stored, now)
+        if product is None or available_quantity(product, holds, user_id, now) < item["quantity"]:
+            raise ValueError(f"Sorry, '{item['name']}' no longer has {item['quantity']} in stock.")
+        product["quantity"] -= item["quantity"]
+        holds.pop(user_id, None)
+        _save_holds(tx, item["id"], stored, holds)
+
+
+def cart_lines(store, cart):
+    """
+    Resolve a cart's entries against the catalog, on a record store or a transaction.
+
+    :return: [{"id", "name", "price", "quantity"}, ...], discounted items with "discounted": True;
+        entries whose product or item no longer exists are left out
+    """
+    lines = []
+    for table, entries in (("products", cart.lines), ("discounted_items", cart.discounted)):
+        for item_id, quantity in entries.items():
+            item = store.get(table, item_id)
+            if item is None:
+                continue
+            line = {"id": item_id, "name": item["name"], "price": item["price"], "quantity": quantity}
+            if table == "discounted_items":
+                line["discounted"] = True
+            lines.append(line)
+    return lines
+
+
+def add_discounted_line(store, user_id, item_id, quantity, amount):
+    """Record a bought discounted item and the amount charged for it in a customer's cart, on a record store or a transaction."""
+    cart = store.get(CARTS, user_id) or Cart()
+    cart.discounted[item_id] = cart.discounted.get(item_id, 0) + quantity
+    cart.paid[item_id] = round(cart.paid.get(item_id, 0) + amount, 2)
+    cart.touched = time.time()
+    store.put(CARTS, user_id, cart)
+
+
+def refund_discounted_line(tx, user_id, cart, item_id):
+    """
+    Take a paid discounted line out of a cart, inside a transaction: the amount charged goes back
+    to the balance, the quantity back to the item's stock, and the refund is logged.
+
+    :return: The removed quantity
+    """
+    quantity = cart.discounted.pop(item_id)
+    item = tx.get("discounted_items", item_id)
+    amount = cart.paid.pop(item_id, None)
+    if amount is None:  # Bought before carts kept the amount charged
+        amount = round(item["price"] * quantity, 2) if item else 0
+    if item:
+        item["stock"] += quantity
+    user = tx.get("users", user_id)
+    if user:
+        user["balance"] = round(user.get("balance", 0) + amount, 2)
+    tx.add_transaction(user_id, item["name"] if item else f"Discounted item {item_id}", -amount, -quantity,
+                       kind="refund")
+    return quantity
+
+
+def cart_total(items):
+    """Total price of cart lines still to be paid, rounded to cents (discounted lines are paid when added)."""
+    return round(sum(item["price"] * item["quantity"] for item in items if not item.get("discounted")), 2)
+
+
+def add_farmer_orders(tx, buyer_name, items):
+    """
+    Stage one order per cart line under the farmer selling it, inside a transaction.
+
+    The order IDs are allocated in one go, and each farmer's new orders are appended to their
+    list in one step however many of their items were bought. An order's price is the line total.
+
+    :return: Number of orders staged
+    """
+    sellers = []
+    for item in items:
+        table = "discounted_items" if item.get("discounted") else "products"
+        owner_field = BULK_UPDATE_TABLES[table][0]
+        farmer_id = (tx.get(table, item["id"]) or {}).get(owner_field)
+        if farmer_id:
+            sellers.append((farmer_id, item))
+    if not sellers:
+        return 0
+
+    created_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    orders = defaultdict(list)
+    for order_id, (farmer_id, item) in zip(tx.allocate_ids("orders", len(sellers)), sellers):
+        orders[farmer_id].append(Order(order_id, farmer_id, buyer_name, item["name"], item["quantity"],
+                                       round(item["price"] * item["quantity"], 2), created_at=created_at))
+    for farmer_id, farmer_orders in orders.items():
+        tx.extend("orders", farmer_id, farmer_orders)  # Appended without reading the farmer's history
+    return len(sellers)
+
+
+class CheckoutStats:
+    """Counts checkouts and the time spent in each of their stages (see CHECKOUT_STAGES)."""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total = dict.fromkeys(CHECKOUT_STAGES, 0.0)
+        self.max = dict.fromkeys(CHECKOUT_STAGES, 0.0)
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        """Add one checkout's {stage: ms}."""
+        with self._lock:
+            self.checkouts += 1
+            for stage, ms in timings.items():
+                self.total[stage] += ms
+                self.max[stage] = max(self.max[stage], ms)
+
+    def as_dict(self):
+        return {
+            "checkouts": self.checkouts,
+            "stages": {
+                stage: {
+                    "avg_ms": round(self.total[stage] / self.checkouts, 3) if self.checkouts else 0.0,
+                    "max_ms": round(self.max[stage], 3),
+                }
+                for stage in CHECKOUT_STAGES
+            },
+        }
+
+
+CHECKOUT_STATS = CheckoutStats()
+
+
+def normalize_ownership(ownership):
+    """
+    Convert a legacy ownership record (one "products" entry per unit, returns counted in a
+    separate "returns" dict) to per-product counters. Records already converted are returned as is.
+    """
+    products = ownership.get("products", {})
+    if isinstance(products, dict) and "returns" not in ownership:
+        return ownership
+
+    ownership = dict(ownership)
+    counters = {product_id: dict(counter) for product_id, counter in products.items()} if isinstance(
+        products, dict) else {}
+    blank = {"quantity": 0, "returned": 0, "first_acquired": None, "last_acquired": None}  # No dates were kept
+    if isinstance(products, list):
+        for product_id in products:
+            counters.setdefault(product_id, dict(blank))["quantity"] += 1
+    for product_id, returned in (ownership.pop("returns", None) or {}).items():
+        counters.setdefault(product_id, dict(blank))["returned"] += returned
+    ownership["products"] = counters
+    return ownership
+
+
+def migrate_catalog(db_name=DATABASE_FILE):
+    """
+    Normalize legacy product and discounted-item records once, so catalog reads never have to.
+
+    :param db_name: Path of the database
+    :return: Number of records rewritten, or 0 if the catalog is already at the current version
+    """
+    with backend_for(db_name).writing() as store:
+        if store.get_meta(CATALOG_VERSION_KEY, 0) >= CATALOG_SCHEMA_VERSION:
+            return 0
+
+        fixed = 0
+        for table, normalize in (("products", normalize_product), ("discounted_items", normalize_discounted_item)):
+            for record_id, record in store.load_table(table).items():
+                normalized = normalize(record)
+                if normalized != record:
+                    store.put(table, record_id, normalized)
+                    fixed += 1
+
+        store.set_meta(CATALOG_VERSION_KEY, CATALOG_SCHEMA_VERSION)
+
+    if fixed:
+        print(f"Normalized {fixed} catalog records.")
+    return fixed
+
+
+def migrate_ownership(db_name=DATABASE_FILE):
+    """
+    Convert every ownership record to per-product counters once (see normalize_ownership).
+
+    :param db_name: Path of the database
+    :return: Number of ownership records rewritten
+    """
+    with backend_for(db_name).writing() as store:
+        if store.get_meta(OWNERSHIP_VERSION_KEY, 0) >= OWNERSHIP_SCHEMA_VERSION:
+            return 0
+
+        converted = 0
+        for user_id in store.ids("ownership"):
+            ownership = store.get("ownership", user_id)
+            normalized = normalize_ownership(ownership) if isinstance(ownership, dict) else ownership
+            if normalized is not ownership:
+                store.put("ownership", user_id, normalized)
+                converted += 1
+
+        store.set_meta(OWNERSHIP_VERSION_KEY, OWNERSHIP_SCHEMA_VERSION)
+
+    if converted:
+        print(f"Converted {converted} ownership records to product counters.")
+    return converted
+
+
+def migrate_records(db_name=DATABASE_FILE):
+    """
+    Repack products, users, trees, IoT devices and orders stored as legacy dicts once (see
+    records.py). Reads convert legacy values on the fly, so this only saves that work and the space.
+
+    :param db_name: Path of the database
+    :return: Number of stored values rewritten
+    """
+    with backend_for(db_name).writing() as store:
+        if store.get_meta(RECORDS_VERSION_KEY, 0) >= RECORDS_SCHEMA_VERSION:
+            return 0
+
+        converted = 0
+        for table in RECORD_CLASSES:
+            for record_id, record in store.load_table(table).items():
+                store.put(table, record_id, record)  # Written back packed
+                converted += 1
+
+        store.set_meta(RECORDS_VERSION_KEY, RECORDS_SCHEMA_VERSION)
+
+    if converted:
+        print(f"Repacked {converted} stored records.")
+    return converted
+
+
+def migrate_indexes(db_name=DATABASE_FILE):
+    """
+    Build the secondary indexes of existing records once; writes keep them current afterwards.
+
+    :param db_name: Path of the database
+    :return: True if the indexes were rebuilt
+    """
+    with backend_for(db_name).writing() as store:
+        if store.get_meta(INDEX_VERSION_KEY, 0) >= INDEX_SCHEMA_VERSION:
+            return False
+        store.rebuild_indexes()
+        store.set_meta(INDEX_VERSION_KEY, INDEX_SCHEMA_VERSION)
+    print("Rebuilt secondary indexes.")
+    return True
+
+
+def allocate_ids(store, entity, count=1):
+    """
+    Reserve the next `count` IDs of an entity with a single counter write.
+
+    IDs are never handed out twice, even after deletions or a rolled back transaction.
+
+    :param store: Record store open for writing
+    :param entity: One of SEQUENCE_ENTITIES
+    :param count: Size of the block to reserve (bulk inserts take one block)
+    :return: range of the reserved IDs
+    """
+    key = f"{SEQUENCE_PREFIX}{KEY_SEPARATOR}{entity}"
+    last = store.get_meta(key, 0)
+    store.set_meta(key, last + count)
+    return range(last + 1, last + count + 1)
+
+
+def _tree_number(tree):
+    """Numeric part of a "tree_<n>" ID, or 0."""
+    suffix = str(tree.get("id") or "").rpartition("_")[2] if isinstance(tree, Mapping) else ""
+    return int(suffix) if suffix.isdigit() else 0
+
+
+def repair_sequences(store):
+    """
+    Move every sequence past the highest ID already in use, e.g. after records were written
+    with explicit IDs or the store was imported.
+
+    :return: {entity: new last ID} for the sequences that were moved
+    """
+    in_use = {
+        "products": max(store.ids("products"), default=0),
+        "discounted_items": max(store.ids("discounted_items"), default=0),
+        "reports": max((i for i in store.ids("reports") if isinstance(i, int)), default=0),
+        "orders": max((order.get("order_id") or 0 for orders in store.load_table("orders").values()
+                       for order in orders), default=0),
+        "trees": max((_tree_number(tree) for trees in store.load_table("trees").values()
+                      for tree in trees), default=0),
+    }
+    repaired = {}
+    for entity, highest in in_use.items():
+        key = f"{SEQUENCE_PREFIX}{KEY_SEPARATOR}{entity}"
+        if store.get_meta(key, 0) < highest:
+            store.set_meta(key, highest)
+            repaired[entity] = highest
+    return repaired
+
+
+def migrate_sequences(db_name=DATABASE_FILE):
+    """
+    Seed the ID sequences from existing data once.
+
+    :param db_name: Path of the database
+    :return: {entity: last ID} for the sequences that were seeded
+    """
+    with backend_for(db_name).writing() as store:
+        if store.get_meta(SEQUENCES_VERSION_KEY, 0) >= SEQUENCES_SCHEMA_VERSION:
+            return {}
+        repaired = repair_sequences(store)
+        store.set_meta(SEQUENCES_VERSION_KEY, SEQUENCES_SCHEMA_VERSION)
+    if repaired:
+        print(f"Seeded ID sequences: {repaired}")
+    return repaired
+
+
+_JOURNALS = {}
+_ARCHIVES = {}
+
+
+def journal_for(db_name):
+    """Return the process-wide transaction journal for a database file."""
+    path = os.path.abspath(db_name)
+    with _CACHES_GUARD:
+        if path not in _JOURNALS:
+            _JOURNALS[path] = TransactionJournal(path + JOURNAL_SUFFIX)
+        return _JOURNALS[path]
+
+
+def archive_for(db_name):
+    """Return the process-wide history archive of a database file."""
+    path = os.path.abspath(db_name)
+    with _CACHES_GUARD:
+        if path not in _ARCHIVES:
+            _ARCHIVES[path] = HistoryArchive(path + ARCHIVE_SUFFIX)
+        return _ARCHIVES[path]
+
+
+def transaction_record(product_name, amount, quantity, kind="purchase"):
+    """Build the stored form of one purchase, redemption or refund (refunds have negative amounts and quantities)."""
+    return {
+        "product_name": product_name,
+        "amount": round(amount, 2),  # Will be 0 for redemptions
+        "quantity": quantity,
+        "type": kind,
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),  # Current date and time
+    }
+
+
+def return_record(product_name, reason):
+    """Build the stored form of one return request."""
+    return {
+        "product_name": product_name,
+        "reason": reason,
+        "status": "pending",  # Ensure status is set
+        "instructions": None,  # Default instructions
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+
+def history_bounds(since=None, until=None):
+    """
+    Turn the bounds of a history date range into the inclusive timestamps records are compared with.
+
+    :param since: "YYYY-MM-DD" (from the start of that day) or "YYYY-MM-DD HH:MM:SS", or None
+    :param until: "YYYY-MM-DD" (to the end of that day) or "YYYY-MM-DD HH:MM:SS", or None
+    :return: (since, until) as "YYYY-MM-DD HH:MM:SS" strings or None; raises ValueError on other formats
+    """
+    bounds = []
+    for value, time_of_day in ((since, "00:00:00"), (until, "23:59:59")):
+        if value:
+            value = f"{value} {time_of_day}" if len(value) == 10 else value
+            datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        bounds.append(value or None)
+    return tuple(bounds)
+
+
+def migrate_transactions_to_journal(db_name=DATABASE_FILE):
+    """
+    Move per-user transaction and return lists out of the record store into the journal.
+
+    :param db_name: Path of the shelve database
+    :return: Number of events appended
+    """
+    journal = journal_for(db_name)
+    with STORE_POOL.writing(db_name) as shelf:
+        if shelf.get(JOURNAL_VERSION_KEY, 0) >= JOURNAL_SCHEMA_VERSION:
+            return 0
+
+        store = RecordStore(shelf, cache_for(db_name))
+        moved = 0
+        for user_id, transactions in store.load_table("transactions").items():
+            moved += len(journal.append_many(
+                ("redemption" if not transaction.get("amount") else "purchase", user_id, transaction)
+                for transaction in transactions
+            ))
+            store.delete("transactions", user_id)
+        for user_id, returns in store.load_table("return_transactions").items():
+            moved += len(journal.append_many(("return", user_id, return_item) for return_item in returns))
+            store.delete("return_transactions", user_id)
+
+        shelf[JOURNAL_VERSION_KEY] = JOURNAL_SCHEMA_VERSION
+
+    if moved:
+        print(f"Moved {moved} transactions into the journal.")
+    return moved
+
+
+def _sync_file(path):
+    with open(path, "rb+") as f:
+        os.fsync(f.fileno())
+
+
+def dumb_index(db_name):
+    """
+    Read the .dir file of a dbm.dumb store.
+
+    :return: {key: (offset, size)} of every live value, or None if the store is another dbm kind
+    """
+    if dbm.whichdb(db_name) != "dbm.dumb":
+        return None
+    index = {}
+    with open(db_name + ".dir", encoding="Latin-1") as f:
+        for line in f:
+            if line.strip():
+                key, pos_and_size = ast.literal_eval(line)
+                index[key] = pos_and_size  # A key appended twice: the later line wins, as in dbm.dumb
+    return index
+
+
+def space_summary(sizes, file_bytes, allocated_bytes=None, top=10):
+    """
+    Summarize how a data file's bytes are used.
+
+    :param sizes: {key: stored bytes} of every live value
+    :param file_bytes: Size of the data file
+    :param allocated_bytes: Bytes the live values take up including block padding (defaults to their size)
+    :param top: Number of largest keys to list
+    :return: Dict with live, padding and dead bytes, per-table totals and the largest keys
+    """
+    live = sum(sizes.values())
+    allocated = live if allocated_bytes is None else allocated_bytes
+    dead = max(file_bytes - allocated, 0)
+    tables = defaultdict(lambda: {"keys": 0, "bytes": 0, "largest": 0})
+    for key, size in sizes.items():
+        table = tables[key.split(KEY_SEPARATOR, 1)[0]]
+        table["keys"] += 1
+        table["bytes"] += size
+        table["largest"] = max(table["largest"], size)
+    return {
+        "file_bytes": file_bytes,
+        "live_bytes": live,
+        "padding_bytes": allocated - live,
+        "dead_bytes": dead,
+        "dead_ratio": round(dead / file_bytes, 4) if file_bytes else 0.0,
+        "keys": len(sizes),
+        "tables": dict(sorted(tables.items(), key=lambda item: -item[1]["bytes"])),
+        "largest_keys": sorted(sizes.items(), key=lambda item: -item[1])[:top],
+    }
+
+
+def _copy_live_values(shelf, target):
+    """Write every live value of a shelve handle into a fresh dbm.dumb store at `target`."""
+    source = shelf.dict
+    copy = dbm.dumb.open(target, "n")
+    try:
+        for key in sorted(source.keys()):  # Keeps each table's records next to each other
+            copy[key] = source[key]
+    finally:
+        copy.close()
+    for suffix in (".dat", ".dir"):
+        _sync_file(target + suffix)
+
+
+def finish_compaction(db_name):
+    """Complete a compaction swap that was interrupted after its copy was finished."""
+    marker = db_name + COMPACT_READY_SUFFIX
+    if not os.path.exists(marker):
+        return False
+    target = db_name + COMPACT_SUFFIX
+    for suffix in (".dat", ".dir"):
+        if os.path.exists(target + suffix):
+            os.replace(target + suffix, db_name + suffix)
+    for stale in (db_name + ".bak", target + ".bak"):  # Indexes of the old data file and the copy
+        if os.path.exists(stale):
+            os.remove(stale)
+    os.remove(marker)
+    return True
+
+
+def start_hold_sweeper(db_name=DATABASE_FILE, interval=HOLD_SWEEP_INTERVAL):
+    """
+    Drop expired cart holds and idempotency keys and evict idle carts from a daemon thread every
+    `interval` seconds (see sweep_expired_holds, sweep_idempotency_keys and evict_idle_carts).
+
+    :return: The started thread
+    """
+    manager = EnhancedDatabaseManager(db_name)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                swept, evicted = manager.sweep_expired_holds(), manager.evict_idle_carts()
+                keys = manager.sweep_idempotency_keys()
+                if swept or evicted or keys:
+                    print(f"DEBUG: Swept {swept} expired cart holds, {evicted} idle carts and {keys} "
+                          f"idempotency keys from {db_name}")
+            except Exception as e:
+                print(f"DEBUG: Sweeping cart holds failed: {e}")
+
+    thread = threading.Thread(target=run, name="hold-sweeper", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_compactor(db_name=DATABASE_FILE, interval=COMPACT_INTERVAL, min_dead_ratio=COMPACT_MIN_DEAD_RATIO):
+    """
+    Compact the store from a daemon thread whenever dead space reaches `min_dead_ratio`.
+
+    :param interval: Seconds between space checks
+    :return: The started thread
+    """
+    backend = backend_for(db_name)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                if backend.space_report(top=0)["dead_ratio"] >= min_dead_ratio:
+                    before, after = backend.compact()
+                    print(f"DEBUG: Compacted {db_name} from {before} to {after} bytes")
+            except Exception as e:
+                print(f"DEBUG: Background compaction failed: {e}")
+
+    thread = threading.Thread(target=run, name="store-compactor", daemon=True)
+    thread.start()
+    return thread
+
+
+class ShelveBackend:
+    """The default storage backend: per-record shelve keys plus the segment transaction journal."""
+
+    name = "shelve"
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+
+    @contextmanager
+    def reading(self):
+        """Yield a RecordStore over the pooled handle; other readers are not blocked."""
+        with STORE_POOL.reading(self.db_name) as shelf:
+            yield RecordStore(shelf, cache_for(self.db_name))
+
+    @contextmanager
+    def writing(self):
+        """Yield a RecordStore with exclusive access; changes are synced on the outermost exit."""
+        with STORE_POOL.writing(self.db_name) as shelf:
+            yield RecordStore(shelf, cache_for(self.db_name))
+
+    @property
+    def journal(self):
+        return journal_for(self.db_name)
+
+    def migrate(self):
+        """Bring an older shelve file up to the current layout."""
+        migrate_to_record_layout(self.db_name)
+        migrate_transactions_to_journal(self.db_name)
+
+    def space_report(self, top=10):
+        """Report live, padding and dead bytes in the data file and the largest keys."""
+        path = os.path.abspath(self.db_name)
+        with STORE_POOL.reading(path) as shelf:
+            index = dumb_index(path)
+            if index is None:
+                sizes = {key: len(shelf.dict[key.encode()]) for key in shelf.keys()}
+                return space_summary(sizes, sum(sizes.values()), top=top)
+            sizes = {key: size for key, (_, size) in index.items()}
+            allocated = sum(-(-size // DUMB_BLOCK_BYTES) * DUMB_BLOCK_BYTES for size in sizes.values())
+            return space_summary(sizes, os.path.getsize(path + ".dat"), allocated, top)
+
+    def compact(self):
+        """
+        Rewrite the live values into a fresh data file and swap it in.
+
+        The copy runs under the shared lock, so reads carry on and only writers wait; the swap
+        itself takes the exclusive lock briefly. If a write slips in between the two, the copy is
+        repeated, and after COMPACT_RETRIES attempts it is done under the exclusive lock.
+
+        :return: (data file bytes before, after); (None, None) for dbm kinds other than dbm.dumb
+        """
+        path = os.path.abspath(self.db_name)
+        target = path + COMPACT_SUFFIX
+        if dbm.whichdb(path) != "dbm.dumb":
+            with STORE_POOL.writing(path) as shelf:
+                if hasattr(shelf.dict, "reorganize"):
+                    shelf.dict.reorganize()  # gdbm reclaims space itself
+            return None, None
+
+        before = os.path.getsize(path + ".dat")
+        for attempt in range(COMPACT_RETRIES + 1):
+            exclusive = attempt == COMPACT_RETRIES
+            with (STORE_POOL.writing if exclusive else STORE_POOL.reading)(path) as shelf:
+                generation = STORE_POOL.generation(path)
+                _copy_live_values(shelf, target)
+                if exclusive:
+                    return before, self._swap(path, target)
+            with STORE_POOL.writing(path):
+                if STORE_POOL.generation(path) == generation:
+                    return before, self._swap(path, target)
+
+    @staticmethod
+    def _swap(path, target):
+        """Replace the data files with the compacted copy; call with the exclusive lock held."""
+        if os.path.exists(path + SNAPSHOT_MARKER_SUFFIX):  # The snapshot reads the current files
+            raise RuntimeError(f"A snapshot of {path} is running; compact again once it is done")
+        STORE_POOL.close(path)  # The pool reopens it, and other processes see the new generation
+        with open(path + COMPACT_READY_SUFFIX, "w") as marker:
+            os.fsync(marker.fileno())
+        finish_compaction(path)
+        return os.path.getsize(path + ".dat")
+
+    def stats(self):
+        stats = STORE_POOL.stats()
+        stats["backend"] = self.name
+        stats["cache"] = cache_for(self.db_name).stats()
+        return stats
+
+
+_BACKENDS = {}
+
+
+def backend_for(db_name):
+    """Return the process-wide storage backend for a database path, chosen by its extension."""
+    path = os.path.abspath(db_name)
+    with _CACHES_GUARD:
+        if path not in _BACKENDS:
+            if path.endswith(SQLITE_SUFFIXES):
+                from sqlite_backend import SQLiteBackend  # Imports this module, so load it on demand
+                _BACKENDS[path] = SQLiteBackend(path)
+            else:
+                _BACKENDS[path] = ShelveBackend(db_name)
+        return _BACKENDS[path]
+
+
+class EnhancedDatabaseManager:
+    def __init__(self, db_name=DATABASE_FILE):
+        self.db_name = db_name
+        self.backend = backend_for(db_name)
+
+    @contextmanager
+    def _records(self, write=False):
+        """Yield a record store from the backend, for reading or exclusive writing."""
+        with (self.backend.writing() if write else self.backend.reading()) as store:
+            yield store
+
+    @contextmanager
+    def open_tables(self, writeback=False):
+        """
+        Open the database as a dict of whole tables (drop-in for `shelve.open`).
+
+        :param writeback: Open for writing and write back every table that was read when the
+            block exits. Without it the view is read-only.
+        """
+        with self._records(write=writeback) as store:
+            view = TableView(store, writeback=writeback)
+            try:
+                yield view
+            finally:
+                if writeback:
+                    view.sync()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group reads and writes across tables into one commit.
+
+        Usage: `with db_manager.transaction() as tx:` then tx.get / tx.put / tx.delete /
+        tx.add_transaction. The write lock is held for the whole block, everything is written
+        with a single flush when it exits normally, and nothing is written if it raises.
+        """
+        with self._records(write=True) as store:
+            tx = UnitOfWork(store, self.journal)
+            try:
+                yield tx
+            except BaseException:
+                tx.rollback()
+                raise
+            tx.commit()
+
+    @property
+    def journal(self):
+        """The append-only purchase/redemption/return journal of this database."""
+        return self.backend.journal
+
+    @property
+    def archive(self):
+        """The cold tier of this database's history (see archive_history)."""
+        return archive_for(self.db_name)
+
+    def archive_history(self, days=ARCHIVE_AFTER_DAYS):
+        """
+        Move history older than `days` from the hot store to the archive.
+
+        Transactions, returns that are no longer pending and resolved or closed reports move;
+        they stay readable through get_transactions, get_return_transactions and get_reports.
+        Each batch is archived before it is removed, so an interrupted run can simply be rerun.
+
+        :return: {"transactions": n, "returns": n, "reports": n} records moved
+        """
+        cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+        archive = self.archive
+
+        def sink(stream):
+            return lambda events: archive.add(
+                stream, [(user_id, seq, record.get("date"), record) for user_id, seq, record in events])
+
+        moved = {
+            TRANSACTIONS: self.journal.extract(TRANSACTIONS, cutoff, sink=sink(TRANSACTIONS)),
+            RETURNS: self.journal.extract(
+                RETURNS, cutoff, select=lambda record: record.get("status") != "pending", sink=sink(RETURNS)),
+        }
+        with self._records(write=True) as store:
+            closed = {
+                report_id: report for report_id, report in store.load_table("reports").items()
+                if report.get("status") in CLOSED_REPORT_STATUSES and "" < (report.get("timestamp") or "") < cutoff
+            }
+            archive.add(REPORTS, [(report.get("user_id"), report_id, report["timestamp"], report)
+                                  for report_id, report in closed.items()])
+            for report_id in closed:
+                store.delete("reports", report_id)
+        moved[REPORTS] = len(closed)
+        return moved
+
+    def get_store_stats(self):
+        """Return storage backend statistics (handles, cache, transactions) and checkout stage timings."""
+        return dict(self.backend.stats(), checkout=CHECKOUT_STATS.as_dict())
+
+    def initialize_database(self):
+        """Initialize the database ONLY if it's empty to prevent resetting registrations."""
+        self.backend.migrate()
+        migrate_indexes(self.db_name)
+
+        with self.open_tables(writeback=True) as db:
+            if "users" not in db:
+                db["users"] = {
+                    "customer1": {"name": "Customer 1", "role": "customer", "points": 1000, "balance": 200.0,
+                                  "password": "customer123"},
+                    "farmer1": {"name": "Farmer 1", "role": "farmer", "points": 200, "balance": 500.0,
+                                "password": "farmer123"},
+                    "farmer2": {"name": "Farmer 2", "role": "farmer", "points": 150, "balance": 300.0,
+                                "password": "farmer123"},
+                }
+
+            if "farmers_registered" not in db:  # ✅ This prevents overwriting the registrations
+                db["farmers_registered"] = {}
+
+            print("Database initialized without resetting existing values.")
+
+
+
+            # Default products
+            if "products" not in db:
+                db["products"] = {
+                    1: {"name": "Carrot", "price": 1.50, "quantity": 100, "category": "Vegetables",
+                        "image_url": "placeholder.png", "uploaded_by": "farmer1", "farmer_id": "farmer1"},
+                    2: {"name": "Tomato", "price": 2.00, "quantity": 50, "category": "Vegetables",
+                        "image_url": "placeholder.png", "uploaded_by": "farmer2", "farmer_id": "farmer2"},
+                }
+                for product_id, product in db["products"].items():
+                    if product.get("farmer_id") is None:
+                        product["farmer_id"] = product.get("uploaded_by") or "unknown_farmer"  # Assign dynamically
+                db["products"] = db["products"]  # Save changes
+
+                # Default ownership
+                if "ownership" not in db:
+                    db["ownership"] = {
+                        "farmer1": {
+                            "products": [1, 2, 3],
+                            "returns": {},
+                            "plants": [],
+                            "watering_price": 5.0,  # Default watering price
+                            "fertilizer_price": 10.0,  # Default fertilizer price
+                        },
+                        "customer1": {
+                            "products": [],
+                            "returns": {},
+                            "plants": [],
+                        },
+                    }
+
+            # Default rewards
+            if "reward_products" not in db:
+                db["reward_products"] = {
+                    1: {"name": "Discounted Carrot", "points": 50, "quantity": 20},
+                }
+
+            print("Database initialized with default values.")
+
+            if "discounted_items" not in db:
+                db["discounted_items"] = {
+                    1: {
+                        "name": "Discounted Carrot",
+                        "price": 1.00,
+                        "stock": 20,
+                        "category": "Vegetables",  # ✅ Added category
+                        "expiry_date": (datetime.now() + timedelta(days=7)).strftime("%Y-%m-%d"),
+                        "image_url": "https://gallery.yopriceville.com/var/resizes/Free-Clipart-Pictures/Vegetables-PNG/Fresh_Carrot_PNG_Clip_Art_Image.png?m=1629833771",
+                    },
+                    2: {
+                        "name": "Discounted Tomato",
+                        "price": 1.50,
+                        "stock": 15,
+                        "category": "Fruits",  # ✅ Added category
+                        "expiry_date": (datetime.now() + timedelta(days=5)).strftime("%Y-%m-%d"),
+                        "image_url": "https://pngimg.com/uploads/tomato/tomato_PNG12592.png",
+                    },
+                }
+            if "tree_types" not in db:
+                db["tree_types"] = {
+                    "mango": {
+                        "name": "Mango Tree",
+                        "price": 5.0,  # Price in dollars
+                        "investment_return": 50.0,  # Expected investment value in dollars
+                    },
+                    "avocado": {
+                        "name": "Avocado Tree",
+                        "price": 7.0,
+                        "investment_return": 70.0,
+                    },
+                    "apple": {
+                        "name": "Apple Tree",
+                        "price": 6.0,
+                        "investment_return": 60.0,
+                    },
+                }
+            if "orders" not in db:
+                db["orders"] = {}
+
+            if "reports" not in db:
+                db["reports"] = {}
+
+            print("Database initialized with default values.")
+
+        migrate_catalog(self.db_name)
+        migrate_sequences(self.db_name)
+        migrate_ownership(self.db_name)
+        migrate_records(self.db_name)
+
+    def get_users(self):
+        """Retrieve all users."""
+        with self._records() as store:
+            return store.load_table("users")
+
+    def get_user(self, user_id):
+        """Retrieve one user, or None if it does not exist."""
+        with self._records() as store:
+            return store.get("users", user_id)
+
+    def register_farmer_for_future(self, farmer_id):
+        """Marks a farmer as registered for Plant a Future."""
+        with self._records(write=True) as store:
+            if store.get("farmers_registered", farmer_id):  # If already registered, do nothing
+                print(f"DEBUG: Farmer {farmer_id} is already registered!")
+                return
+
+            store.put("farmers_registered", farmer_id, True)  # Mark as registered (synced on release)
+            print(f"DEBUG: Registered Farmer {farmer_id} Successfully!")
+
+    def get_farmer_notifications(self, farmer_id):
+        """Fetch pending return requests for the specified farmer."""
+        return_transactions = {
+            customer_id: self.journal.records(RETURNS, customer_id)
+            for customer_id in self.journal.users(RETURNS)
+        }
+        with self._records() as store:
+            farmer_returns = []
+
+            for customer_id, transactions in return_transactions.items():
+                for transaction in transactions:
+                    product_name = transaction.get("product_name")
+                    if transaction.get("status", "pending") != "pending":
+                        continue
+                    # Ensure only the farmer's products are retrieved
+                    matches = store.find("products", name=product_name, farmer_id=farmer_id)
+                    for product_id, product_data in matches.items():
+                        if product_data["name"] == product_name:
+                            farmer_returns.append({
+                                "id": product_id,
+                                "product_name": product_name,
+                                "quantity": transaction.get("quantity", 1),
+                                "reason": transaction.get("reason"),
+                                "customer_id": customer_id,
+                                "status": transaction.get("status", "pending"),
+                            })
+
+            print(f"DEBUG: Returns fetched for farmer {farmer_id}: {farmer_returns}")
+            return farmer_returns
+
+    def get_ownership(self, user_id):
+        """Retrieve ownership details for a user, with "products" as per-product counters."""
+        with self._records() as store:
+            user_ownership = normalize_ownership(store.get("ownership", user_id, {}))
+            user_ownership.setdefault("products", {})
+            return user_ownership
+
+    def get_reward_products(self):
+        """Retrieve all reward products."""
+        with self._records() as store:
+            return store.load_table("reward_products")
+
+    def get_nav_options(self, role):
+        """Return navigation options based on user role."""
+        nav_options = {
+            "farmer": [
+                {"name": "Products", "url": "/products/"},
+                {"name": "Discounted Products", "url": "/discounted/"},
+                {"name": "Your Farm", "url": "/rewards/farmer_plant_a_future"},
+                {"name": "Returns", "url": "/returns/farmer_returns"},
+            ],
+            "customer": [
+                {"name": "Products", "url": "/products/"},
+                {"name": "Discounted Products", "url": "/discounted/"},
+                {"name": "Plant a Future", "url": "/rewards/plant_a_future"},
+                {"name": "Returns", "url": "/returns/"},
+                {"name": "Checkout", "url": "/checkout/"},
+            ],
+        }
+
+        # ✅ Ensure the Rewards URL is correct in the dropdown
+        dropdown_options = [
+            {"name": "Profile", "url": "/profile/profile"},
+            {"name": "Rewards", "url": "/rewards/"},
+            {"name": "Divider", "url": None},  # Divider for better separation
+            {"name": "Logout", "url": "/profile/logout", "class": "text-danger"},
+        ]
+
+        return {"nav": nav_options.get(role, []), "dropdown": dropdown_options}
+
+    def get_all_items(self):
+        """Retrieve all discounted items."""
+        with self._records() as store:
+            return store.load_table("discounted_items")
+
+    def save_items(self, items):
+        """Save the updated discounted items dictionary."""
+        items = {item_id: normalize_discounted_item(item) for item_id, item in items.items()}
+        with self._records(write=True) as store:
+            store.save_table("discounted_items", items)
+
+    def adjust_user_balance(self, user_id, balance_delta):
+        """Adjust the user's balance."""
+        with self._records(write=True) as store:
+            user = store.get("users", user_id)
+
+            if not user:
+                raise ValueError(f"User with ID '{user_id}' not found.")
+
+            new_balance = round(user.get("balance", 0) + balance_delta, 2)
+
+            if new_balance < 0:
+                raise ValueError("Insufficient balance for this transaction.")
+
+            user["balance"] = new_balance
+            store.put("users", user_id, user)
+
+    def update_ownership(self, user_id, category, item_id):
+        """
+        Add an item to a user's ownership in the specified category.
+
+        :param user_id: ID of the user
+        :param category: Category to update (e.g., "products", "plants", etc.)
+        :param item_id: ID of the item to add; a product already owned is not counted again
+        """
+        with self._records(write=True) as store:
+            user_ownership = normalize_ownership(store.get("ownership", user_id, {}))
+            if category == "products":
+                if item_id not in user_ownership.get("products", {}):
+                    add_owned_product(user_ownership, item_id)
+            else:
+                category_items = user_ownership.setdefault(category, [])
+                if item_id not in category_items:
+                    category_items.append(item_id)
+
+            store.put("ownership", user_id, user_ownership)
+
+    def get_transactions(self, user_id):
+        """Retrieve the transaction history for a user, archived transactions included."""
+        try:
+            return self._history(TRANSACTIONS, user_id)
+        except Exception as e:
+            print(f"Error reading transactions: {e}")
+            return []
+
+    def get_transactions_page(self, user_id, cursor=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Retrieve one page of a user's transaction history, newest first.
+
+        :param user_id: ID of the user
+        :param cursor: "next_cursor" of the previous page, or None for the newest page
+        :param limit: Maximum number of transactions on the page
+        :param since: Earliest date to include, "YYYY-MM-DD" or "YYYY-MM-DD HH:MM:SS"
+        :param until: Latest date to include
+        :return: {"items": [transaction, ...], "next_cursor": cursor of the next page or None}
+        """
+        return self._history_page(TRANSACTIONS, user_id, cursor, limit, since, until)
+
+    def _history(self, stream, user_id):
+        """A user's archived and journaled events, in sequence order."""
+        events = dict(self.archive.read(stream, user_id))
+        events.update(self.journal.read(stream, user_id))
+        return [record for _, record in sorted(events.items())]
+
+    def _history_page(self, stream, user_id, cursor, limit, since, until):
+        since, until = history_bounds(since, until)
+        hot, hot_cursor = self.journal.page(stream, user_id, cursor, limit, since, until)
+        cold, cold_cursor = self.archive.page(stream, user_id, cursor, limit, since, until)
+        # Resolved returns are archived before older pending ones, so the two tiers interleave
+        events = sorted(dict(cold + hot).items(), reverse=True)
+        more = len(events) > limit or hot_cursor is not None or cold_cursor is not None
+        next_cursor = events[limit - 1][0] if more else None
+        return {"items": [record for _, record in events[:limit]], "next_cursor": next_cursor}
+
+    def save_products(self, products):
+        """Save the updated products dictionary."""
+        products = {product_id: normalize_product(product) for product_id, product in products.items()}
+        with self._records(write=True) as store:
+            store.save_table("products", products)
+
+    def add_product(self, product):
+        """
+        Add a new product to the catalog.
+
+        :param product: Product fields (name, price, quantity, category, farmer_id, ...)
+        :return: ID of the new product
+        """
+        with self._records(write=True) as store:
+            product_id = allocate_ids(store, "products")[0]
+            store.put("products", product_id, normalize_product(product))
+        return product_id
+
+    def import_products(self, products, batch_size=CATALOG_BATCH):
+        """
+        Add many products, reserving one block of IDs and making one store write per batch.
+
+        :param products: Iterable of product fields; consumed lazily, one batch at a time
+        :param batch_size: Products per batch
+        :return: IDs of the new products
+        """
+        product_ids = []
+        products = iter(products)
+        while True:
+            batch = [normalize_product(product) for product in islice(products, batch_size)]
+            if not batch:
+                return product_ids
+            with self._records(write=True) as store:
+                ids = allocate_ids(store, "products", len(batch))
+                store.put_many("products", dict(zip(ids, batch)))
+            product_ids.extend(ids)
+
+    def iter_products(self, batch_size=CATALOG_BATCH, **fields):
+        """
+        Yield (product_id, product) pairs in ID order without loading the whole catalog.
+
+        The read lock is taken once per batch, so a long export does not hold up writers.
+
+        :param fields: Optional index filters, as for find_products
+        """
+        with self._records() as store:
+            product_ids = store.find_ids("products", **fields)
+        for start in range(0, len(product_ids), batch_size):
+            with self._records() as store:
+                batch = [(product_id, store.get("products", product_id))
+                         for product_id in product_ids[start:start + batch_size]]
+            for product_id, product in batch:
+                if product is not None:  # Deleted since the IDs were read
+                    yield product_id, product
+
+    def bulk_update_items(self, table, owner_id, changes=(), rule=None):
+        """
+        Change the price and stock of many of an owner's products or discounted items in one write.
+
+        Every targeted item is checked against the owner before anything is written: if one is
+        missing or belongs to someone else, or a rule would drive a value below zero, nothing changes.
+
+        :param table: "products" or "discounted_items" (see BULK_UPDATE_TABLES)
+        :param owner_id: Farmer making the change
+        :param changes: [(item_id, price or None, stock or None), ...], see catalog_io.parse_bulk_changes
+        :param rule: Optional (filters, updates) applied to every matching item of the owner, see
+            catalog_io.parse_bulk_rule; explicit changes are applied first
+        :return: Sorted IDs of the updated items
+        :raise PermissionError: If an item does not exist or is not the owner's
+        :raise ValueError: If a rule update would make a price or stock negative
+        """
+        owner_field, stock_field = BULK_UPDATE_TABLES[table]
+        normalize = normalize_product if table == "products" else normalize_discounted_item
+        with self._records(write=True) as store:
+            updated, denied = {}, []
+            for item_id, price, stock in changes:
+                item = updated[item_id] if item_id in updated else store.get(table, item_id)
+                if item is None or item.get(owner_field) != owner_id:
+                    denied.append(item_id)
+                    continue
+                if price is not None:
+                    item["price"] = price
+                if stock is not None:
+                    item[stock_field] = stock
+                updated[item_id] = item
+            if denied:
+                raise PermissionError(f"Not found or not yours: {', '.join(map(str, sorted(set(denied))))}")
+
+            if rule:
+                filters, updates = rule
+                if table in INDEXED_FIELDS:
+                    matches = store.find_ids(table, **{owner_field: owner_id}, **filters)
+                else:
+                    matches = [item_id for item_id, item in store.load_table(table).items()
+                               if item.get(owner_field) == owner_id
+                               and all(item.get(field) == value for field, value in filters.items())]
+                for item_id in matches:
+                    item = updated[item_id] if item_id in updated else store.get(table, item_id)
+                    apply_bulk_updates(item, updates, stock_field)
+                    updated[item_id] = item
+
+            store.put_many(table, {item_id: normalize(item) for item_id, item in updated.items()})
+        return sorted(updated)
+
+    def hold_stock(self, user_id, product_id, quantity, ttl=HOLD_TTL):
+        """
+        Hold `quantity` of a product for a customer's cart (replacing any earlier hold); 0 releases it.
+
+        Only the product's holds record is written, never the catalog.
+
+        :return: Stock of the product available to the customer
+        :raise ValueError: If the product does not exist or too little of it is available
+        """
+        with self._records(write=True) as store:
+            return set_hold(store, user_id, product_id, quantity, ttl)
+
+    def release_holds(self, user_id, product_ids):
+        """Release a customer's holds on the given products with one write, e.g. when the cart is cleared."""
+        with self._records(write=True) as store:
+            for product_id in product_ids:
+                set_hold(store, user_id, product_id, 0)
+
+    def get_active_holds(self):
+        """Return {product_id: {user_id: [quantity, expires_at]}} for products with unexpired holds."""
+        with self._records() as store:
+            holds = {product_id: active_holds(record) for product_id, record in store.load_table(HOLDS).items()}
+        return {product_id: record for product_id, record in holds.items() if record}
+
+    def claim_idempotency_key(self, user_id, key, fingerprint, now=None):
+        """
+        Look up an idempotency key of a user and claim it for this request if it is new.
+
+        Expired keys of the user are dropped on the way, and the oldest ones once there are more
+        than IDEMPOTENCY_KEYS_PER_USER.
+
+        :param fingerprint: Digest of the request; a key may only be reused for the same request
+        :return: None if the key was claimed, IDEMPOTENCY_PENDING if its first request is still
+            running, else the response recorded for it
+        :raise ValueError: If the key was used for a different request
+        """
+        now = time.time() if now is None else now
+        with self._records(write=True) as store:
+            stored = store.get(IDEMPOTENCY, user_id) or {}
+            entry = stored.get(key)
+            if entry is not None and entry[0] > now:
+                if entry[1] != fingerprint:
+                    raise ValueError("This idempotency key was already used for a different request.")
+                if not entry[3]:
+                    return IDEMPOTENCY_PENDING
+                return store.get(IDEMPOTENCY_RESPONSES, f"{user_id}/{entry[2]}")
+
+            keys = {other: entry for other, entry in stored.items() if entry[0] > now and other != key}
+            for oldest in list(keys)[:max(len(keys) + 1 - IDEMPOTENCY_KEYS_PER_USER, 0)]:
+                del keys[oldest]
+            used = {entry[2] for entry in keys.values()}
+            keys[key] = [now + IDEMPOTENCY_PENDING_TTL, fingerprint, min(set(range(len(keys) + 1)) - used), False]
+            store.put(IDEMPOTENCY, user_id, keys)
+        return None
+
+    def complete_idempotency_key(self, user_id, key, response, ttl=IDEMPOTENCY_TTL, now=None):
+        """Record the response of a claimed key, replayed for its duplicates for `ttl` seconds."""
+        now = time.time() if now is None else now
+        with self._records(write=True) as store:
+            keys = store.get(IDEMPOTENCY, user_id) or {}
+            entry = keys.get(key)
+            if entry is None or entry[3]:
+                return  # Evicted meanwhile: its slot may belong to another key now
+            store.put(IDEMPOTENCY_RESPONSES, f"{user_id}/{entry[2]}", response)
+            keys[key] = [now + ttl, entry[1], entry[2], True]
+            store.put(IDEMPOTENCY, user_id, keys)
+
+    def release_idempotency_key(self, user_id, key):
+        """Free a claimed key whose request failed, so that a retry runs it again."""
+        with self._records(write=True) as store:
+            keys = store.get(IDEMPOTENCY, user_id)
+            if keys and key in keys and not keys[key][3]:
+                del keys[key]
+                store.put(IDEMPOTENCY, user_id, keys)
+
+    def sweep_idempotency_keys(self, now=None):
+        """
+        Drop every expired idempotency key with one write, and the responses of users left without keys.
+
+        :return: Number of keys removed
+        """
+        now = time.time() if now is None else now
+        with self._records(write=True) as store:
+            swept, kept, emptied = 0, {}, set()
+            for user_id in store.ids(IDEMPOTENCY):
+                stored = store.get(IDEMPOTENCY, user_id) or {}
+                keys = {key: entry for key, entry in stored.items() if entry[0] > now}
+                if stored and len(keys) == len(stored):
+                    continue
+                swept += len(stored) - len(keys)
+                if keys:
+                    kept[user_id] = keys
+                else:
+                    emptied.add(user_id)
+            store.put_many(IDEMPOTENCY, kept)
+            for user_id in emptied:
+                store.delete(IDEMPOTENCY, user_id)
+            for response_id in store.ids(IDEMPOTENCY_RESPONSES):
+                if response_id.rpartition("/")[0] in emptied:
+                    store.delete(IDEMPOTENCY_RESPONSES, response_id)
+        return swept
+
+    def sweep_expired_holds(self, now=None):
+        """
+        Drop every expired cart hold with one write, and the holds records left empty.
+
+        :return: Number of holds removed
+        """
+        with self._records(write=True) as store:
+            swept, kept, emptied = 0, {}, []
+            for product_id, stored in store.load_table(HOLDS).items():
+                holds = active_holds(stored, now)
+                if stored and len(holds) == len(stored):
+                    continue
+                swept += len(stored) - len(holds)
+                if holds:
+                    kept[product_id] = holds
+                else:
+                    emptied.append(product_id)
+            store.put_many(HOLDS, kept)
+            for product_id in emptied:
+                store.delete(HOLDS, product_id)
+        return swept
+
+    def get_cart(self, user_id):
+        """Return a customer's cart (an empty Cart if they have none)."""
+        with self._records() as store:
+            return store.get(CARTS, user_id) or Cart()
+
+    def get_cart_lines(self, user_id):
+        """Return a customer's cart resolved against the catalog, see cart_lines."""
+        with self._records() as store:
+            return cart_lines(store, store.get(CARTS, user_id) or Cart())
+
+    def add_to_cart(self, user_id, product_id, quantity, ttl=HOLD_TTL):
+        """
+        Add `quantity` of a product to a customer's cart and extend their stock hold to match, in one write.
+
+        :return: New quantity of the product in the cart
+        :raise ValueError: If the product does not exist or too little of it is available
+        """
+        with self._records(write=True) as store:
+            cart = store.get(CARTS, user_id) or Cart()
+            total = cart.lines.get(product_id, 0) + quantity
+            set_hold(store, user_id, product_id, total, ttl)
+            cart.lines[product_id] = total
+            cart.touched = time.time()
+            store.put(CARTS, user_id, cart)
+        return total
+
+    def update_cart_quantity(self, user_id, product_id, quantity, ttl=HOLD_TTL):
+        """
+        Set the quantity of a product already in a customer's cart, moving the hold with it.
+
+        :return: False if the product is not in the cart
+        :raise ValueError: If too little of the product is available
+        """
+        with self._records(write=True) as store:
+            cart = store.get(CARTS, user_id)
+            if cart is None or product_id not in cart.lines:
+                return False
+            set_hold(store, user_id, product_id, quantity, ttl)
+            cart.lines[product_id] = quantity
+            cart.touched = time.time()
+            store.put(CARTS, user_id, cart)
+        return True
+
+    def remove_from_cart(self, user_id, item_id, discounted=False):
+        """
+        Remove a product from a customer's cart, releasing its hold, or a paid discounted item,
+        refunding it (see refund_discounted_line), in one commit.
+
+        :return: The removed quantity, or 0 if it was not in the cart
+        """
+        with self.transaction() as tx:
+            cart = tx.get(CARTS, user_id)
+            entries = None if cart is None else cart.discounted if discounted else cart.lines
+            if not entries or item_id not in entries:
+                return 0
+            if discounted:
+                quantity = refund_discounted_line(tx, user_id, cart, item_id)
+            else:
+                quantity = entries.pop(item_id)
+                set_hold(tx, user_id, item_id, 0)
+            cart.touched = time.time()
+            tx.put(CARTS, user_id, cart)
+        return quantity
+
+    def add_discounted_to_cart(self, user_id, item_id, quantity, amount):
+        """Record a bought discounted item in the customer's cart (it holds no stock; `amount` was charged for it)."""
+        with self._records(write=True) as store:
+            add_discounted_line(store, user_id, item_id, quantity, amount)
+
+    def clear_cart(self, user_id):
+        """Empty a customer's cart in one commit, releasing its holds and refunding its paid discounted items; the last order is kept."""
+        with self.transaction() as tx:
+            cart = tx.get(CARTS, user_id)
+            if cart is None:
+                return
+            for product_id in cart.lines:
+                set_hold(tx, user_id, product_id, 0)
+            for item_id in list(cart.discounted):
+                refund_discounted_line(tx, user_id, cart, item_id)
+            cart.lines, cart.touched = {}, time.time()
+            tx.put(CARTS, user_id, cart)
+
+    def checkout_cart(self, user_id, buyer_name, expected_total=None):
+        """
+        Buy everything in a customer's cart with one commit.
+
+        Inside a single transaction the cart is resolved against live prices, its stock holds
+        become stock decrements, and the customer's ownership, the farmers' orders and the
+        purchase transactions are written. Discounted lines were paid for, logged and taken from
+        stock by buy_discounted, so they only get their farmers' orders. The cart is emptied, and
+        its lines are kept as the last order. Timings of each of CHECKOUT_STAGES are added to
+        CHECKOUT_STATS.
+
+        :param buyer_name: Name the farmers' orders are placed under
+        :param expected_total: Total the customer was shown; if live prices now add up to
+            something else, nothing is bought
+        :return: (cart lines bought, {stage: ms})
+        :raise ValueError: If the cart is empty, its total changed or stock ran out; nothing is written then
+        """
+        timings = {}
+        lap = time.perf_counter()
+
+        def finish(stage):
+            nonlocal lap
+            now = time.perf_counter()
+            timings[stage] = (now - lap) * 1000
+            lap = now
+
+        with self.transaction() as tx:
+            cart = tx.get(CARTS, user_id)
+            items = cart_lines(tx, cart) if cart else []
+            finish("load")
+
+            if not items:
+                raise ValueError("Your cart is empty. Please add items before checking out.")
+            total = cart_total(items)
+            if expected_total is not None and abs(total - expected_total) >= 0.005:
+                raise ValueError(f"Prices changed since you opened your cart; the total is now ${total:.2f}. "
+                                 "Please review your cart.")
+            finish("validate")
+
+            # Discounted items were paid for and took their stock when they were put in the cart
+            bought = [item for item in items if not item.get("discounted")]
+            take_held_stock(tx, user_id, bought)
+            finish("stock")
+
+            ownership = normalize_ownership(tx.get("ownership", user_id, {}))
+            for item in bought:
+                add_owned_product(ownership, item["id"], item["quantity"])
+            tx.put("ownership", user_id, ownership)
+            finish("ownership")
+
+            add_farmer_orders(tx, buyer_name, items)
+            finish("orders")
+
+            tx.add_transactions(user_id, bought)
+            cart.last_order = [(item["name"], item["price"], item["quantity"], bool(item.get("discounted")))
+                               for item in items]
+            cart.lines, cart.discounted, cart.paid, cart.touched = {}, {}, {}, time.time()
+            tx.put(CARTS, user_id, cart)
+            finish("transactions")
+        finish("commit")
+
+        CHECKOUT_STATS.record(timings)
+        return items, timings
+
+    def evict_idle_carts(self, idle_days=CART_IDLE_DAYS, now=None):
+        """
+        Delete carts untouched for `idle_days` in one commit, releasing their holds and refunding
+        their paid discounted items.
+
+        :return: Number of carts evicted
+        """
+        cutoff = (time.time() if now is None else now) - idle_days * 86400
+        with self.transaction() as tx:
+            evicted = 0
+            for user_id in tx.ids(CARTS):
+                cart = tx.get(CARTS, user_id)
+                if cart is None or cart.touched >= cutoff:
+                    continue
+                for product_id in cart.lines:
+                    set_hold(tx, user_id, product_id, 0)
+                for item_id in list(cart.discounted):
+                    refund_discounted_line(tx, user_id, cart, item_id)
+                tx.delete(CARTS, user_id)
+                evicted += 1
+        return evicted
+
+    def update_product(self, product_id, product):
+        """Replace the stored fields of an existing product."""
+        with self._records(write=True) as store:
+            store.put("products", product_id, normalize_product(product))
+
+    def delete_product(self, product_id):
+        """Remove a product from the catalog."""
+        with self._records(write=True) as store:
+            store.delete("products", product_id)
+
+    def get_products(self):
+        """Retrieve all products."""
+        with self._records() as store:
+            return store.load_table("products")
+
+    def get_product(self, product_id):
+        """Retrieve one product, or None if it does not exist."""
+        with self._records() as store:
+            return store.get("products", product_id)
+
+    def search_products(self, query, limit=SEARCH_LIMIT):
+        """
+        Search product names, nutritional facts and categories through the trigram index.
+
+        :param query: Text to look for; substrings and small typos match
+        :param limit: Maximum number of results
+        :return: [(product_id, product), ...] ordered by relevance
+        """
+        with self._records() as store:
+            return store.search("products", query, limit)
+
+    def search_discounted_items(self, query, limit=SEARCH_LIMIT):
+        """Search discounted items like search_products (expired items are not filtered out)."""
+        with self._records() as store:
+            return store.search("discounted_items", query, limit)
+
+    def find_products(self, **fields):
+        """
+        Look up products through the secondary indexes instead of scanning the catalog.
+
+        :param fields: Any of farmer_id, category or name (name matches ignore case and extra spaces)
+        :return: {product_id: product} for the products matching every given field
+        """
+        with self._records() as store:
+            return store.find("products", **fields)
+
+    def add_transaction(self, user_id, product_name, amount, quantity, kind="purchase"):
+        """
+        Add a transaction to the user's history.
+
+        :param user_id: ID of the user
+        :param product_name: Name of the purchased or redeemed product
+        :param amount: Total cost of the transaction (0 for redemptions)
+        :param quantity: Quantity of the product purchased or redeemed
+        :param kind: "purchase", "redemption" or "refund"
+        """
+        self.journal.append(kind, user_id, transaction_record(product_name, amount, quantity, kind))
+
+    def add_transactions(self, user_id, items, kind="purchase"):
+        """
+        Add one transaction per cart line with a single journal write.
+
+        :param user_id: ID of the user
+        :param items: Cart items with "name", "price" and "quantity"
+        :param kind: "purchase", "redemption" or "refund"
+        """
+        self.journal.append_many([
+            (kind, user_id, transaction_record(item["name"], item["price"] * item["quantity"], item["quantity"], kind))
+            for item in items
+        ])
+
+    def get_return_transactions(self, user_id):
+        """
+        Retrieve the return transaction history for a user.
+
+        :param user_id: ID of the user
+        :return: List of return transactions, archived ones included
+        """
+        return self._history(RETURNS, user_id)
+
+    def get_return_transactions_page(self, user_id, cursor=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Retrieve one page of a user's return history, newest first.
+
+        Takes the same arguments and returns the same shape as get_transactions_page.
+        """
+        return self._history_page(RETURNS, user_id, cursor, limit, since, until)
+
+    def create_profile(self, username, name, email, role, points, password):
+        """
+        Create a new user profile and save it to the database.
+
+        :param username: Unique username for the user
+        :param name: Full name of the user
+        :param email: Email address of the usaer
+        :param role: Role of the user (customer or farmer)
+        :param points: Initial points for the user
+        :param password: Password for the user
+        """
+        with self._records(write=True) as store:
+            if store.get("users", username) is not None:
+                raise ValueError(f"Username '{username}' already exists.")
+
+            store.put("users", username, {
+                "name": name,
+                "email": email,
+                "role": role,
+                "points": points,
+                "balance": 0.0,  # Default balance for new accounts
+                "password": password,
+            })
+
+    def save_ownership(self, user_id, ownership):
+        """
+        Save updated ownership details for a user.
+
+        :param user_id: ID of the user
+        :param ownership: Updated ownership dictionary
+        """
+        with self._records(write=True) as store:
+            store.put("ownership", user_id, ownership)
+
+    def add_return_transaction(self, user_id, product_name, reason):
+        """
+        Add a return transaction to the user's history.
+
+        :param user_id: ID of the user
+        :param product_name: Name of the returned product
+        :param reason: Reason for the return
+        """
+        self.journal.append("return", user_id, return_record(product_name, reason))
+
+    def update_return_status(self, customer_id, product_name, status):
+        """
+        Set the status of a customer's returns for a product.
+
+        :param customer_id: ID of the customer who made the return
+        :param product_name: Name of the returned product
+        :param status: New status, e.g. "approved" or "rejected"
+        :return: Number of returns updated
+        """
+        updated = 0
+        for seq, return_item in self.journal.read(RETURNS, customer_id):
+            if return_item.get("product_name") == product_name:
+                self.journal.update(RETURNS, customer_id, seq, {"status": status})
+                updated += 1
+        return updated
+
+    def save_users(self, users):
+        """Save the updated users dictionary."""
+        with self._records(write=True) as store:
+            store.save_table("users", users)
+
+    def adjust_user_points(self, user_id, points_delta):
+        """Adjusts user points and ensures they do not go negative."""
+        with self._records(write=True) as store:
+            user = store.get("users", user_id)
+
+            if not user:
+                raise ValueError(f"User '{user_id}' not found.")
+
+            new_points = user.get("points", 0) + points_delta
+
+            if new_points < 0:
+                raise ValueError("Insufficient points for this transaction.")
+
+            user["points"] = new_points
+            store.put("users", user_id, user)  # ✅ Save updated user data
+
+    def submit_report(self, user_id, report_content, category):
+        """Submit a report and save it to the database."""
+        report = {
+            "user_id": user_id,
+            "content": report_content,
+            "category": category,
+            "status": "pending",
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+        with self._records(write=True) as store:
+            report_id = allocate_ids(store, "reports")[0]
+            store.put("reports", report_id, report)
+
+        print(f"Report submitted with ID: {report_id}")
+        return report_id
+
+    def generate_report_id(self):
+        """Reserve a unique report ID."""
+        return self.allocate_ids("reports")[0]
+
+    def allocate_ids(self, entity, count=1):
+        """
+        Reserve consecutive IDs from an entity's persistent sequence.
+
+        :param entity: "products", "discounted_items", "orders", "reports" or "trees"
+        :param count: Number of IDs to reserve at once, e.g. for a bulk import
+        :return: range of the reserved IDs
+        """
+        with self._records(write=True) as store:
+            return allocate_ids(store, entity, count)
+
+    def get_reports(self, user_id=None, category=None):
+        """Retrieve all reports, archived ones included, optionally filtered by user or category."""
+        with self._records() as store:
+            reports = store.load_table("reports")
+        for owner in [user_id] if user_id else self.archive.users(REPORTS):
+            for report_id, report in self.archive.read(REPORTS, owner):
+                reports.setdefault(report_id, report)
+
+        if user_id:
+            reports = {k: v for k, v in reports.items() if v["user_id"] == user_id}
+
+        if category:
+            reports = {k: v for k, v in reports.items() if v["category"] == category}
+
+        return reports
+
+    def update_report_status(self, report_id, new_status):
+        """Update the status of a report."""
+        if new_status not in ["pending", "resolved", "closed"]:
+            raise ValueError("Invalid status. Must be 'pending', 'resolved', or 'closed'.")
+
+        with self._records(write=True) as store:
+            report = store.get("reports", report_id)
+            if report is not None:
+                report["status"] = new_status
+                store.put("reports", report_id, report)
+                print(f"Updated report {report_id} to status '{new_status}'")
+                return report
+
+    def add_order(self, farmer_id, buyer_name, product_name, quantity, price):
+        """Store order details under the respective farmer."""
+        with self._records(write=True) as store:
+            order_id = allocate_ids(store, "orders")[0]  # Generate unique order ID
+
+            order = {
+                "order_id": order_id,
+                "farmer_id": farmer_id,
+                "buyer_name": buyer_name,
+                "product_name": product_name,
+                "quantity": quantity,
+                "price": price,
+                "status": "Pending",
+                "created_at": datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            }
+
+            # Store the order under the farmer's ID
+            farmer_orders = store.get("orders", farmer_id, [])
+            farmer_orders.append(order)
+
+            store.put("orders", farmer_id, farmer_orders)  # Save changes
+
+    def get_farmer_orders(self, farmer_id):
+        """Retrieve all orders for a given farmer."""
+        with self._records() as store:
+            farmer_orders = store.get("orders", farmer_id, [])
+            print(f"DEBUG: Orders fetched for farmer {farmer_id}: {farmer_orders}")  # Debugging
+            return farmer_orders  # Return orders for the specific farmer
+
+    def get_farmer_orders_page(self, farmer_id, cursor=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Retrieve one page of a farmer's orders, newest first.
+
+        Orders are stamped in UTC, so `since` and `until` are compared in UTC too.
+
+        :param farmer_id: ID of the farmer
+        :param cursor: "next_cursor" of the previous page (an order ID), or None for the newest page
+        :return: {"items": [order, ...], "next_cursor": cursor of the next page or None}
+        """
+        since, until = history_bounds(since, until)
+        with self._records() as store:
+            orders, next_cursor = store.page("orders", farmer_id, cursor, limit, since, until)
+        return {"items": orders, "next_cursor": next_cursor}
+
+    def update_device_status(self, device_id, status):
+        """Updates the status of an IoT device."""
+        with self._records(write=True) as store:
+            device = store.get("iot_devices", device_id)
+            if device is not None:
+                device["status"] = status
+                store.put("iot_devices", device_id, device)
+
+    def move_plant_to_another_device(self, plant_id, farmer_id):
+        """Moves a plant to another available IoT device under the same farmer."""
+        with self._records(write=True) as store:
+            available_devices = [
+                device_id for device_id, device in store.load_table("iot_devices").items()
+                if device["farmer_id"] == farmer_id and device["status"] == "Active"
+            ]
+            if available_devices:
+                new_device_id = available_devices[0]  # Move to the first available device
+                plant = store.get("plants", plant_id)
+                plant["device_id"] = new_device_id
+                store.put("plants", plant_id, plant)
+                return new_device_id
+            return None
+
+    def log_failure(self, device_id, failure_type):
+        """Logs a failure event for an IoT device."""
+        with self._records(write=True) as store:
+            store.put("failures", device_id, {
+                "failure_type": failure_type,
+                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "status": "Pending"
+            })
+
+    def check_and_refund_if_plant_dies(self, plant_id):
+        """Checks if a plant has died and refunds the user if necessary."""
+        with self._records(write=True) as store:
+            plant = store.get("plants", plant_id)
+            if plant is not None and plant["status"] == "Dead":
+                user_id = plant["user_id"]
+                user = store.get("users", user_id)
+                user["balance"] += plant["investment"]  # Refund the user
+                store.delete("plants", plant_id)  # Remove the dead plant
+                store.put("users", user_id, user)
+
+    def register_iot_device(self, farmer_id, device_id):
+        """Registers an IoT device to a farmer."""
+        with self._records(write=True) as store:
+            # Ensure the farmer exists
+            farmer = store.get("users", farmer_id)
+            if not farmer or farmer["role"] != "farmer":
+                return {"error": "Farmer does not exist or is not a valid farmer."}
+
+            # Store the IoT device under the farmer's ID
+            store.put("iot_devices", device_id, {
+                "farmer_id": farmer_id,
+                "status": "Active",
+                "assigned_user": None  # Ensure device starts unassigned
+            })
+            return {"message": f"IoT Device {device_id} registered successfully!"}
+
+    def add_discounted_item(self, item_id, name, price, stock, days_until_expiry):
+        """Add a new discounted item with an expiry date."""
+        with self._records(write=True) as store:
+            store.put("discounted_items", item_id, normalize_discounted_item({
+                "name": name,
+                "price": price,
+                "stock": stock,
+                "expiry_date": (datetime.now() + timedelta(days=days_until_expiry)).strftime("%Y-%m-%d"),
+            }))
+
+    def add_discounted(self, item):
+        """
+        Add a farmer's discounted product and purge expired ones while the store is open for writing.
+
+        :param item: Item fields (name, price, stock, category, expiry_date, image_url, owner_id)
+        :return: ID of the new item
+        """
+        with self._records(write=True) as store:
+            self._purge_expired_items(store)
+            item_id = allocate_ids(store, "discounted_items")[0]
+            store.put("discounted_items", item_id, normalize_discounted_item(item))
+        return item_id
+
+    def update_discounted(self, item_id, item):
+        """Replace the stored fields of an existing discounted item."""
+        with self._records(write=True) as store:
+            store.put("discounted_items", item_id, normalize_discounted_item(item))
+
+    def delete_discounted(self, item_id):
+        """Remove a discounted item."""
+        with self._records(write=True) as store:
+            store.delete("discounted_items", item_id)
+
+    def get_valid_discounted_items(self):
+        """Retrieve only valid (non-expired) discounted items without modifying the store."""
+        today = datetime.now().strftime("%Y-%m-%d")
+        return {
+            item_id: item for item_id, item in self.get_all_items().items()
+            if not is_expired(item, today)
+        }
+
+    def purge_expired_items(self):
+        """Delete expired discounted items; returns the IDs that were removed."""
+        with self._records(write=True) as store:
+            return self._purge_expired_items(store)
+
+    def _purge_expired_items(self, store):
+        today = datetime.now().strftime("%Y-%m-%d")
+        expired = [
+            item_id for item_id, item in store.load_table("discounted_items").items()
+            if is_expired(item, today)
+        ]
+        for item_id in expired:
+            store.delete("discounted_items", item_id)
+        if expired:
+            print(f"Removed expired products: {expired}")
+        return expired
+
+    def get_discounted_items(self):
+        """Retrieve all discounted items."""
+        with self._records() as store:
+            return store.load_table("discounted_items")
+
+
+    def log_report(self, user_id, product_id, customer_id, issue):
+        """
+        Logs a report for a return issue.
+
+        :param user_id: ID of the farmer who is reporting the issue
+        :param product_id: ID of the product being reported
+        :param customer_id: ID of the customer who made the return
+        :param issue: Description of the issue
+        """
+        with self._records(write=True) as store:
+            # Get the customer's existing reports or start a new list
+            reports = store.get("return_reports", customer_id, [])
+
+            # Add the new report
+            reports.append({
+                "product_id": product_id,
+                "issue": issue,
+                "reported_by": user_id,  # Who reported the issue
+                "status": "reported",  # Optional: You can track the status of the report
+            })
+
+            # Save the customer's reports back into the database
+            store.put("return_reports", customer_id, reports)
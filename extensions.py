@@ -0,0 +1,41 @@
+"""Resources the blueprints share, created for the running app on first use rather than at import."""
+import os
+
+from flask import current_app, has_app_context
+
+from database import DATABASE_FILE, EnhancedDatabaseManager
+
+EXTENSION_KEY = "harvest_haven"
+DEFAULT_UPLOAD_FOLDER = os.path.join("static", "uploads")
+
+_default_manager = None
+
+
+def get_db_manager():
+    """Return the database manager of the current app (config DATABASE), or of DATABASE_FILE outside one."""
+    global _default_manager
+    if has_app_context():
+        state = current_app.extensions.setdefault(EXTENSION_KEY, {})
+        if "db_manager" not in state:
+            state["db_manager"] = EnhancedDatabaseManager(current_app.config.get("DATABASE", DATABASE_FILE))
+        return state["db_manager"]
+    if _default_manager is None:
+        _default_manager = EnhancedDatabaseManager()
+    return _default_manager
+
+
+class _ManagerProxy:
+    """Module-level stand-in for get_db_manager(), so blueprints can keep a `db_manager` global."""
+
+    def __getattr__(self, name):
+        return getattr(get_db_manager(), name)
+
+
+db_manager = _ManagerProxy()
+
+
+def upload_folder():
+    """Return the folder uploaded images are saved to (config UPLOAD_FOLDER), creating it if needed."""
+    folder = current_app.config.get("UPLOAD_FOLDER", DEFAULT_UPLOAD_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return folder
@@ -0,0 +1,93 @@
+"""
+Idempotency keys for routes that charge a balance or credit points, so clients can retry them safely.
+
+A client sends a key with the request, in the Idempotency-Key header or, from an HTML form, in the
+"idempotency_key" field (templates render a fresh one with idempotency_key()). The first request
+with a key runs the route and its response is recorded, flashed messages included; a duplicate
+gets the recorded response back instead of running the route again. Keys are scoped to the
+logged-in user and stored with the database (see claim_idempotency_key), so a retry that
+reaches another worker is replayed too. Requests without a key run as before.
+"""
+import functools
+import hashlib
+import uuid
+
+from flask import Response, flash, jsonify, make_response, request, session
+
+from database import IDEMPOTENCY_PENDING
+from extensions import db_manager
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_FIELD = "idempotency_key"
+MAX_KEY_LENGTH = 255
+# Responses with bodies larger than this are replayed as their status and headers only
+MAX_RECORDED_BODY = 64 * 1024
+# Headers kept with a recorded response
+RECORDED_HEADERS = ("Content-Type", "Location")
+
+
+def new_idempotency_key():
+    """Return a fresh key for a form to submit with its request."""
+    return uuid.uuid4().hex
+
+
+def request_fingerprint():
+    """Digest of what the current request asks for, to catch a key reused for another request."""
+    form = sorted((name, value) for name, value in request.form.items(multi=True) if name != IDEMPOTENCY_FIELD)
+    digest = hashlib.sha256(repr((request.method, request.path, form)).encode())
+    if not request.form:
+        digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def record_response(response, flashes):
+    """Return the stored form of a response: [status, [(header, value), ...], body, flashed messages]."""
+    headers = [(name, response.headers[name]) for name in RECORDED_HEADERS if name in response.headers]
+    body = b"" if response.is_streamed else response.get_data()
+    return [response.status_code, headers, body if len(body) <= MAX_RECORDED_BODY else b"", flashes]
+
+
+def replay_response(recorded):
+    """Rebuild a recorded response and flash its messages again."""
+    status, headers, body, flashes = recorded
+    for category, message in flashes:
+        flash(message, category)
+    response = Response(body, status=status, headers=headers)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view):
+    """Make a route replay its first response for requests that repeat an idempotency key."""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER) or request.form.get(IDEMPOTENCY_FIELD)
+        user_id = session.get('user_id')
+        if not key or not user_id:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"Idempotency keys are at most {MAX_KEY_LENGTH} characters."}), 400
+
+        try:
+            recorded = db_manager.claim_idempotency_key(user_id, key, request_fingerprint())
+        except ValueError as error:
+            return jsonify({"error": str(error)}), 422
+        if recorded == IDEMPOTENCY_PENDING:
+            response = jsonify({"error": "A request with this idempotency key is still being processed."})
+            response.headers["Retry-After"] = "1"
+            return response, 409
+        if recorded is not None:
+            return replay_response(recorded)
+
+        flashed = len(session.get('_flashes', []))
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            db_manager.release_idempotency_key(user_id, key)  # Nothing to replay: let a retry run it
+            raise
+        flashes = [tuple(message) for message in session.get('_flashes', [])[flashed:]]
+        db_manager.complete_idempotency_key(user_id, key, record_response(response, flashes))
+        return response
+
+    return wrapper
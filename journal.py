@@ -0,0 +1,444 @@
+import bisect
+import os
+import pickle
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+# Each frame is a 4-byte big-endian length followed by a pickled event tuple.
+FRAME_HEADER = struct.Struct(">I")
+SEGMENT_SUFFIX = ".seg"
+SEGMENT_BYTES = 4 * 1024 * 1024
+COMPACT_AFTER_SEGMENTS = 8
+# Taken shared by readers and exclusively by writers in every worker process.
+LOCK_FILE = "journal.lock"
+# While this file exists (e.g. during a snapshot) segments are not compacted.
+HOLD_FILE = "compaction.hold"
+
+# Event streams: purchases, redemptions and refunds make up a user's transactions, returns are separate.
+TRANSACTIONS = "transactions"
+RETURNS = "returns"
+STREAM_OF_KIND = {"purchase": TRANSACTIONS, "redemption": TRANSACTIONS, "refund": TRANSACTIONS, "return": RETURNS}
+PAGE_SIZE = 20
+
+
+def encode_frame(event):
+    payload = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def read_frame(f):
+    """Read the next frame; returns None at end of file or on a torn (partial) frame."""
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (length,) = FRAME_HEADER.unpack(header)
+    payload = f.read(length)
+    if len(payload) < length:
+        return None
+    return pickle.loads(payload)
+
+
+def select_page(entries, limit=PAGE_SIZE, since=None, until=None):
+    """
+    Pick one page from (cursor, date, item) entries given newest first, dated in that order.
+
+    Dates are "YYYY-MM-DD HH:MM:SS" strings; undated entries are left out when a range is given.
+
+    :return: ([item, ...], cursor of the next page or None on the last one)
+    """
+    picked = []
+    for cursor, date, item in entries:
+        if since and date and date < since:
+            break  # Everything further back is older still
+        if ((since or until) and not date) or (until and date > until):
+            continue
+        picked.append((cursor, item))
+        if len(picked) > limit:
+            break
+    return [item for _, item in picked[:limit]], picked[limit - 1][0] if len(picked) > limit else None
+
+
+class TransactionJournal:
+    """
+    Append-only, segment-based log of purchase, redemption and return events.
+
+    Appending an event writes one frame to the end of the active segment instead of rewriting a
+    user's whole history. An in-memory index maps (stream, user) to the frame offsets of that
+    user's events, so a history read only touches that user's frames; a second one lists each
+    user's appends with their dates in sequence (i.e. time) order, so a page of history only
+    reads the frames on that page. Closed segments are
+    periodically compacted into one segment ordered by user, which makes those reads sequential
+    and folds status updates into the events they target.
+
+    Worker processes share the journal through a file lock: writers hold it exclusively so
+    sequence numbers are never handed out twice, readers hold it shared so a compaction cannot
+    remove a segment they are reading.
+
+    Frames on disk are ("append", seq, stream, user_id, record),
+    ("update", seq, stream, user_id, target_seq, changes) or ("mark", seq, None, None), which only
+    records the last sequence number handed out when the events holding it were archived.
+    """
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, compact_after=COMPACT_AFTER_SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compact_after = compact_after
+        self._lock = threading.RLock()
+        self._index = {}  # (stream, user_id) -> [(segment, offset), ...]
+        self._timeline = {}  # (stream, user_id) -> [(seq, date, segment, offset), ...] of appends, by seq
+        self._updates = {}  # (stream, user_id) -> {target seq: [(segment, offset), ...]}
+        self._scanned = {}  # segment -> (size scanned, inode)
+        self._last_seq = 0
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._lock_depth = 0
+        self._refresh()
+
+    # ----- segment files -----
+
+    def _segments(self):
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit()
+        )
+
+    def _path(self, segment):
+        return os.path.join(self.directory, f"{segment:08d}{SEGMENT_SUFFIX}")
+
+    _read_frame = staticmethod(read_frame)
+    _frame = staticmethod(encode_frame)
+
+    def _refresh(self):
+        """Index frames written since the last scan (possibly by another process)."""
+        with self._lock:
+            segments = self._segments()
+            stats = {segment: os.stat(self._path(segment)) for segment in segments}
+            replaced = any(
+                segment not in stats or stats[segment].st_ino != inode
+                for segment, (_, inode) in self._scanned.items()
+            )
+            if replaced:  # A compaction swapped segments underneath us: rebuild from scratch
+                self._forget()
+
+            for segment in segments:
+                size, _ = self._scanned.get(segment, (0, None))
+                if stats[segment].st_size == size:
+                    continue
+                with open(self._path(segment), "rb") as f:
+                    f.seek(size)
+                    while True:
+                        offset = f.tell()
+                        event = self._read_frame(f)
+                        if event is None:
+                            break
+                        if event[0] != "mark":
+                            self._index_event(event, segment, offset)
+                        self._last_seq = max(self._last_seq, event[1])
+                        size = f.tell()
+                self._scanned[segment] = (size, stats[segment].st_ino)
+
+    def _index_event(self, event, segment, offset):
+        key = (event[2], event[3])
+        self._index.setdefault(key, []).append((segment, offset))
+        if event[0] == "append":
+            record = event[4] if isinstance(event[4], dict) else {}
+            self._timeline.setdefault(key, []).append((event[1], record.get("date") or "", segment, offset))
+        else:
+            self._updates.setdefault(key, {}).setdefault(event[4], []).append((segment, offset))
+
+    def _forget(self):
+        self._index.clear()
+        self._timeline.clear()
+        self._updates.clear()
+        self._scanned.clear()
+
+    @contextmanager
+    def _locked(self, exclusive=False):
+        """Hold the in-process lock and the file lock; nested calls reuse the outer file lock."""
+        with self._lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _active_segment(self):
+        """Return the segment to append to, rotating when it has grown past segment_bytes."""
+        segments = self._segments()
+        if not segments:
+            return 1
+        active = segments[-1]
+        size = os.path.getsize(self._path(active))
+        # Also rotate past a torn frame left by a crash, so new frames stay readable.
+        if size >= self.segment_bytes or self._scanned.get(active, (0, None))[0] != size:
+            return active + 1
+        return active
+
+    def _write(self, events):
+        """Append event tuples to the active segment with a single write."""
+        with open(self._path(self._active_segment()), "ab") as f:
+            f.write(b"".join(self._frame(event) for event in events))
+        self._refresh()  # Index the new frames (and any another process appended before them)
+
+    # ----- public API -----
+
+    def append(self, kind, user_id, record):
+        """Append one event and return its sequence number."""
+        return self.append_many([(kind, user_id, record)])[0]
+
+    def append_many(self, entries):
+        """
+        Append several events in one write.
+
+        :param entries: Iterable of (kind, user_id, record) with kind "purchase", "redemption", "refund" or "return"
+        :return: Sequence numbers of the new events
+        """
+        with self._locked(exclusive=True):
+            self._refresh()
+            events = []
+            for kind, user_id, record in entries:
+                self._last_seq += 1
+                events.append(("append", self._last_seq, STREAM_OF_KIND[kind], user_id, record))
+            if events:
+                self._write(events)
+                self._maybe_compact()
+            return [event[1] for event in events]
+
+    def update(self, stream, user_id, target_seq, changes):
+        """Record a change (e.g. a return's new status) to an earlier event."""
+        with self._locked(exclusive=True):
+            self._refresh()
+            self._last_seq += 1
+            self._write([("update", self._last_seq, stream, user_id, target_seq, changes)])
+            return self._last_seq
+
+    def read(self, stream, user_id):
+        """Return a user's events in order as [(seq, record), ...] with updates applied."""
+        with self._locked():
+            self._refresh()
+            events = {}
+            handle, handle_segment = None, None
+            try:
+                for segment, offset in self._index.get((stream, user_id), ()):
+                    if segment != handle_segment:  # Frames are grouped by segment: one open each
+                        if handle:
+                            handle.close()
+                        handle, handle_segment = open(self._path(segment), "rb"), segment
+                    handle.seek(offset)
+                    event = self._read_frame(handle)
+                    if event[0] == "append":
+                        events[event[1]] = event[4]
+                    elif event[4] in events:
+                        events[event[4]].update(event[5])
+            finally:
+                if handle:
+                    handle.close()
+            return sorted(events.items())
+
+    def records(self, stream, user_id):
+        """Return a user's event records in order."""
+        return [record for _, record in self.read(stream, user_id)]
+
+    def page(self, stream, user_id, before=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Return one page of a user's events, newest first, with updates applied.
+
+        :param before: Cursor returned with the previous page; only events older than it are returned
+        :param since: Only events dated at or after this "YYYY-MM-DD HH:MM:SS" string
+        :param until: Only events dated at or before this one; undated events are left out of any range
+        :return: ([(seq, record), ...], cursor of the next page or None on the last one)
+        """
+        with self._locked():
+            self._refresh()
+            key = (stream, user_id)
+            timeline = self._timeline.get(key, [])
+            end = len(timeline) if before is None else bisect.bisect_left(timeline, (before,))
+            newest_first = (timeline[position] for position in range(end - 1, -1, -1))
+            picked, cursor = select_page(((entry[0], entry[1], entry) for entry in newest_first), limit, since, until)
+            updates = self._updates.get(key, {})
+            handles = {}
+            try:
+                def load(segment, offset):
+                    if segment not in handles:
+                        handles[segment] = open(self._path(segment), "rb")
+                    handles[segment].seek(offset)
+                    return self._read_frame(handles[segment])
+
+                events = []
+                for seq, _, segment, offset in picked:
+                    record = dict(load(segment, offset)[4])
+                    for location in updates.get(seq, ()):
+                        record.update(load(*location)[5])
+                    events.append((seq, record))
+            finally:
+                for handle in handles.values():
+                    handle.close()
+            return events, cursor
+
+    def users(self, stream):
+        """List every user with at least one event in a stream."""
+        with self._locked():
+            self._refresh()
+            return [user_id for (event_stream, user_id) in self._index if event_stream == stream]
+
+    def compaction_held(self):
+        return os.path.exists(os.path.join(self.directory, HOLD_FILE))
+
+    def hold_compaction(self, held=True):
+        """Stop (or resume) compaction, e.g. while a snapshot reads the segments."""
+        path = os.path.join(self.directory, HOLD_FILE)
+        if held:
+            open(path, "w").close()
+        elif os.path.exists(path):
+            os.remove(path)
+
+    def last_seq(self):
+        """Return the sequence number of the newest event."""
+        with self._locked():
+            self._refresh()
+            return self._last_seq
+
+    def events(self, until_seq=None):
+        """
+        Return the raw event tuples in sequence order, updates included.
+
+        :param until_seq: Only events with a sequence number up to this one
+        """
+        with self._locked():
+            self._refresh()
+            events = []
+            for segment in self._segments():
+                with open(self._path(segment), "rb") as f:
+                    while True:
+                        event = self._read_frame(f)
+                        if event is None:
+                            break
+                        if until_seq is None or event[1] <= until_seq:
+                            events.append(event)
+            return sorted(events, key=lambda event: event[1])
+
+    def import_events(self, events):
+        """Append raw event tuples keeping their sequence numbers, which must follow the newest one."""
+        with self._locked(exclusive=True):
+            self._refresh()
+            events = sorted(events, key=lambda event: event[1])
+            if events and events[0][1] <= self._last_seq:
+                raise ValueError(f"Event {events[0][1]} is not newer than the journal's last event {self._last_seq}")
+            if events:
+                self._write(events)
+            return len(events)
+
+    def extract(self, stream, before, select=None, sink=None):
+        """
+        Move a stream's events dated before `before` out of the journal, e.g. into an archive.
+
+        The whole journal is rewritten without them (and their updates). Nothing moves while
+        compaction is held, as a snapshot may be reading the segments.
+
+        :param before: "YYYY-MM-DD HH:MM:SS"; undated events are never moved
+        :param select: Optional test on a record (updates applied) that it must also pass
+        :param sink: Called with [(user_id, seq, record), ...] before they are dropped; if it
+            raises, the journal is left as it was
+        :return: Number of events moved
+        """
+        with self._locked(exclusive=True):
+            if self.compaction_held():
+                return 0
+            self._refresh()
+            moved = []
+            for (event_stream, user_id), timeline in list(self._timeline.items()):
+                if event_stream != stream or not any(date and date < before for _, date, _, _ in timeline):
+                    continue
+                for seq, record in self.read(stream, user_id):
+                    date = record.get("date") or ""
+                    if date and date < before and (select is None or select(record)):
+                        moved.append((user_id, seq, record))
+            if not moved:
+                return 0
+            if sink is not None:
+                sink(moved)
+
+            dropped = {seq for _, seq, _ in moved}
+            kept = [event for event in self.events() if event[0] != "mark" and event[1] not in dropped
+                    and not (event[0] == "update" and event[4] in dropped)]
+            kept.append(("mark", self._last_seq, None, None))  # The newest event may have moved
+            segments = self._segments()
+            target = self._path(segments[0])
+            with open(target + ".tmp", "wb") as f:
+                f.write(b"".join(self._frame(event) for event in kept))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(target + ".tmp", target)
+            for segment in segments[1:]:
+                os.remove(self._path(segment))
+
+            self._forget()
+            self._refresh()
+            return len(moved)
+
+    def compact(self):
+        """
+        Merge all closed segments into one, grouped by user with updates folded in.
+
+        :return: Number of segments that were merged
+        """
+        with self._locked(exclusive=True):
+            if self.compaction_held():
+                return 0
+            self._refresh()
+            segments = self._segments()
+            closed = segments[:-1]
+            if len(closed) < 2:
+                return 0
+
+            closed_set = set(closed)
+            merged = []
+            for (stream, user_id), locations in sorted(self._index.items(), key=lambda item: repr(item[0])):
+                if not any(segment in closed_set for segment, _ in locations):
+                    continue
+                events = {}
+                for segment, offset in locations:
+                    if segment not in closed_set:
+                        continue
+                    with open(self._path(segment), "rb") as f:
+                        f.seek(offset)
+                        event = self._read_frame(f)
+                    if event[0] == "append":
+                        events[event[1]] = dict(event[4])
+                    elif event[4] in events:
+                        events[event[4]].update(event[5])
+                    else:
+                        merged.append(event)  # Update whose target was compacted earlier
+                merged.extend(("append", seq, stream, user_id, record) for seq, record in sorted(events.items()))
+
+            target = self._path(closed[0])
+            with open(target + ".tmp", "wb") as f:
+                f.write(b"".join(self._frame(event) for event in merged))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(target + ".tmp", target)
+            for segment in closed[1:]:
+                os.remove(self._path(segment))
+
+            self._forget()
+            self._refresh()
+            return len(closed)
+
+    def _maybe_compact(self):
+        if len(self._segments()) > self.compact_after:
+            self.compact()
@@ -1,45 +1,86 @@
-from flask import Flask, redirect, url_for
-from Profile_Section import profile_bp
-from Product_Section import product_bp
-from Discounted_Section import discounted_bp
-from CheckOut_Section import checkout_bp
-from Reward_Section import reward_bp
-from Return_Section import return_bp
-from database import EnhancedDatabaseManager
-
-
-import os
-
-app = Flask(__name__)
-app.secret_key = "master_secret_key"
-
-
-# Configure file uploads
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'static', 'uploads')  # Save images in static/uploads
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)  # Ensure the upload folder exists
-
-
-# Initialize the database
-manager = EnhancedDatabaseManager()
-manager.initialize_database()
-
-# Register blueprints for each section
-app.register_blueprint(profile_bp, url_prefix='/profile')
-app.register_blueprint(product_bp, url_prefix='/products')
-app.register_blueprint(discounted_bp, url_prefix='/discounted')
-app.register_blueprint(checkout_bp, url_prefix='/checkout')
-app.register_blueprint(reward_bp, url_prefix='/rewards')
-app.register_blueprint(return_bp, url_prefix='/returns')
-
-@app.route('/')
-def index():
-    """Redirect to profile section."""
-    return redirect(url_for('profile.home'))
-
-if __name__ == '__main__':
-    app.run(debug=True)
-
+"""
+Flask entry point. Build the app with create_app(); initialize the store separately, once per
+database rather than in every worker:
+
+    python manage_db.py init                 # create default tables, run pending migrations
+    gunicorn "main_website:create_app()"
+
+`python main_website.py` does both and runs the development server.
+"""
+import importlib
+
+from flask import Flask, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+
+from database import COMPACT_INTERVAL, DATABASE_FILE, HOLD_SWEEP_INTERVAL, start_compactor, start_hold_sweeper
+from extensions import DEFAULT_UPLOAD_FOLDER, get_db_manager
+from idempotency import new_idempotency_key
+from records import Record
+
+# (module, blueprint attribute, URL prefix); modules are imported when an app is created.
+BLUEPRINTS = [
+    ("Profile_Section", "profile_bp", "/profile"),
+    ("Product_Section", "product_bp", "/products"),
+    ("Discounted_Section", "discounted_bp", "/discounted"),
+    ("CheckOut_Section", "checkout_bp", "/checkout"),
+    ("Reward_Section", "reward_bp", "/rewards"),
+    ("Return_Section", "return_bp", "/returns"),
+]
+
+
+class RecordJSONProvider(DefaultJSONProvider):
+    """JSON provider that writes the store's record classes (see records.py) as plain objects."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Record):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
+def create_app(config=None):
+    """
+    Build the Flask app. The store is neither opened nor seeded here; see initialize_store.
+
+    :param config: Optional dict overriding the defaults, e.g. {"DATABASE": path}
+    """
+    app = Flask(__name__)
+    app.json = RecordJSONProvider(app)
+    app.secret_key = "master_secret_key"
+    app.config.update(
+        DATABASE=DATABASE_FILE,
+        UPLOAD_FOLDER=DEFAULT_UPLOAD_FOLDER,  # Created on the first upload
+        COMPACT_INTERVAL=COMPACT_INTERVAL,
+        HOLD_SWEEP_INTERVAL=HOLD_SWEEP_INTERVAL,
+    )
+    app.config.update(config or {})
+
+    for module, blueprint, url_prefix in BLUEPRINTS:
+        app.register_blueprint(getattr(importlib.import_module(module), blueprint), url_prefix=url_prefix)
+    # Forms of retry-safe routes submit a fresh key (see idempotency.py)
+    app.add_template_global(new_idempotency_key, "idempotency_key")
+
+    @app.route('/')
+    def index():
+        """Redirect to profile section."""
+        return redirect(url_for('profile.home'))
+
+    if app.config["COMPACT_INTERVAL"]:
+        # Reclaim dead space in the background
+        start_compactor(app.config["DATABASE"], app.config["COMPACT_INTERVAL"])
+    if app.config["HOLD_SWEEP_INTERVAL"]:
+        # Drop expired cart holds in bulk
+        start_hold_sweeper(app.config["DATABASE"], app.config["HOLD_SWEEP_INTERVAL"])
+    return app
+
+
+def initialize_store(app):
+    """Create the default tables of the app's database if they are missing and run pending migrations."""
+    with app.app_context():
+        get_db_manager().initialize_database()
+
+
+if __name__ == '__main__':
+    app = create_app()
+    initialize_store(app)
+    app.run(debug=True)
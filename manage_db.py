@@ -0,0 +1,168 @@
+"""Maintenance commands for the central database, e.g. `python manage_db.py migrate`."""
+import argparse
+
+from database import (
+    ARCHIVE_AFTER_DAYS, CART_IDLE_DAYS, DATABASE_FILE, EnhancedDatabaseManager, backend_for, migrate_catalog, migrate_indexes,
+    migrate_ownership, migrate_records, migrate_sequences, repair_sequences,
+)
+from snapshot import SNAPSHOT_BATCH, restore_snapshot, take_snapshot
+
+
+def init(args):
+    """Create the default tables if they are missing and run pending migrations."""
+    EnhancedDatabaseManager(args.db).initialize_database()
+
+
+def migrate(args):
+    """Convert a whole-table database to the current layout and normalize the catalog in place."""
+    backend_for(args.db).migrate()
+    migrate_indexes(args.db)
+    migrate_catalog(args.db)
+    migrate_sequences(args.db)
+    migrate_ownership(args.db)
+    migrate_records(args.db)
+
+
+def purge_expired(args):
+    """Delete discounted items whose expiry date has passed."""
+    removed = EnhancedDatabaseManager(args.db).purge_expired_items()
+    print(f"Removed {len(removed)} expired discounted items.")
+
+
+def compact_journal(args):
+    """Merge closed transaction journal segments."""
+    merged = EnhancedDatabaseManager(args.db).journal.compact()
+    print(f"Compacted {merged} journal segments.")
+
+
+def archive_history(args):
+    """Move old transactions, resolved returns and closed reports to the compressed archive."""
+    manager = EnhancedDatabaseManager(args.db)
+    moved = manager.archive_history(days=args.days)
+    print(f"Archived records older than {args.days} days: {moved}")
+    for stream, stats in manager.archive.stats().items():
+        print(f"{stream:<16}{stats['users']:>8} users{stats['partitions']:>6} partitions{stats['bytes']:>12} bytes")
+
+
+def repair_id_sequences(args):
+    """Move the ID sequences past the highest IDs in use."""
+    with backend_for(args.db).writing() as store:
+        repaired = repair_sequences(store)
+    print(f"Repaired sequences: {repaired}" if repaired else "All sequences are ahead of the data.")
+
+
+def compact(args):
+    """Reclaim dead space in the data file while the app keeps running."""
+    backend = backend_for(args.db)
+    before, after = backend.compact()
+    if before is None:
+        print("This dbm kind manages its own space; nothing to compact.")
+    else:
+        print(f"Compacted {args.db}: {before} -> {after} bytes ({before - after} reclaimed).")
+    if args.report:
+        space_report(args)
+
+
+def space_report(args):
+    """Print live vs dead bytes in the data file and the largest tables and keys."""
+    report = backend_for(args.db).space_report(top=args.top)
+    print(f"File:    {report['file_bytes']:>12} bytes")
+    print(f"Live:    {report['live_bytes']:>12} bytes in {report['keys']} keys")
+    print(f"Padding: {report['padding_bytes']:>12} bytes (block alignment, or SQLite page overhead)")
+    print(f"Dead:    {report['dead_bytes']:>12} bytes ({report['dead_ratio']:.1%})")
+    print(f"\n{'table':<36}{'keys':>8}{'bytes':>12}{'largest':>10}")
+    for table, usage in report["tables"].items():
+        print(f"{table:<36}{usage['keys']:>8}{usage['bytes']:>12}{usage['largest']:>10}")
+    if report["largest_keys"]:
+        print(f"\n{'largest keys':<56}{'bytes':>10}")
+        for key, size in report["largest_keys"]:
+            print(f"{key:<56}{size:>10}")
+
+
+def snapshot(args):
+    """Write a consistent copy of the store to a file while the app keeps running."""
+    result = take_snapshot(args.db, args.output, args.batch)
+    print(f"Wrote {result['bytes']} bytes to {args.output} in {result['seconds']}s ({result['mb_per_second']} MB/s).")
+    if "keys" in result:
+        print(f"{result['keys']} keys, {result['events']} journal events; "
+              f"{result['changed_during_snapshot']} keys were changed by writers meanwhile.")
+
+
+def sweep_holds(args):
+    """Drop expired cart holds."""
+    swept = EnhancedDatabaseManager(args.db).sweep_expired_holds()
+    print(f"Swept {swept} expired cart holds.")
+
+
+def sweep_idempotency_keys(args):
+    """Drop expired idempotency keys."""
+    swept = EnhancedDatabaseManager(args.db).sweep_idempotency_keys()
+    print(f"Swept {swept} expired idempotency keys.")
+
+
+def evict_carts(args):
+    """Delete idle carts and release their holds."""
+    evicted = EnhancedDatabaseManager(args.db).evict_idle_carts(args.days)
+    print(f"Evicted {evicted} carts idle for over {args.days} days.")
+
+
+def restore(args):
+    """Rebuild a store from a snapshot, optionally replaying its history up to a timestamp."""
+    result = restore_snapshot(args.snapshot, args.target, until=args.until, history_db=args.history)
+    print(f"Restored {args.snapshot} into {args.target}: {result}")
+
+
+def import_sqlite(args):
+    """Copy the shelve database and its journal into a SQLite database."""
+    from sqlite_backend import import_shelve
+    import_shelve(args.db, args.target)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Harvest Haven database maintenance")
+    parser.add_argument("--db", default=DATABASE_FILE, help="Path of the database (.sqlite3 for the SQLite backend)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("init", help="Create default tables and run pending migrations").set_defaults(func=init)
+    commands.add_parser("migrate", help="Run pending storage and catalog migrations").set_defaults(func=migrate)
+    commands.add_parser("purge-expired", help="Delete expired discounted items").set_defaults(func=purge_expired)
+    commands.add_parser("compact-journal", help="Merge closed transaction journal segments").set_defaults(
+        func=compact_journal)
+    archiver = commands.add_parser("archive", help="Move old history from the hot store to the archive")
+    archiver.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive records older than this")
+    archiver.set_defaults(func=archive_history)
+    commands.add_parser("sweep-holds", help="Drop expired cart stock holds").set_defaults(func=sweep_holds)
+    commands.add_parser("sweep-idempotency-keys", help="Drop expired idempotency keys").set_defaults(
+        func=sweep_idempotency_keys)
+    evictor = commands.add_parser("evict-carts", help="Delete idle carts and release their holds")
+    evictor.add_argument("--days", type=int, default=CART_IDLE_DAYS, help="Evict carts untouched for this long")
+    evictor.set_defaults(func=evict_carts)
+    commands.add_parser("repair-sequences", help="Seed ID sequences from existing data").set_defaults(
+        func=repair_id_sequences)
+    compactor = commands.add_parser("compact", help="Rewrite live records into a fresh data file")
+    compactor.add_argument("--report", action="store_true", help="Print the space report afterwards")
+    compactor.add_argument("--top", type=int, default=10, help="Number of largest keys to list")
+    compactor.set_defaults(func=compact)
+    reporter = commands.add_parser("space-report", help="Show live vs dead bytes and per-key sizes")
+    reporter.add_argument("--top", type=int, default=10, help="Number of largest keys to list")
+    reporter.set_defaults(func=space_report)
+    snapshotter = commands.add_parser("snapshot", help="Write a consistent copy of the store to a file")
+    snapshotter.add_argument("output", help="Snapshot file to write (a .sqlite3 file for the SQLite backend)")
+    snapshotter.add_argument("--batch", type=int, default=SNAPSHOT_BATCH, help="Keys copied per shared-lock hold")
+    snapshotter.set_defaults(func=snapshot)
+    restorer = commands.add_parser("restore", help="Rebuild a store from a snapshot into a new path")
+    restorer.add_argument("snapshot", help="Snapshot file written by the snapshot command")
+    restorer.add_argument("target", help="Path of the database to create")
+    restorer.add_argument("--until", help='Replay transactions, returns and orders up to "YYYY-MM-DD HH:MM:SS"')
+    restorer.add_argument("--history", help="Database whose history is replayed (default: the snapshot's source)")
+    restorer.set_defaults(func=restore)
+    importer = commands.add_parser("import-sqlite", help="Copy the shelve database into a SQLite database")
+    importer.add_argument("target", help="Path of the SQLite database, e.g. central_database.sqlite3")
+    importer.set_defaults(func=import_sqlite)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+Typed record classes for the products, users, trees, IoT devices, orders and carts the store holds.
+
+Each class keeps its fields in __slots__ instead of a per-record dict. The store keeps a record
+packed as a plain tuple, (extra, field values...), and the table it is read from says which class
+to rebuild, so stored records neither repeat every key nor name their class; pickled on their own,
+records carry their class and values. Records also behave as mutable mappings (record["quantity"],
+record.get(...), dict(record)), so code written against the legacy dicts keeps working while hot
+loops can use plain attributes (tree.watered).
+
+Every declared field is always present and falls back to its default; keys a class does not
+declare are kept in `extra`. Fields may only be appended to a class, never reordered or removed,
+since values are stored by position; records packed before a field was added get its default.
+"""
+from collections.abc import Mapping, MutableMapping
+from operator import attrgetter
+
+
+class Record(MutableMapping):
+    """Base class of the record types; subclasses list their fields in __slots__, in __init__ order."""
+
+    __slots__ = ("extra",)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.FIELDS = cls.__slots__
+        cls.DEFAULTS = dict(zip(cls.FIELDS, cls.__init__.__defaults__))
+        cls._field_set = frozenset(cls.FIELDS)
+        cls._values = attrgetter(*cls.FIELDS)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from a legacy dict; missing fields take their defaults."""
+        record = cls(**{name: data[name] for name in cls.FIELDS if name in data})
+        extra = {key: value for key, value in data.items() if key not in cls._field_set}
+        if extra:
+            record.extra = extra
+        return record
+
+    @classmethod
+    def unpack(cls, packed):
+        """Rebuild a record from pack()."""
+        record = cls(*packed[1:])
+        record.extra = packed[0]
+        return record
+
+    def pack(self):
+        """Return the stored form of the record: (extra or None, field values...)."""
+        return (self.extra or None,) + self._values(self)
+
+    def to_dict(self):
+        """Return the record as a plain dict, e.g. for JSON responses."""
+        data = dict(zip(self.FIELDS, self._values(self)))
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __reduce__(self):
+        if self.extra:
+            return type(self), self._values(self), self.extra
+        return type(self), self._values(self)
+
+    def __setstate__(self, extra):
+        self.extra = extra
+
+    def __getitem__(self, key):
+        if key in self._field_set:
+            return getattr(self, key)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self._field_set:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key):
+        """Drop an extra key; a declared field cannot be removed and goes back to its default."""
+        if key in self._field_set:
+            setattr(self, key, self.DEFAULTS[key])
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._field_set or (self.extra is not None and key in self.extra)
+
+    def __iter__(self):
+        yield from self.FIELDS
+        if self.extra:
+            yield from self.extra
+
+    def __len__(self):
+        return len(self.FIELDS) + (len(self.extra) if self.extra else 0)
+
+    def get(self, key, default=None):
+        if key in self._field_set:
+            return getattr(self, key)
+        return self.extra.get(key, default) if self.extra is not None else default
+
+    def copy(self):
+        return self.from_dict(self)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self._values(self) == other._values(other) and (self.extra or None) == (other.extra or None)
+        if isinstance(other, Mapping):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Product(Record):
+    """A catalog product; `price` is a float, `quantity` the units in stock."""
+
+    __slots__ = ("name", "price", "quantity", "category", "image_url", "farmer_id", "uploaded_by",
+                 "nutritional_facts")
+
+    def __init__(self, name="", price=0.0, quantity=0, category="", image_url="", farmer_id=None,
+                 uploaded_by=None, nutritional_facts=""):
+        self.name = name
+        self.price = price
+        self.quantity = quantity
+        self.category = category
+        self.image_url = image_url
+        self.farmer_id = farmer_id
+        self.uploaded_by = uploaded_by
+        self.nutritional_facts = nutritional_facts
+        self.extra = None
+
+
+class User(Record):
+    """A customer or farmer account; `points` is an int, `balance` a float."""
+
+    __slots__ = ("name", "email", "role", "points", "balance", "password")
+
+    def __init__(self, name="", email=None, role=None, points=0, balance=0.0, password=None):
+        self.name = name
+        self.email = email
+        self.role = role
+        self.points = points
+        self.balance = balance
+        self.password = password
+        self.extra = None
+
+
+class Tree(Record):
+    """A tree planted through Plant a Future; dates are "YYYY-MM-DD HH:MM:SS" strings."""
+
+    __slots__ = ("id", "type", "phase", "health", "planted_on", "watered", "fertilized", "time_remaining",
+                 "farmer_id", "farmer_name", "customer_id", "device_id", "notified", "kill_reason")
+
+    def __init__(self, id=None, type=None, phase="Seedling", health=100, planted_on=None, watered=False,
+                 fertilized=False, time_remaining=None, farmer_id=None, farmer_name=None, customer_id=None,
+                 device_id=None, notified=False, kill_reason=None):
+        self.id = id
+        self.type = type
+        self.phase = phase
+        self.health = health
+        self.planted_on = planted_on
+        self.watered = watered
+        self.fertilized = fertilized
+        self.time_remaining = time_remaining
+        self.farmer_id = farmer_id
+        self.farmer_name = farmer_name
+        self.customer_id = customer_id
+        self.device_id = device_id
+        self.notified = notified
+        self.kill_reason = kill_reason
+        self.extra = None
+
+
+class IoTDevice(Record):
+    """A farmer's IoT device; `assigned_user` is the customer whose tree it monitors, if any."""
+
+    __slots__ = ("farmer_id", "status", "assigned_user")
+
+    def __init__(self, farmer_id=None, status="Active", assigned_user=None):
+        self.farmer_id = farmer_id
+        self.status = status
+        self.assigned_user = assigned_user
+        self.extra = None
+
+
+class Order(Record):
+    """An order placed with a farmer; `created_at` is a UTC "YYYY-MM-DD HH:MM:SS" string."""
+
+    __slots__ = ("order_id", "farmer_id", "buyer_name", "product_name", "quantity", "price", "status",
+                 "created_at")
+
+    def __init__(self, order_id=None, farmer_id=None, buyer_name=None, product_name=None, quantity=0, price=0.0,
+                 status="Pending", created_at=""):
+        self.order_id = order_id
+        self.farmer_id = farmer_id
+        self.buyer_name = buyer_name
+        self.product_name = product_name
+        self.quantity = quantity
+        self.price = price
+        self.status = status
+        self.created_at = created_at
+        self.extra = None
+
+
+class Cart(Record):
+    """
+    A customer's server-side cart. `lines` and `discounted` map product / discounted item IDs to
+    quantities (discounted items are paid for when added, and `paid` maps them to the amount
+    charged); `touched` is the time.time() of the last change and `last_order` the
+    [(name, price, quantity, discounted), ...] of the last checkout.
+    """
+
+    __slots__ = ("lines", "discounted", "touched", "last_order", "paid")
+
+    def __init__(self, lines=None, discounted=None, touched=0.0, last_order=None, paid=None):
+        self.lines = {} if lines is None else lines
+        self.discounted = {} if discounted is None else discounted
+        self.touched = touched
+        self.last_order = [] if last_order is None else last_order
+        self.paid = {} if paid is None else paid
+        self.extra = None
+
+
+# Tables whose records are held as record classes. Trees and orders are stored as one list per
+# user or farmer; their elements are the records.
+RECORD_CLASSES = {"products": Product, "users": User, "trees": Tree, "iot_devices": IoTDevice, "orders": Order,
+                  "carts": Cart}
+
+
+def _as_record(record_class, value):
+    if isinstance(value, tuple):
+        return record_class.unpack(value)
+    if isinstance(value, dict):
+        return record_class.from_dict(value)
+    return value
+
+
+def as_record(table, value):
+    """Return a value of `table` (a record or a list of them) with packed tuples and legacy dicts as records."""
+    record_class = RECORD_CLASSES.get(table)
+    if record_class is None:
+        return value
+    if isinstance(value, list):
+        return [_as_record(record_class, item) for item in value]
+    return _as_record(record_class, value)
+
+
+def pack_record(table, value):
+    """Return the stored form of a value of `table`; see Record.pack."""
+    record_class = RECORD_CLASSES.get(table)
+    if record_class is None:
+        return value
+    if isinstance(value, list):
+        return [_as_record(record_class, item).pack() for item in value]
+    return _as_record(record_class, value).pack()
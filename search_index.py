@@ -0,0 +1,103 @@
+"""Trigram helpers behind the catalog search index maintained by the record stores."""
+import math
+from collections.abc import Mapping
+
+# Fields searched per table; the name counts most when ranking.
+SEARCH_FIELDS = {
+    "products": ("name", "nutritional_facts", "category"),
+    "discounted_items": ("name", "nutritional_facts", "category"),
+}
+
+# Posting lists are split into blocks of record IDs so a catalog write rewrites a bounded list.
+SEARCH_BLOCK = 4096
+SEARCH_LIMIT = 100
+# Share of a query's trigrams a record must contain to count as a (typo-tolerant) match.
+MIN_SIMILARITY = 0.5
+
+
+def normalize_text(text):
+    """Lower-case and collapse whitespace."""
+    return " ".join(str(text or "").lower().split())
+
+
+def text_grams(text):
+    """
+    Trigrams of every word padded with spaces, plus the word's first-letter bigram.
+
+    "Red kale" -> {" r", " re", "red", "ed ", " k", " ka", "kal", "ale", "le "}
+    """
+    grams = set()
+    for word in normalize_text(text).split():
+        padded = f" {word} "
+        grams.add(padded[:2])
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def record_grams(table, record):
+    """Return the set of trigrams a record is indexed under."""
+    if not isinstance(record, Mapping):
+        return set()
+    grams = set()
+    for field in SEARCH_FIELDS[table]:
+        grams |= text_grams(record.get(field))
+    return grams
+
+
+def query_grams(query):
+    """
+    Trigrams to look up for a search query.
+
+    Words of three or more letters use their inner trigrams, so they match anywhere inside a
+    word ("arr" finds "Carrot"); shorter words match the start of a word.
+    """
+    grams = []
+    for word in normalize_text(query).split():
+        if len(word) >= 3:
+            candidates = [word[i:i + 3] for i in range(len(word) - 2)]
+        else:
+            candidates = [f" {word}"]
+        grams.extend(gram for gram in candidates if gram not in grams)
+    return grams
+
+
+def block_of(record_id):
+    return record_id // SEARCH_BLOCK if isinstance(record_id, int) else 0
+
+
+def rank(table, query, hits, load, limit=SEARCH_LIMIT):
+    """
+    Order candidate records by relevance.
+
+    Exact substring matches in the name come first, then exact matches in any searched field,
+    then typo-tolerant matches by the share of query trigrams they contain.
+
+    :param hits: {record_id: number of query trigrams the record contains}
+    :param load: Function returning a record by ID (None if it is gone)
+    :return: [(record_id, record), ...] of at most `limit` results
+    """
+    grams = query_grams(query)
+    if not grams:
+        return []
+    needed = max(1, math.ceil(len(grams) * MIN_SIMILARITY))
+    phrase = normalize_text(query)
+
+    scored = []
+    exact = 0
+    for record_id, count in sorted(hits.items(), key=lambda item: (-item[1], str(item[0]))):
+        if count < needed:
+            break
+        # Only records containing every trigram can be exact matches: stop once enough are found.
+        if len(scored) >= limit and (count < len(grams) or exact >= limit):
+            break
+        record = load(record_id)
+        if record is None:
+            continue
+        name = normalize_text(record.get("name"))
+        in_name = phrase in name
+        anywhere = in_name or any(phrase in normalize_text(record.get(field)) for field in SEARCH_FIELDS[table])
+        exact += anywhere
+        scored.append(((not in_name, not anywhere, -count, name, str(record_id)), record_id, record))
+
+    scored.sort(key=lambda entry: entry[0])
+    return [(record_id, record) for _, record_id, record in scored[:limit]]
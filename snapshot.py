@@ -0,0 +1,239 @@
+"""Consistent snapshots of the store taken while the app keeps writing, and point-in-time restore."""
+import dbm
+import dbm.dumb
+import os
+import shutil
+import time
+from datetime import datetime, timezone
+
+from database import (
+    ARCHIVE_SUFFIX, JOURNAL_SUFFIX, PREIMAGE_SUFFIX, SNAPSHOT_MARKER_SUFFIX, SQLITE_SUFFIXES, STORE_POOL, PreimageLog,
+    archive_for, backend_for, journal_for, repair_sequences,
+)
+from journal import encode_frame, read_frame
+
+# A snapshot file is a stream of frames (see journal.py): ("header", {...}), one ("record", key,
+# stored bytes) per key, one ("event", raw journal event) per journal event, one ("archive", path, bytes)
+# per file of the history archive, then ("end", keys, events).
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_BATCH = 256
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def take_snapshot(db_name, out_path, batch=SNAPSHOT_BATCH):
+    """
+    Stream a consistent copy of the store and its transaction journal to `out_path`.
+
+    Starting the snapshot takes the shared lock for as long as it takes to list the keys. From
+    then on writers save each key's old value before changing it (copy-on-write). dbm.dumb never
+    reuses a key's blocks for another key, so the keys are then read without any lock through a
+    handle whose index is frozen at the start: the preimage log is re-read after each batch, and
+    a key changed while it was read has its old value there. Other dbm kinds are copied `batch`
+    keys per shared-lock hold. SQLite databases are copied with the online backup API instead.
+
+    :return: Dict with the keys and events copied, bytes written, seconds taken, throughput and
+        the number of keys writers changed (and saved old values for) meanwhile
+    """
+    backend = backend_for(db_name)
+    if backend.name != "shelve":
+        return backend.backup(out_path)
+
+    path = os.path.abspath(db_name)
+    marker, log = path + SNAPSHOT_MARKER_SUFFIX, path + PREIMAGE_SUFFIX
+    journal = journal_for(path)
+    started = time.perf_counter()
+    created_at = datetime.now().strftime(TIMESTAMP_FORMAT)
+    preimage_log = PreimageLog(path + PREIMAGE_SUFFIX)  # Our own reader, apart from the pool's writers
+    frozen = None
+    with STORE_POOL.shared(path):  # No write is in flight in any process
+        try:
+            os.close(os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            raise RuntimeError(f"A snapshot of {path} is already running") from None
+        try:
+            preimage_log.start()
+            journal.hold_compaction()  # Compaction would fold later status changes into copied events
+            if dbm.whichdb(path) == "dbm.dumb":
+                frozen = dbm.dumb.open(path, "r")  # Reading the index once, not also the pool's handle
+                keys = sorted(frozen.keys())
+            else:
+                with STORE_POOL.reading(path) as shelf:
+                    keys = sorted(shelf.dict.keys())
+            journal_seq = journal.last_seq()
+        except BaseException:
+            os.remove(marker)
+            raise
+
+    written = changed = 0
+    events = []
+    tmp = out_path + ".tmp"
+    try:
+        with open(tmp, "wb") as out:
+            def emit(frame):
+                nonlocal written
+                data = encode_frame(frame)
+                out.write(data)
+                written += len(data)
+
+            emit(("header", {"format": SNAPSHOT_FORMAT, "database": path, "created_at": created_at,
+                             "journal_seq": journal_seq, "keys": len(keys)}))
+            for start in range(0, len(keys), batch):
+                chunk = keys[start:start + batch]
+                if frozen is not None:
+                    values = [frozen[key] for key in chunk]
+                    preimages = preimage_log.refresh()  # After reading: covers keys changed meanwhile
+                else:
+                    with STORE_POOL.reading(path) as shelf:
+                        preimages = preimage_log.refresh()
+                        values = [None if key in preimages else shelf.dict[key] for key in chunk]
+                for key, value in zip(chunk, values):
+                    value = preimages[key] if key in preimages else value
+                    if value is not None:
+                        emit(("record", key, value))
+            events = journal.events(until_seq=journal_seq)
+            for event in events:
+                emit(("event", event))
+            for name, data in archive_for(path).dump():  # Held compaction also holds archiving
+                emit(("archive", name, data))
+            emit(("end", len(keys), len(events)))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, out_path)
+    finally:
+        if frozen is not None:
+            frozen.close()
+        with STORE_POOL.shared(path):  # No writer is half-way through saving an old value
+            changed = len(preimage_log.refresh())
+            os.remove(marker)
+            os.remove(log)
+        journal.hold_compaction(False)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+    seconds = time.perf_counter() - started
+    return {
+        "keys": len(keys),
+        "events": len(events),
+        "bytes": written,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(written / 1e6 / seconds, 2) if seconds else 0.0,
+        "changed_during_snapshot": changed,
+    }
+
+
+def read_snapshot(snapshot_path):
+    """Yield the frames of a snapshot file, header first; raises ValueError if it is cut short."""
+    with open(snapshot_path, "rb") as f:
+        header = read_frame(f)
+        if not header or header[0] != "header" or header[1].get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"{snapshot_path} is not a snapshot")
+        yield header
+        while True:
+            frame = read_frame(f)
+            if frame is None:
+                raise ValueError(f"{snapshot_path} is truncated")
+            yield frame
+            if frame[0] == "end":
+                return
+
+
+def parse_timestamp(value):
+    """Accept a datetime or "YYYY-MM-DD HH:MM:SS" (local time, like the transaction dates)."""
+    return value if isinstance(value, datetime) else datetime.strptime(value, TIMESTAMP_FORMAT)
+
+
+def events_until(events, until):
+    """
+    Keep the journal events up to the last purchase, redemption or return dated at or before `until`.
+
+    Status updates carry no date; sequence numbers are handed out in time order, so an update is
+    kept when it came before that last event.
+    """
+    cutoff = 0
+    for event in events:
+        if event[0] != "append" or not isinstance(event[4], dict):
+            continue
+        try:
+            dated = datetime.strptime(event[4].get("date") or "", TIMESTAMP_FORMAT)
+        except ValueError:
+            continue  # Undated (e.g. migrated) events are kept or dropped with their neighbours
+        if dated <= until:
+            cutoff = max(cutoff, event[1])
+    return [event for event in events if event[1] <= cutoff]
+
+
+def replay_orders(store, history, until):
+    """
+    Bring the farmers' orders to `until`: drop orders created later and add those from `history`
+    created up to then.
+
+    :return: Number of orders after the replay
+    """
+    until_utc = until.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)  # Orders are stamped in UTC
+    orders = {farmer_id: [order for order in farmer_orders if order.get("created_at", "") <= until_utc]
+              for farmer_id, farmer_orders in store.load_table("orders").items()}
+    known = {order.get("order_id") for farmer_orders in orders.values() for order in farmer_orders}
+    for farmer_id, farmer_orders in history.items():
+        for order in farmer_orders:
+            if order.get("created_at", "") <= until_utc and order.get("order_id") not in known:
+                orders.setdefault(farmer_id, []).append(order)
+                known.add(order.get("order_id"))
+    store.save_table("orders", orders)
+    return len(known)
+
+
+def restore_snapshot(snapshot_path, target_db, until=None, history_db=None):
+    """
+    Rebuild a store from a snapshot into `target_db`, optionally moving its history to `until`.
+
+    Records are restored as they were when the snapshot started. With `until`, the transaction
+    and return journal and the farmers' orders are replayed to that time: what the snapshot
+    holds from after `until` is dropped, and what `history_db` (by default the database the
+    snapshot was taken from) recorded after the snapshot, up to `until`, is added. Other records
+    (balances, stock, ownership) keep their snapshot state.
+
+    :param until: datetime or "YYYY-MM-DD HH:MM:SS" in local time
+    :return: Dict with the numbers of restored records, events and orders
+    """
+    target = os.path.abspath(target_db)
+    if any(os.path.exists(target + suffix) for suffix in ("", ".dat", ".dir", JOURNAL_SUFFIX, ARCHIVE_SUFFIX)):
+        raise FileExistsError(f"{target} already exists; restore into a new path")
+    if snapshot_path.endswith(SQLITE_SUFFIXES):  # A SQLite backup is a database file itself
+        if until is not None:
+            raise ValueError("Point-in-time replay needs a shelve snapshot")
+        shutil.copy(snapshot_path, target)
+        return {"records": None, "events": None, "orders": None}
+
+    frames = read_snapshot(snapshot_path)
+    header = next(frames)[1]
+    records, events = 0, []
+    db = dbm.dumb.open(target, "n")
+    try:
+        for frame in frames:
+            if frame[0] == "record":
+                db[frame[1]] = frame[2]
+                records += 1
+            elif frame[0] == "event":
+                events.append(frame[1])
+            elif frame[0] == "archive":
+                archive_for(target).load(frame[1], frame[2])
+    finally:
+        db.close()
+
+    history = {}
+    if until is not None:
+        until = parse_timestamp(until)
+        source = os.path.abspath(history_db or header["database"])
+        if os.path.isdir(source + JOURNAL_SUFFIX):
+            events += [event for event in journal_for(source).events() if event[1] > header["journal_seq"]]
+        if os.path.exists(source + ".dat"):
+            with backend_for(source).reading() as store:
+                history = store.load_table("orders")
+        events = events_until(events, until)
+
+    journal_for(target).import_events(events)
+    with backend_for(target).writing() as store:
+        orders = replay_orders(store, history, until) if until is not None else None
+        repair_sequences(store)
+    STORE_POOL.close(target)
+    return {"records": records, "events": len(events), "orders": orders}
@@ -0,0 +1,664 @@
+import os
+import shelve
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+from contextlib import contextmanager
+
+from database import (
+    CATALOG_VERSION_KEY, CODEC, INDEXED_FIELDS, JOURNAL_SUFFIX, KEY_SEPARATOR, OWNERSHIP_VERSION_KEY, PAGED_LISTS,
+    RECORD_TABLES, RECORDS_VERSION_KEY, SEQUENCE_PREFIX, SEQUENCES_VERSION_KEY, SPLIT_FIELDS, backend_for,
+    index_values, journal_for, normalize_discounted_item, normalize_product, parse_record_key, record_key,
+    repair_sequences, space_summary,
+)
+from journal import PAGE_SIZE, RETURNS, STREAM_OF_KIND, TRANSACTIONS
+from records import as_record, pack_record
+from search_index import SEARCH_FIELDS, SEARCH_LIMIT, query_grams, rank, record_grams
+
+# Tables stored one row per record, with the record fields that are queried pulled out into
+# indexed columns. The full record is always kept in `data`, encoded by CODEC. Columns of fields listed in
+# INDEXED_FIELDS hold the index key (e.g. the normalized product name).
+ROW_TABLES = {
+    "users": ("id", ("role",)),
+    "products": ("id", ("farmer_id", "category", "name")),
+    "discounted_items": ("id", ("category", "expiry_date")),
+    "ownership": ("user_id", ()),
+    "iot_devices": ("id", ("farmer_id", "assigned_user", "status")),
+}
+
+# Tables whose records are lists (a user's trees, a farmer's orders), stored one row per element.
+LIST_TABLES = {
+    "trees": ("user_id", (("tree_id", "id"), ("farmer_id", "farmer_id"), ("device_id", "device_id"),
+                          ("phase", "phase"))),
+    "orders": ("farmer_id", (("order_id", "order_id"), ("status", "status"), ("created_at", "created_at"))),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS records (tbl TEXT NOT NULL, id NOT NULL, data BLOB NOT NULL, PRIMARY KEY (tbl, id));
+
+CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, role TEXT, data BLOB NOT NULL);
+CREATE INDEX IF NOT EXISTS users_role ON users (role);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY, farmer_id TEXT, category TEXT, name TEXT, data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS products_farmer ON products (farmer_id);
+CREATE INDEX IF NOT EXISTS products_category ON products (category);
+CREATE INDEX IF NOT EXISTS products_name ON products (name);
+
+CREATE TABLE IF NOT EXISTS discounted_items (
+    id INTEGER PRIMARY KEY, category TEXT, expiry_date TEXT, data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS discounted_items_expiry ON discounted_items (expiry_date);
+CREATE INDEX IF NOT EXISTS discounted_items_category ON discounted_items (category);
+
+CREATE TABLE IF NOT EXISTS ownership (user_id TEXT PRIMARY KEY, data BLOB NOT NULL);
+
+CREATE TABLE IF NOT EXISTS trees (
+    user_id TEXT NOT NULL, position INTEGER NOT NULL, tree_id TEXT, farmer_id TEXT, device_id TEXT,
+    phase TEXT, data BLOB NOT NULL, PRIMARY KEY (user_id, position)
+);
+CREATE INDEX IF NOT EXISTS trees_farmer ON trees (farmer_id);
+CREATE INDEX IF NOT EXISTS trees_device ON trees (device_id);
+
+CREATE TABLE IF NOT EXISTS orders (
+    farmer_id TEXT NOT NULL, position INTEGER NOT NULL, order_id INTEGER, status TEXT, created_at TEXT,
+    data BLOB NOT NULL, PRIMARY KEY (farmer_id, position)
+);
+CREATE INDEX IF NOT EXISTS orders_created ON orders (farmer_id, created_at);
+CREATE INDEX IF NOT EXISTS orders_farmer_order ON orders (farmer_id, order_id);
+
+CREATE TABLE IF NOT EXISTS iot_devices (
+    id TEXT PRIMARY KEY, farmer_id TEXT, assigned_user TEXT, status TEXT, data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS iot_devices_farmer ON iot_devices (farmer_id);
+CREATE INDEX IF NOT EXISTS iot_devices_assigned ON iot_devices (assigned_user);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    seq INTEGER PRIMARY KEY, stream TEXT NOT NULL, user_id TEXT NOT NULL, kind TEXT, product_name TEXT,
+    amount REAL, quantity INTEGER, date TEXT, data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_user ON transactions (stream, user_id, seq);
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date);
+
+CREATE TABLE IF NOT EXISTS search_postings (
+    tbl TEXT NOT NULL, gram TEXT NOT NULL, id NOT NULL, PRIMARY KEY (tbl, gram, id)
+) WITHOUT ROWID;
+"""
+
+
+def _range_filter(date_column, since, until, where, params):
+    """Add the conditions of an inclusive date range to a WHERE clause; rows without a date never match one."""
+    if since:
+        where.append(f"{date_column} >= ?")
+        params.append(since)
+    if until:
+        where.append(f"{date_column} <= ?")
+        params.append(until)
+    return where, params
+
+
+def _decode(table, data):
+    """Decode a stored record (or list element) of a table, unpacking records (see records.py)."""
+    return as_record(table, CODEC.decode(data))
+
+
+class SQLiteRecordStore:
+    """RecordStore interface over the SQLite schema; every call runs in the caller's open transaction."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, table, record_id, default=None):
+        """Return one record, or `default` if it does not exist."""
+        if table in LIST_TABLES:
+            key_column = LIST_TABLES[table][0]
+            rows = self.conn.execute(
+                f"SELECT data FROM {table} WHERE {key_column} = ? ORDER BY position", (record_id,)).fetchall()
+            return [_decode(table, data) for (data,) in rows] if rows else default
+
+        if table in ROW_TABLES:
+            row = self.conn.execute(
+                f"SELECT data FROM {table} WHERE {ROW_TABLES[table][0]} = ?", (record_id,)).fetchone()
+        else:
+            row = self.conn.execute("SELECT data FROM records WHERE tbl = ? AND id = ?", (table, record_id)).fetchone()
+        if row is None:
+            return default
+        record = _decode(table, row[0])
+        split = SPLIT_FIELDS.get(table)
+        if split and isinstance(record, dict):
+            field, split_table = split
+            record[field] = self.get(split_table, record_id, [])
+        return record
+
+    def put(self, table, record_id, record):
+        """Write one record."""
+        split = SPLIT_FIELDS.get(table)
+        if split and isinstance(record, dict) and split[0] in record:
+            field, split_table = split
+            record = dict(record)
+            self.put(split_table, record_id, record.pop(field))
+        record = as_record(table, record)
+        if table in SEARCH_FIELDS:
+            self._index_grams(table, record_id, self.get(table, record_id), record)
+
+        if table in LIST_TABLES:
+            self.conn.execute(f"DELETE FROM {table} WHERE {LIST_TABLES[table][0]} = ?", (record_id,))
+            self._insert_elements(table, record_id, record)
+        elif table in ROW_TABLES:
+            key_column, columns = ROW_TABLES[table]
+            indexed = index_values(table, record)
+            values = ([indexed.get(column, record.get(column)) for column in columns] if isinstance(record, Mapping)
+                      else [None] * len(columns))
+            self.conn.execute(
+                f"INSERT OR REPLACE INTO {table} ({', '.join((key_column,) + columns)}, data) "
+                f"VALUES ({', '.join('?' for _ in range(len(columns) + 2))})",
+                (record_id, *values, CODEC.encode(pack_record(table, record))),
+            )
+        else:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO records (tbl, id, data) VALUES (?, ?, ?)",
+                (table, record_id, CODEC.encode(pack_record(table, record))))
+
+    def _insert_elements(self, table, record_id, items, start=0):
+        key_column, columns = LIST_TABLES[table]
+        self.conn.executemany(
+            f"INSERT INTO {table} ({key_column}, position, {', '.join(c for c, _ in columns)}, data) "
+            f"VALUES (?, ?, {', '.join('?' for _ in columns)}, ?)",
+            [(record_id, position,
+              *(item.get(field) if isinstance(item, Mapping) else None for _, field in columns),
+              CODEC.encode(pack_record(table, item))) for position, item in enumerate(items, start)],
+        )
+
+    def extend(self, table, record_id, items):
+        """Append elements to a record list by inserting only their rows; returns the list's previous length."""
+        if table not in LIST_TABLES:
+            current = self.get(table, record_id, [])
+            self.put(table, record_id, current + list(items))
+            return len(current)
+        (start,) = self.conn.execute(
+            f"SELECT COALESCE(MAX(position) + 1, 0) FROM {table} WHERE {LIST_TABLES[table][0]} = ?",
+            (record_id,)).fetchone()
+        self._insert_elements(table, record_id, items, start)
+        return start
+
+    def truncate(self, table, record_id, length):
+        """Cut a record list back to its first `length` elements (undoes extend)."""
+        if table not in LIST_TABLES:
+            if length:
+                self.put(table, record_id, self.get(table, record_id, [])[:length])
+            else:
+                self.delete(table, record_id)
+            return
+        self.conn.execute(f"DELETE FROM {table} WHERE {LIST_TABLES[table][0]} = ? AND position >= ?",
+                          (record_id, length))
+
+    def put_many(self, table, records):
+        """Write many records of one table; they are committed together with the caller's transaction."""
+        for record_id, record in records.items():
+            self.put(table, record_id, record)
+
+    def delete(self, table, record_id):
+        """Remove one record (and any split-out fields)."""
+        if table in SEARCH_FIELDS:
+            self._index_grams(table, record_id, self.get(table, record_id), None)
+        if table in LIST_TABLES or table in ROW_TABLES:
+            key_column = (LIST_TABLES.get(table) or ROW_TABLES[table])[0]
+            self.conn.execute(f"DELETE FROM {table} WHERE {key_column} = ?", (record_id,))
+        else:
+            self.conn.execute("DELETE FROM records WHERE tbl = ? AND id = ?", (table, record_id))
+        split = SPLIT_FIELDS.get(table)
+        if split:
+            self.delete(split[1], record_id)
+
+    def ids(self, table):
+        """List the IDs of every record in a table."""
+        if table in LIST_TABLES:
+            key_column = LIST_TABLES[table][0]
+            query, params = f"SELECT DISTINCT {key_column} FROM {table}", ()
+        elif table in ROW_TABLES:
+            query, params = f"SELECT {ROW_TABLES[table][0]} FROM {table}", ()
+        else:
+            query, params = "SELECT id FROM records WHERE tbl = ?", (table,)
+        return [record_id for (record_id,) in self.conn.execute(query, params)]
+
+    def has_table(self, table):
+        """Check whether a table has at least one record."""
+        return bool(self.ids(table))
+
+    def load_table(self, table):
+        """Assemble a whole table as the legacy {record_id: record} dict with one query."""
+        if table in LIST_TABLES:
+            key_column = LIST_TABLES[table][0]
+            records = {}
+            for record_id, data in self.conn.execute(
+                    f"SELECT {key_column}, data FROM {table} ORDER BY {key_column}, position"):
+                records.setdefault(record_id, []).append(_decode(table, data))
+            return records
+
+        if table in ROW_TABLES:
+            rows = self.conn.execute(f"SELECT {ROW_TABLES[table][0]}, data FROM {table}")
+        else:
+            rows = self.conn.execute("SELECT id, data FROM records WHERE tbl = ?", (table,))
+        records = {record_id: _decode(table, data) for record_id, data in rows}
+
+        split = SPLIT_FIELDS.get(table)
+        if split:
+            field, split_table = split
+            nested = self.load_table(split_table)
+            for record_id, record in records.items():
+                if isinstance(record, dict):
+                    record[field] = nested.get(record_id, [])
+        return records
+
+    def save_table(self, table, records):
+        """Write back a whole table, touching only the records that changed."""
+        existing = self.load_table(table)
+        for record_id, record in records.items():
+            if existing.get(record_id) != record:
+                self.put(table, record_id, record)
+        for record_id in set(existing) - set(records):
+            self.delete(table, record_id)
+
+    def page(self, table, record_id, before=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Return one page of a record list (see PAGED_LISTS), newest first, with one indexed query.
+
+        :param before: Cursor returned with the previous page
+        :return: ([element, ...], cursor of the next page or None on the last one)
+        """
+        key_column = LIST_TABLES[table][0]
+        cursor_column, date_column = PAGED_LISTS[table]
+        where, params = _range_filter(date_column, since, until, [f"{key_column} = ?"], [record_id])
+        if before is not None:
+            where.append(f"{cursor_column} < ?")
+            params.append(before)
+        rows = self.conn.execute(
+            f"SELECT {cursor_column}, data FROM {table} WHERE {' AND '.join(where)} "
+            f"ORDER BY {cursor_column} DESC LIMIT ?", (*params, limit + 1)).fetchall()
+        return [_decode(table, data) for _, data in rows[:limit]], rows[limit - 1][0] if len(rows) > limit else None
+
+    def find(self, table, **fields):
+        """
+        Return {record_id: record} for the records whose indexed columns equal the given values.
+
+        :param fields: Column/value pairs, e.g. farmer_id="farmer1"; only indexed columns are accepted
+        """
+        key_column = ROW_TABLES[table][0]
+        where, values = self._where(table, fields)
+        rows = self.conn.execute(
+            f"SELECT {key_column}, data FROM {table} WHERE {where} ORDER BY {key_column}", values)
+        return {record_id: _decode(table, data) for record_id, data in rows}
+
+    def find_ids(self, table, **fields):
+        """Like find, but return only the sorted IDs of the matching records."""
+        key_column = ROW_TABLES[table][0]
+        where, values = self._where(table, fields)
+        rows = self.conn.execute(f"SELECT {key_column} FROM {table} WHERE {where} ORDER BY {key_column}", values)
+        return [record_id for (record_id,) in rows]
+
+    @staticmethod
+    def _where(table, fields):
+        """WHERE clause and parameters matching indexed columns to the given values."""
+        columns = ROW_TABLES[table][1]
+        unknown = set(fields) - set(columns)
+        if unknown:
+            raise ValueError(f"{table} has no indexed column {', '.join(sorted(unknown))}")
+        keys = INDEXED_FIELDS.get(table, {})
+        values = tuple(keys[field](value) if field in keys else value for field, value in fields.items())
+        return " AND ".join(f"{column} = ?" for column in fields) or "1", values
+
+    def _index_grams(self, table, record_id, old, new):
+        """Update the search postings of a record for the trigrams that changed."""
+        old_grams, new_grams = record_grams(table, old), record_grams(table, new)
+        self.conn.executemany(
+            "DELETE FROM search_postings WHERE tbl = ? AND gram = ? AND id = ?",
+            [(table, gram, record_id) for gram in old_grams - new_grams])
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO search_postings (tbl, gram, id) VALUES (?, ?, ?)",
+            [(table, gram, record_id) for gram in new_grams - old_grams])
+
+    def search(self, table, query, limit=SEARCH_LIMIT):
+        """Find records whose searched fields contain the query, tolerating typos (see search_index.rank)."""
+        grams = query_grams(query)
+        if not grams:
+            return []
+        rows = self.conn.execute(
+            f"SELECT id, COUNT(*) FROM search_postings WHERE tbl = ? AND gram IN ({', '.join('?' for _ in grams)}) "
+            "GROUP BY id", (table, *grams))
+        return rank(table, query, dict(rows), lambda record_id: self.get(table, record_id), limit)
+
+    def rebuild_indexes(self):
+        """Recompute the indexed columns and search postings of every record."""
+        for table in set(INDEXED_FIELDS) | set(SEARCH_FIELDS):
+            self.conn.execute("DELETE FROM search_postings WHERE tbl = ?", (table,))
+            for record_id, record in self.load_table(table).items():
+                self.put(table, record_id, record)
+                if table in SEARCH_FIELDS:
+                    self._index_grams(table, record_id, None, record)
+
+    def get_meta(self, key, default=None):
+        """Read a store-level marker such as a schema version."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return CODEC.decode(row[0]) if row else default
+
+    def set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, CODEC.encode(value)))
+
+
+class SQLiteJournal:
+    """
+    TransactionJournal interface over the `transactions` table.
+
+    Appends join the caller's open write transaction, so a checkout's records and its
+    transaction rows are committed together.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def append(self, kind, user_id, record):
+        """Append one event and return its sequence number."""
+        return self.append_many([(kind, user_id, record)])[0]
+
+    def append_many(self, entries):
+        """
+        Append several events in one statement batch.
+
+        :param entries: Iterable of (kind, user_id, record) with kind "purchase", "redemption", "refund" or "return"
+        :return: Sequence numbers of the new events
+        """
+        seqs = []
+        with self.backend.writing() as store:
+            for kind, user_id, record in entries:
+                cursor = store.conn.execute(
+                    "INSERT INTO transactions (stream, user_id, kind, product_name, amount, quantity, date, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (STREAM_OF_KIND[kind], user_id, kind, record.get("product_name"), record.get("amount"),
+                     record.get("quantity"), record.get("date"), CODEC.encode(record)),
+                )
+                seqs.append(cursor.lastrowid)
+        return seqs
+
+    def update(self, stream, user_id, target_seq, changes):
+        """Apply a change (e.g. a return's new status) to an earlier event in place."""
+        with self.backend.writing() as store:
+            row = store.conn.execute(
+                "SELECT data FROM transactions WHERE seq = ? AND stream = ? AND user_id = ?",
+                (target_seq, stream, user_id)).fetchone()
+            if row is not None:
+                record = CODEC.decode(row[0])
+                record.update(changes)
+                store.conn.execute("UPDATE transactions SET data = ? WHERE seq = ?", (CODEC.encode(record), target_seq))
+        return target_seq
+
+    def read(self, stream, user_id):
+        """Return a user's events in order as [(seq, record), ...]."""
+        with self.backend.reading() as store:
+            rows = store.conn.execute(
+                "SELECT seq, data FROM transactions WHERE stream = ? AND user_id = ? ORDER BY seq", (stream, user_id))
+            return [(seq, CODEC.decode(data)) for seq, data in rows]
+
+    def records(self, stream, user_id):
+        """Return a user's event records in order."""
+        return [record for _, record in self.read(stream, user_id)]
+
+    def page(self, stream, user_id, before=None, limit=PAGE_SIZE, since=None, until=None):
+        """
+        Return one page of a user's events, newest first, as [(seq, record), ...] and the next cursor.
+
+        See TransactionJournal.page; the (stream, user_id, seq) index serves the query.
+        """
+        where, params = _range_filter("date", since, until, ["stream = ?", "user_id = ?"], [stream, user_id])
+        if before is not None:
+            where.append("seq < ?")
+            params.append(before)
+        with self.backend.reading() as store:
+            rows = store.conn.execute(
+                f"SELECT seq, data FROM transactions WHERE {' AND '.join(where)} ORDER BY seq DESC LIMIT ?",
+                (*params, limit + 1)).fetchall()
+        events = [(seq, CODEC.decode(data)) for seq, data in rows[:limit]]
+        return events, rows[limit - 1][0] if len(rows) > limit else None
+
+    def users(self, stream):
+        """List every user with at least one event in a stream."""
+        with self.backend.reading() as store:
+            return [user_id for (user_id,) in store.conn.execute(
+                "SELECT DISTINCT user_id FROM transactions WHERE stream = ?", (stream,))]
+
+    def extract(self, stream, before, select=None, sink=None):
+        """
+        Move a stream's events dated before `before` out of the table; see TransactionJournal.extract.
+
+        The newest row of the table always stays: SQLite would hand its seq out again once deleted.
+        """
+        with self.backend.writing() as store:
+            rows = store.conn.execute(
+                "SELECT seq, user_id, data FROM transactions WHERE stream = ? AND date > '' AND date < ? "
+                "AND seq < (SELECT MAX(seq) FROM transactions) ORDER BY seq", (stream, before)).fetchall()
+            moved = [(user_id, seq, record) for seq, user_id, record in
+                     ((seq, user_id, CODEC.decode(data)) for seq, user_id, data in rows)
+                     if select is None or select(record)]
+            if moved:
+                if sink is not None:
+                    sink(moved)
+                store.conn.executemany("DELETE FROM transactions WHERE seq = ?", [(seq,) for _, seq, _ in moved])
+        return len(moved)
+
+    def compact(self):
+        """Nothing to merge: rows are updated in place. Kept for interface parity."""
+        return 0
+
+
+class SQLiteBackend:
+    """
+    Storage backend on a SQLite database from the standard library.
+
+    Each thread gets its own connection in WAL mode, so readers never block each other or the
+    writer. The outermost `writing()` block of a thread is one `BEGIN IMMEDIATE` transaction that
+    commits on exit and rolls back if the block raises; nested blocks join it.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.journal = SQLiteJournal(self)
+        self._local = threading.local()
+        self._guard = threading.Lock()
+        self._schema_ready = False
+        self.connections = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.depth, self._local.write = conn, 0, False
+            with self._guard:
+                self.connections += 1
+                if not self._schema_ready:
+                    conn.executescript(SCHEMA)
+                    self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def _transaction(self, write):
+        conn = self._connection()
+        local = self._local
+        if local.depth == 0:
+            conn.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            local.write = write
+        elif write and not local.write:
+            raise RuntimeError("Cannot write inside a read-only block.")
+
+        local.depth += 1
+        try:
+            yield SQLiteRecordStore(conn)
+        except BaseException:
+            local.depth -= 1
+            if local.depth == 0:
+                conn.execute("ROLLBACK")
+                self.rollbacks += 1
+            raise
+        local.depth -= 1
+        if local.depth == 0:
+            conn.execute("COMMIT")
+            self.commits += 1
+
+    def reading(self):
+        """Yield a store inside a read transaction (a consistent snapshot under WAL)."""
+        return self._transaction(write=False)
+
+    def writing(self):
+        """Yield a store inside the thread's write transaction."""
+        return self._transaction(write=True)
+
+    def migrate(self):
+        """Create any missing tables and indexes."""
+        self._connection()
+
+    def space_report(self, top=10):
+        """Report free pages in the database file and the stored bytes per record."""
+        with self.reading() as store:
+            conn = store.conn
+            page_size, pages, free_pages = (
+                conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in ("page_size", "page_count", "freelist_count"))
+            sizes = {}
+            for table, (key_column, _) in ROW_TABLES.items():
+                for record_id, size in conn.execute(f"SELECT {key_column}, length(data) FROM {table}"):
+                    sizes[record_key(table, record_id)] = size
+            for table, (key_column, _) in LIST_TABLES.items():
+                for record_id, size in conn.execute(
+                        f"SELECT {key_column}, SUM(length(data)) FROM {table} GROUP BY {key_column}"):
+                    sizes[record_key(table, record_id)] = size
+            for table, record_id, size in conn.execute("SELECT tbl, id, length(data) FROM records"):
+                sizes[record_key(table, record_id)] = size
+        # Pages in use hold the records plus SQLite's own overhead (indexes, journal, free space in pages).
+        return space_summary(sizes, pages * page_size, (pages - free_pages) * page_size, top)
+
+    def compact(self):
+        """
+        VACUUM the database into a fresh file and truncate the WAL.
+
+        Readers keep their WAL snapshots while it runs; writers wait for it.
+
+        :return: (file bytes before, after)
+        """
+        before = os.path.getsize(self.db_name)
+        conn = self._connection()
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return before, os.path.getsize(self.db_name)
+
+    def backup(self, out_path):
+        """
+        Copy the database to `out_path` with SQLite's online backup API.
+
+        The copy runs in one read transaction: under WAL it sees a consistent snapshot while
+        writers keep committing.
+
+        :return: Dict with the bytes copied, seconds taken and throughput
+        """
+        started = time.perf_counter()
+        target = sqlite3.connect(out_path)
+        try:
+            self._connection().backup(target)
+        finally:
+            target.close()
+        seconds = time.perf_counter() - started
+        size = os.path.getsize(out_path)
+        return {
+            "bytes": size,
+            "seconds": round(seconds, 3),
+            "mb_per_second": round(size / 1e6 / seconds, 2) if seconds else 0.0,
+        }
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "connections": self.connections,
+            "commits": self.commits,
+            "rollbacks": self.rollbacks,
+        }
+
+
+# Markers of migrations whose results import_shelve copies over. The layout, index and journal
+# markers describe shelve structures and are not copied; SQLite builds its own.
+IMPORTED_META_KEYS = (CATALOG_VERSION_KEY, OWNERSHIP_VERSION_KEY, RECORDS_VERSION_KEY, SEQUENCES_VERSION_KEY)
+
+
+def import_shelve(shelve_path, sqlite_path):
+    """
+    Copy a shelve database (either layout) and its transaction journal into a SQLite database.
+
+    The ID sequences come along and are then moved past every imported ID (see repair_sequences),
+    so records added afterwards never reuse an imported ID. The shelve file is opened read-only
+    and left untouched.
+
+    :param shelve_path: Path of the shelve database, without the .dat/.dir suffix
+    :param sqlite_path: Path of the SQLite database to fill; existing records with the same IDs are replaced
+    :return: Number of records and events imported
+    """
+    backend = backend_for(sqlite_path)
+    imported = 0
+    events = []  # (seq, kind, user_id, record)
+    meta = {}
+    with backend.writing() as target, shelve.open(shelve_path, flag="r") as shelf:
+        for key in shelf.keys():
+            parsed = parse_record_key(key)
+            data = shelf.dict[key.encode(shelf.keyencoding)]
+            value = _decode(parsed[0], data) if parsed else CODEC.decode(data)  # Records are stored packed
+            if parsed:
+                tables = {parsed[0]: {parsed[1]: value}}
+            elif key in RECORD_TABLES and isinstance(value, dict):
+                tables = {key: value}  # Legacy whole-table layout
+            else:
+                if key.startswith(SEQUENCE_PREFIX + KEY_SEPARATOR) or key in IMPORTED_META_KEYS:
+                    meta[key] = value
+                continue
+
+            for table, records in tables.items():
+                for record_id, record in records.items():
+                    if table in ("transactions", "return_transactions"):
+                        for entry in record:
+                            kind = "return" if table == "return_transactions" else entry.get(
+                                "type", "purchase" if entry.get("amount") else "redemption")
+                            events.append((0, kind, record_id, entry))
+                        continue
+                    if table == "products":
+                        record = normalize_product(record)
+                    elif table == "discounted_items":
+                        record = normalize_discounted_item(record)
+                    target.put(table, record_id, record)
+                    imported += 1
+
+        if os.path.isdir(os.path.abspath(shelve_path) + JOURNAL_SUFFIX):
+            journal = journal_for(shelve_path)
+            for stream in (TRANSACTIONS, RETURNS):
+                for user_id in journal.users(stream):
+                    for seq, record in journal.read(stream, user_id):
+                        kind = "return" if stream == RETURNS else record.get(
+                            "type", "purchase" if record.get("amount") else "redemption")
+                        events.append((seq, kind, user_id, record))
+
+        events.sort(key=lambda event: event[0])  # Keep the original order of the journal
+        for _, kind, user_id, record in events:
+            if kind != "return":
+                record = dict(record, type=kind)
+            backend.journal.append(kind, user_id, record)
+        imported += len(events)
+
+        for key, value in meta.items():
+            target.set_meta(key, max(target.get_meta(key, 0), value))  # Never move a sequence back
+        repaired = repair_sequences(target)
+        if repaired:
+            print(f"Moved ID sequences past the imported records: {repaired}")
+
+    print(f"Imported {imported} records and events into {sqlite_path}.")
+    return imported